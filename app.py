@@ -1,11 +1,32 @@
 ﻿import os
 import json
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import time
+import hashlib
+import hmac
+import random
+import logging
+import queue
+import tempfile
+import threading
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, g
+from markupsafe import Markup
 from werkzeug.security import check_password_hash, generate_password_hash
-import requests
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from cities import ALL_CITIES
+from weather_cache import WeatherCache, LocalBackend, make_backend, coord_key, snap_to_grid, COORD_PRECISION, MISSING
+from refresher import Snapshot, Refresher
+from stream import UpdateHub, format_event
+from user_store import make_user_store
+from city_index import CityIndex
+from catalogue import CataloguePack, MANIFEST, build as build_catalogue_pack, source_hash as catalogue_source_hash
+from archive_store import ArchiveStore, ARCHIVE_VARIABLES, missing_ranges, split_range, settled_before
+from upstream import UpstreamClient, UpstreamError, CircuitOpenError
+from metrics import Registry
+from recommendations import RecommendationEngine
+from series import Series
+from session_store import ServerSessionInterface
 
 try:
     from zoneinfo import ZoneInfo
@@ -49,223 +70,421 @@ def day_of_week_filter(date_str):
     except ValueError:
         return ""
 
-def load_users():
-    if not os.path.exists("users.json"):
-        return {}
-    with open("users.json", "r") as f:
-        return json.load(f)
-
-def save_users(users):
-    with open("users.json", "w") as f:
-        json.dump(users, f, indent=4)
-
-USERS = load_users()
-
 # Default settings for new users
 USER_DEFAULTS = {
     "selected_cities": [c for c in ALL_CITIES if c['name'] in ['New York', 'London', 'Paris', 'Tokyo', 'Sydney', 'Dubai']],
     "units": "celsius" # Default unit for new users
 }
 
+# Users live in SQLite by default; an existing users.json is imported once
+USER_STORE = make_user_store(os.getenv("USER_STORE_URL", "sqlite:///users.db"), USER_DEFAULTS,
+                             legacy_json_path=os.getenv("USERS_JSON_PATH", "users.json"))
+
+# Dashboard cities are referred to by id in sessions and looked up here
+CITIES_BY_ID = {c["id"]: c for c in ALL_CITIES}
+
+# Sessions are kept server-side; the cookie only holds their id. With
+# several workers or replicas SESSION_URL must point at a shared Redis.
+app.session_interface = ServerSessionInterface(
+    make_backend(os.getenv("SESSION_URL"), int(os.getenv("SESSION_MAX_BYTES", str(16 * 1024 * 1024))), prefix="session:"),
+    lifetime=int(os.getenv("SESSION_LIFETIME", str(7 * 86400))),
+)
+
+
+def session_cities():
+    # The logged-in user's dashboard cities, in order
+    return [CITIES_BY_ID[i] for i in session.get("city_ids", []) if i in CITIES_BY_ID]
+
+
+def start_session(username, user_data):
+    session.regenerate()
+    session["user"] = username
+    session["city_ids"] = [c["id"] for c in user_data["selected_cities"]]
+    session["units"] = user_data["units"]
+
 
 @app.template_filter('weather_icon')
 def weather_icon_filter(weather_code):
     return WEATHER_ICONS.get(weather_code, "fa-question-circle")
 
 
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
-OPEN_METEO_AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
-OPENWEATHERMAP_URL = "https://api.openweathermap.org/data/3.0/onecall"
+SOURCE_LABELS = {"weather": "current weather", "forecast": "forecast", "air_quality": "air quality", "alerts": "alerts"}
 
 
-def get_weather_alerts(lat, lon):
-    alerts = []
+@app.template_filter('staleness_note')
+def staleness_note_filter(city):
+    # Same wording as stalenessNote() in static/app.js
+    def label(sources):
+        return ", ".join(SOURCE_LABELS.get(s, s) for s in sources)
+    notes = []
+    if city.get("stale"):
+        notes.append(f"older data: {label(city['stale'])}")
+    if city.get("missing"):
+        notes.append(f"unavailable: {label(city['missing'])}")
+    return f" · {'; '.join(notes)}" if notes else ""
+
+
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+OPEN_METEO_AIR_QUALITY_URL = os.getenv("OPEN_METEO_AIR_QUALITY_URL", "https://air-quality-api.open-meteo.com/v1/air-quality")
+OPEN_METEO_ARCHIVE_URL = os.getenv("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/era5")
+OPENWEATHERMAP_URL = os.getenv("OPENWEATHERMAP_URL", "https://api.openweathermap.org/data/3.0/onecall")
+REVERSE_GEOCODE_URL = os.getenv("REVERSE_GEOCODE_URL", "https://api.bigdatacloud.net/data/reverse-geocode-client")
+
+# Upstream calls for a page are fanned out over a shared, bounded pool and
+# the whole page gets one deadline; slow cities come back partial.
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "32"))
+PAGE_DEADLINE = float(os.getenv("PAGE_DEADLINE", "8"))
+FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="upstream")
+# Locations per multi-location Open-Meteo request
+BATCH_SIZE = int(os.getenv("OPEN_METEO_BATCH_SIZE", "50"))
+
+
+# Prometheus metrics, served at /metrics
+METRICS = Registry()
+REQUEST_LATENCY = METRICS.histogram("http_request_duration_seconds", "Time spent handling requests",
+                                    ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = METRICS.gauge("http_requests_in_flight", "Requests currently being handled")
+REQUEST_ERRORS = METRICS.counter("http_request_errors_total", "Requests that raised or returned 5xx", ("route",))
+UPSTREAM_LATENCY = METRICS.histogram("upstream_request_duration_seconds", "Time spent on upstream API calls",
+                                     ("upstream", "outcome"))
+
+
+def observe_upstream(name, seconds, failed):
+    UPSTREAM_LATENCY.observe(seconds, upstream=name, outcome="error" if failed else "ok")
+
+
+# Upstream payloads and per-city results are only logged in debug mode, for
+# a PAYLOAD_LOG_SAMPLE fraction of calls, and are not formatted otherwise
+PAYLOAD_LOG_SAMPLE = float(os.getenv("PAYLOAD_LOG_SAMPLE", "0"))
+
+
+def log_payload(label, payload):
+    if PAYLOAD_LOG_SAMPLE > 0 and app.logger.isEnabledFor(logging.DEBUG) and random.random() < PAYLOAD_LOG_SAMPLE:
+        app.logger.debug(f"{label}: {payload}")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+@app.after_request
+def record_request_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request(exc):
+    if "request_started" not in g:
+        return
+    REQUESTS_IN_FLIGHT.dec()
+    # Label by URL rule, not path, so ids in the URL can't blow up the series
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    status = 500 if exc is not None else g.get("response_status", 500)
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, route=route, method=request.method, status=status)
+    if status >= 500:
+        REQUEST_ERRORS.inc(route=route)
+
+
+# One pooled, retrying client with a circuit breaker per upstream
+UPSTREAM = UpstreamClient(
+    pool_size=FETCH_WORKERS,
+    retries=int(os.getenv("UPSTREAM_RETRIES", "2")),
+    backoff=float(os.getenv("UPSTREAM_BACKOFF", "0.3")),
+    failure_threshold=int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("UPSTREAM_BREAKER_RESET", "30")),
+    observer=observe_upstream,
+    async_pool_size=int(os.getenv("UPSTREAM_ASYNC_CONNECTIONS", "256")),
+)
+
+# Upstream responses are cached per data type; see weather_cache.py
+CACHE_TTLS = {
+    "current": int(os.getenv("CACHE_TTL_CURRENT", "300")),
+    "daily": int(os.getenv("CACHE_TTL_DAILY", "3600")),
+    "aqi": int(os.getenv("CACHE_TTL_AQI", "3600")),
+    "alerts": int(os.getenv("CACHE_TTL_ALERTS", "600")),
+    "place": int(os.getenv("CACHE_TTL_PLACE", str(7 * 86400))),
+}
+# Expired entries are served at once and reloaded in the background on FETCH_POOL
+CACHE = WeatherCache(
+    make_backend(os.getenv("CACHE_URL"), int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))),
+    CACHE_TTLS,
+    stale_ttl=int(os.getenv("CACHE_STALE_TTL", str(6 * 3600))),
+    background=FETCH_POOL,
+)
+
+
+# Requests are built and responses read by functions shared with the async
+# entry point (asgi.py), which sends them with UPSTREAM.aget instead; only
+# status_code, text and json() are used, which requests and httpx share.
+def open_meteo_params(coords, params):
+    # Open-Meteo takes comma-separated coordinate lists
+    return dict(params,
+                latitude=",".join(str(lat) for lat, _ in coords),
+                longitude=",".join(str(lon) for _, lon in coords))
+
+
+def read_open_meteo_batch(resp, coords, api_name):
+    # One result per location (a bare object when there is only one)
+    if resp.status_code >= 400:
+        app.logger.error(f"Response content: {resp.text}")
+        raise UpstreamError(f"{api_name} request failed with status code: {resp.status_code}")
+    data = resp.json()
+    log_payload(f"{api_name} response JSON", data)
+    if isinstance(data, dict):
+        data = [data]
+    if len(data) != len(coords):
+        raise UpstreamError(f"{api_name} returned {len(data)} results for {len(coords)} locations")
+    return data
+
+
+def fetch_open_meteo_batch(upstream, url, coords, params, api_name="Open-Meteo API"):
+    app.logger.debug(f"Requesting {api_name} for {len(coords)} location(s)")
+    resp = UPSTREAM.get(upstream, url, params=open_meteo_params(coords, params), timeout=5)
+    return read_open_meteo_batch(resp, coords, api_name)
+
+
+def batch_loader(fetch_batch, coords_by_key, *args):
+    # Adapts a fetch_*_batch function to WeatherCache.load_many
+    def load(keys):
+        try:
+            return dict(zip(keys, fetch_batch([coords_by_key[k] for k in keys], *args)))
+        except Exception as e:
+            app.logger.error(f"An error occurred in {fetch_batch.__name__}: {e}", exc_info=True)
+            return {}
+    return load
+
+
+def alerts_params(lat, lon):
+    return {
+        "lat": lat,
+        "lon": lon,
+        "appid": OPENWEATHERMAP_API_KEY,
+        "exclude": "current,minutely,hourly,daily" # Only request alerts
+    }
+
+
+def read_weather_alerts(owm_resp):
+    if owm_resp.status_code >= 400:
+        raise UpstreamError(f"OpenWeatherMap Alerts API request failed with status code: {owm_resp.status_code}")
+    owm_json = owm_resp.json()
+    log_payload("OpenWeatherMap Alerts API response JSON", owm_json)
+    return owm_json.get("alerts", [])
+
+
+def fetch_weather_alerts(lat, lon):
+    return read_weather_alerts(UPSTREAM.get("alerts", OPENWEATHERMAP_URL, params=alerts_params(lat, lon), timeout=5))
+
+
+def load_weather_alerts(lat, lon, revalidate=True):
+    # (alerts, stale); alerts is None when they couldn't be loaded, which
+    # an empty list (no alerts) can't say
     if not OPENWEATHERMAP_API_KEY:
         app.logger.warning("OPENWEATHERMAP_API_KEY is not set. Skipping weather alerts.")
-        return alerts
+        return [], False
     try:
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": OPENWEATHERMAP_API_KEY,
-            "exclude": "current,minutely,hourly,daily" # Only request alerts
-        }
-        app.logger.info(f"Requesting OpenWeatherMap Alerts API with params: {params}")
-        owm_resp = requests.get(OPENWEATHERMAP_URL, params=params, timeout=5)
-        app.logger.info(f"OpenWeatherMap Alerts API response status: {owm_resp.status_code}")
-        if owm_resp.ok:
-            owm_json = owm_resp.json()
-            app.logger.info(f"OpenWeatherMap Alerts API response JSON: {owm_json}")
-            alerts = owm_json.get("alerts", [])
+        return CACHE.load("alerts", coord_key(lat, lon), lambda: fetch_weather_alerts(lat, lon), revalidate)
     except Exception as e:
         app.logger.error(f"An error occurred in get_weather_alerts: {e}", exc_info=True)
-    return alerts
+        return None, False
+
+
+def get_weather_alerts(lat, lon):
+    return load_weather_alerts(lat, lon)[0] or []
+
+
+AIR_QUALITY_FIELDS = {name: name for name in ("european_aqi", "pm10", "pm2_5", "pollen_grass", "pollen_tree", "pollen_weed")}
+
+
+AIR_QUALITY_PARAMS = {
+    "hourly": ",".join(AIR_QUALITY_FIELDS.values()),
+    "forecast_days": 1,
+    "timezone": "UTC"
+}
+
+
+def parse_air_quality(aq_json):
+    return Series.from_open_meteo(aq_json.get("hourly", {}), AIR_QUALITY_FIELDS)
+
+
+def fetch_air_quality_batch(coords):
+    return [parse_air_quality(aq_json) for aq_json in fetch_open_meteo_batch(
+        "air_quality", OPEN_METEO_AIR_QUALITY_URL, coords, AIR_QUALITY_PARAMS, "Open-Meteo Air Quality API")]
+
+
+def air_quality_keys(coords, now):
+    # The whole UTC day is cached as a Series, so the current hour is sliced on every read
+    return [f"{now.date().isoformat()}:{coord_key(lat, lon)}" for lat, lon in coords]
+
+
+def get_air_quality_many(coords, revalidate=True):
+    now = datetime.utcnow()
+    keys = air_quality_keys(coords, now)
+    hourly, stale = CACHE.load_many("aqi", keys, batch_loader(fetch_air_quality_batch, dict(zip(keys, coords))), revalidate)
+    return [hourly[key].at(now) if key in hourly else None for key in keys], [key in stale for key in keys]
 
 
 def get_air_quality_data(lat, lon):
-    air_quality = None
-    try:
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "hourly": "european_aqi,pm10,pm2_5,pollen_grass,pollen_tree,pollen_weed",
-            "forecast_days": 1,
-            "timezone": "UTC"
-        }
-        app.logger.info(f"Requesting Open-Meteo Air Quality API with params: {params}")
-        aq_resp = requests.get(OPEN_METEO_AIR_QUALITY_URL, params=params, timeout=5)
-        app.logger.info(f"Open-Meteo Air Quality API response status: {aq_resp.status_code}")
-        if aq_resp.ok:
-            aq_json = aq_resp.json()
-            app.logger.info(f"Open-Meteo Air Quality API response JSON: {aq_json}")
-            current_hour = datetime.utcnow().hour
-            
-            hourly_data = aq_json.get("hourly", {})
-            if hourly_data and hourly_data.get("time") and len(hourly_data["time"]) > current_hour:
-                air_quality = {
-                    "european_aqi": hourly_data["european_aqi"][current_hour],
-                    "pm10": hourly_data["pm10"][current_hour],
-                    "pm2_5": hourly_data["pm2_5"][current_hour],
-                    "pollen_grass": hourly_data["pollen_grass"][current_hour],
-                    "pollen_tree": hourly_data["pollen_tree"][current_hour],
-                    "pollen_weed": hourly_data["pollen_weed"][current_hour],
-                }
-    except Exception as e:
-        app.logger.error(f"An error occurred in get_air_quality_data: {e}", exc_info=True)
-    return air_quality
+    return get_air_quality_many([(lat, lon)])[0][0]
 
 
-def get_outfit_recommendation(temperature, weather_code, unit):
-    if temperature is None or weather_code is None:
-        return "N/A"
+# Recommendation rules are data (RECOMMENDATION_RULES, a JSON file), compiled
+# once into lookup tables; the evaluation works in Celsius
+RECOMMENDATIONS = RecommendationEngine.from_file(
+    os.getenv("RECOMMENDATION_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.json")))
 
-    if unit == "fahrenheit":
-        # Convert to Celsius for consistent logic
-        temperature_c = (temperature - 32) * 5/9
-    else:
-        temperature_c = temperature
-
-    if weather_code in [95]: # Thunderstorm
-        return "Stay indoors or wear waterproof gear!"
-    elif weather_code in [51, 53, 55, 61, 63, 65, 80, 81, 82]: # Drizzle, Rain showers
-        return "Don't forget your umbrella and a waterproof jacket!"
-    elif temperature_c < 0:
-        return "Bundle up! Heavy coat, hat, gloves, and warm boots."
-    elif 0 <= temperature_c < 10:
-        return "Warm jacket, sweater, and long pants."
-    elif 10 <= temperature_c < 20:
-        return "Light jacket or sweater, long-sleeved shirt."
-    elif 20 <= temperature_c < 25:
-        return "T-shirt and shorts/light pants. Maybe a light cover-up."
-    else: # temperature_c >= 25
-        return "Light clothing, like shorts and a t-shirt. Stay cool!"
 
-def get_activity_recommendation(temperature, weather_code, unit):
-    if temperature is None or weather_code is None:
-        return "N/A"
+def _celsius(temperature, unit):
+    if temperature is not None and unit == "fahrenheit":
+        return (temperature - 32) * 5/9
+    return temperature
 
-    if unit == "fahrenheit":
-        temperature_c = (temperature - 32) * 5/9
-    else:
-        temperature_c = temperature
-    
-    # Rainy/Stormy
-    if weather_code in [51, 53, 55, 61, 63, 65, 80, 81, 82, 95]:
-        return "Great day for indoor activities: read a book, watch a movie, or visit a museum!"
-    # Cold weather
-    elif temperature_c < 5:
-        return "Consider indoor sports, hot yoga, or a cozy cafe visit."
-    # Cool/Mild weather
-    elif 5 <= temperature_c < 18:
-        return "Perfect weather for a walk, hiking, or cycling!"
-    # Warm weather
-    elif 18 <= temperature_c < 28:
-        return "Enjoy outdoor activities like picnics, swimming, or park visits!"
-    # Hot weather
-    else: # temperature_c >= 28
-        return "Head to the beach, go for a swim, or enjoy some ice cream!"
+
+def get_outfit_recommendation(temperature, weather_code, unit):
+    return RECOMMENDATIONS.evaluate("outfit", (weather_code,), (_celsius(temperature, unit),))[0]
+
+def get_activity_recommendation(temperature, weather_code, unit):
+    return RECOMMENDATIONS.evaluate("activity", (weather_code,), (_celsius(temperature, unit),))[0]
 
 def get_weather_tip(weather_code, unit):
-    if weather_code is None:
-        return "N/A"
-    
-    if weather_code in [95]: # Thunderstorm
-        return "Seek shelter immediately during a thunderstorm!"
-    elif weather_code in [51, 53, 55, 61, 63, 65, 80, 81, 82]: # Drizzle, Rain showers
-        return "Drive safely in wet conditions. Reduce speed and increase following distance."
-    elif weather_code in [45, 48]: # Fog
-        return "Visibility is low due to fog. Drive carefully and use fog lights."
-    else:
-        return "Check the forecast regularly and stay informed!"
+    return RECOMMENDATIONS.evaluate("tip", (weather_code,), (None,))[0]
 
 
-def get_city_data(city, unit="celsius"):
-    app.logger.info(f"Fetching data for city: {city['name']}, unit: {unit}")
-    lat = city["lat"]
-    lon = city["lon"]
-    tz = city.get('tz', 'UTC')
-    weather = None
-    time_str = None
-    forecast = []
-    air_quality = get_air_quality_data(lat, lon) # Fetch air quality data
-    alerts = get_weather_alerts(lat, lon) # Fetch weather alerts
-    
-    outfit_recommendation = None
-    activity_recommendation = None
+def add_recommendations(results):
+    # One pass over the current conditions and every forecast day of every
+    # result. Forecast days are judged on the midpoint of their max and min.
+    codes, temperatures, targets = [], [], []
+    for result in results:
+        weather = result.get("weather") or {}
+        codes.append(weather.get("weather_code"))
+        temperatures.append(weather.get("temperature"))
+        targets.append(result)
+        for day in result.get("forecast") or []:
+            codes.append(day.get("weathercode"))
+            high, low = day.get("temp_max"), day.get("temp_min")
+            temperatures.append((high + low) / 2 if high is not None and low is not None else None)
+            targets.append(day)
+    for target, (outfit, activity, tip) in zip(targets, RECOMMENDATIONS.evaluate_all(codes, temperatures)):
+        target["outfit_recommendation"] = outfit
+        target["activity_recommendation"] = activity
+        target["weather_tip"] = tip
+    return results
 
-    try:
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "current": "temperature_2m,weather_code,windspeed_10m,winddirection_10m,dewpoint_2m,visibility",
-            "daily": "weathercode,temperature_2m_max,temperature_2m_min,uv_index_max",
-            "forecast_days": 6,
-            "timezone": "UTC",
-            "temperature_unit": unit
-        }
-        app.logger.info(f"Requesting Open-Meteo API with params: {params}")
-        wresp = requests.get(OPEN_METEO_URL, params=params, timeout=5)
-        app.logger.info(f"Open-Meteo API response status: {wresp.status_code}")
-        if wresp.ok:
-            wj = wresp.json()
-            app.logger.info(f"Open-Meteo API response JSON: {wj}")
-            cw = wj.get("current", {})
-            
-            # Get outfit recommendation
-            current_temperature = cw.get("temperature_2m")
-            current_weather_code = cw.get("weather_code")
-            outfit_recommendation = get_outfit_recommendation(current_temperature, current_weather_code, unit)
-            activity_recommendation = get_activity_recommendation(current_temperature, current_weather_code, unit)
-            weather_tip = get_weather_tip(current_weather_code, unit)
-            
-            weather = {
-                "temperature": current_temperature,
-                "windspeed": cw.get("windspeed_10m"),
-                "winddirection": cw.get("winddirection_10m"),
-                "dewpoint": cw.get("dewpoint_2m"),
-                "visibility": cw.get("visibility"),
-                "weather_code": current_weather_code,
-            }            
-            daily_data = wj.get("daily", {})
-            if daily_data:
-                for i in range(1, 6): # 5-day forecast
-                    forecast.append({
-                        "date": daily_data["time"][i],
-                        "weathercode": daily_data["weathercode"][i],
-                        "temp_max": daily_data["temperature_2m_max"][i],
-                        "temp_min": daily_data["temperature_2m_min"][i],
-                        "uv_index": daily_data["uv_index_max"][i],
-                    })
-        else:
-            app.logger.error(f"Open-Meteo API request failed with status code: {wresp.status_code}")
-            app.logger.error(f"Response content: {wresp.text}")
 
+def parse_current_weather(wj):
+    cw = wj.get("current", {})
+    return {
+        "temperature": cw.get("temperature_2m"),
+        "windspeed": cw.get("windspeed_10m"),
+        "winddirection": cw.get("winddirection_10m"),
+        "dewpoint": cw.get("dewpoint_2m"),
+        "visibility": cw.get("visibility"),
+        "weather_code": cw.get("weather_code"),
+    }
 
-    except Exception as e:
-        app.logger.error(f"An error occurred in get_city_data: {e}", exc_info=True)
-        weather = None
-        forecast = []
 
+DAILY_FIELDS = {
+    "weathercode": "weathercode",
+    "temp_max": "temperature_2m_max",
+    "temp_min": "temperature_2m_min",
+    "uv_index": "uv_index_max",
+}
+FORECAST_DAYS = 5
+
+
+def parse_daily_forecast(wj):
+    return Series.from_open_meteo(wj.get("daily", {}), DAILY_FIELDS, time_key="date", time_format="%Y-%m-%d")
+
+
+CURRENT_PARAMS = {
+    "current": "temperature_2m,weather_code,windspeed_10m,winddirection_10m,dewpoint_2m,visibility",
+    "timezone": "UTC"
+}
+DAILY_PARAMS = {
+    "daily": ",".join(DAILY_FIELDS.values()),
+    "forecast_days": FORECAST_DAYS + 1,
+    "timezone": "UTC"
+}
+
+
+def fetch_current_weather_batch(coords):
+    return [parse_current_weather(wj) for wj in fetch_open_meteo_batch("forecast", OPEN_METEO_URL, coords, CURRENT_PARAMS)]
+
+
+def fetch_daily_forecast_batch(coords):
+    return [parse_daily_forecast(wj) for wj in fetch_open_meteo_batch("forecast", OPEN_METEO_URL, coords, DAILY_PARAMS)]
+
+
+# Weather is fetched, cached and stored in Celsius only; Fahrenheit is
+# applied when a result is presented, so users of both units share every
+# upstream call, cache entry and snapshot entry.
+def celsius_to_fahrenheit(values):
+    return [None if v is None else round(v * 9 / 5 + 32, 1) for v in values]
+
+
+def present_weather(weather, unit):
+    if not weather or unit != "fahrenheit":
+        return weather
+    temperature, dewpoint = celsius_to_fahrenheit([weather.get("temperature"), weather.get("dewpoint")])
+    return dict(weather, temperature=temperature, dewpoint=dewpoint)
+
+
+def present_forecast(forecast, unit):
+    if not forecast or unit != "fahrenheit":
+        return forecast
+    # Every max and min of the forecast is converted in a single pass
+    converted = celsius_to_fahrenheit([day[field] for day in forecast for field in ("temp_max", "temp_min")])
+    return [dict(day, temp_max=converted[2 * i], temp_min=converted[2 * i + 1]) for i, day in enumerate(forecast)]
+
+
+def present_result(result, unit):
+    if unit != "fahrenheit":
+        return result
+    return dict(result, weather=present_weather(result.get("weather"), unit),
+                forecast=present_forecast(result.get("forecast"), unit))
+
+
+# The *_many getters return a value per location (None, or [] for the
+# forecast, when it couldn't be loaded) and whether each one is stale.
+# With revalidate=False expired entries are reloaded before returning.
+def get_current_weather_many(coords, revalidate=True):
+    keys = [coord_key(lat, lon) for lat, lon in coords]
+    found, stale = CACHE.load_many("current", keys, batch_loader(fetch_current_weather_batch, dict(zip(keys, coords))),
+                                   revalidate)
+    return [found.get(key) for key in keys], [key in stale for key in keys]
+
+
+def daily_forecast_keys(coords):
+    # Keyed by UTC date so the 5-day window (the days after today) moves at
+    # midnight; returns the keys and the window
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    keys = [f"{today.date().isoformat()}:{coord_key(lat, lon)}" for lat, lon in coords]
+    return keys, today + timedelta(days=1), today + timedelta(days=FORECAST_DAYS + 1)
+
+
+def get_daily_forecast_many(coords, revalidate=True):
+    keys, start, end = daily_forecast_keys(coords)
+    found, stale = CACHE.load_many("daily", keys, batch_loader(fetch_daily_forecast_batch, dict(zip(keys, coords))),
+                                   revalidate)
+    return [found[key].between(start, end) if key in found else [] for key in keys], [key in stale for key in keys]
+
+
+def get_current_weather(lat, lon, unit="celsius"):
+    return present_weather(get_current_weather_many([(lat, lon)])[0][0], unit)
+
+
+def get_daily_forecast(lat, lon, unit="celsius"):
+    return present_forecast(get_daily_forecast_many([(lat, lon)])[0][0], unit)
+
+
+def get_forecast_data(lat, lon, unit="celsius"):
+    return get_current_weather(lat, lon, unit), get_daily_forecast(lat, lon, unit)
+
+
+def get_local_time(tz):
+    time_str = None
     try:
         # Prefer server-side timezone conversion to avoid external API failures
         if ZoneInfo is not None:
@@ -282,32 +501,354 @@ def get_city_data(city, unit="celsius"):
     except Exception:
         app.logger.exception('Unexpected error computing local time')
         time_str = None
-    
+    return time_str
+
+
+def build_city_result(city, weather, forecast, air_quality, alerts, partial=False, recommend=True, stale=(), missing=()):
+    # Canonical (Celsius) result; see present_result. Batches pass
+    # recommend=False and call add_recommendations once for every city.
+    tz = city.get('tz', 'UTC')
     result = {
         "id": city["id"],
         "name": city["name"],
         "weather": weather,
-        "datetime": time_str,
+        "datetime": get_local_time(tz),
         "timezone": tz,
         "forecast": forecast,
         "air_quality": air_quality, # Add air quality data
         "alerts": alerts,
-        "outfit_recommendation": outfit_recommendation, # Add outfit recommendation
-        "activity_recommendation": activity_recommendation, # Add activity recommendation
-        "weather_tip": weather_tip # Add weather tip
+        "partial": partial or bool(missing), # True when some data couldn't be loaded
+        "stale": list(stale), # Sources (see SOURCES) shown from data past its cache TTL
+        "missing": list(missing), # Sources with no data at all
     }
-    app.logger.info(f"Returning data for city {city['name']}: {result}")
+    if recommend:
+        add_recommendations([result])
+    log_payload(f"Returning data for city {city['name']}", result)
     return result
 
+
+def get_cities_data(cities, unit="celsius", deadline=PAGE_DEADLINE, revalidate=True):
+    # revalidate=False waits for expired cache entries to be reloaded rather
+    # than returning them (see WeatherCache.load)
+    unit = unit or USER_DEFAULTS["units"]
+    coords = [(city["lat"], city["lon"]) for city in cities]
+    app.logger.debug(f"Fetching data for {len(cities)} cities")
+
+    # Forecast and air quality go out as one multi-location request per
+    # chunk of cities; OpenWeatherMap has no batch API so alerts stay per
+    # city. Everything is submitted up front and waited on once.
+    chunks = []
+    for start in range(0, len(coords), BATCH_SIZE):
+        chunk = coords[start:start + BATCH_SIZE]
+        chunks.append((
+            start,
+            FETCH_POOL.submit(get_current_weather_many, chunk, revalidate),
+            FETCH_POOL.submit(get_daily_forecast_many, chunk, revalidate),
+            FETCH_POOL.submit(get_air_quality_many, chunk, revalidate),
+        ))
+    alerts_futures = [FETCH_POOL.submit(load_weather_alerts, lat, lon, revalidate) for lat, lon in coords]
+
+    futures = [f for chunk in chunks for f in chunk[1:]] + alerts_futures
+    done, not_done = wait(futures, timeout=deadline)
+    if not_done:
+        app.logger.warning(f"{len(not_done)} of {len(futures)} upstream calls missed the {deadline}s page deadline")
+        for f in not_done:
+            f.cancel()
+
+    # Calls that missed the deadline leave their sources missing
+    values = {source: [None] * len(cities) for source in SOURCES}
+    stale = {source: [False] * len(cities) for source in SOURCES}
+    for start, *futures in chunks:
+        for source, future in zip(SOURCES, futures):
+            if future in done:
+                chunk_values, chunk_stale = future.result()
+                values[source][start:start + len(chunk_values)] = chunk_values
+                stale[source][start:start + len(chunk_stale)] = chunk_stale
+    for i, future in enumerate(alerts_futures):
+        if future in done:
+            values["alerts"][i], stale["alerts"][i] = future.result()
+    return finish_cities_data(cities, unit, values, stale)
+
+
+# Each source degrades on its own: whatever couldn't be loaded is taken from
+# the city's last refreshed result if that had it, and marked stale
+SOURCES = ("weather", "forecast", "air_quality", "alerts")
+
+
+def _is_missing(source, value):
+    return value is None or (source == "forecast" and not value)
+
+
+def last_good(city, sources):
+    # {source: value} from the city's snapshot entry for those of ``sources``
+    # it has, minus forecast days and alerts that are over by now
+    entry = snapshot_entry(city["id"])
+    if entry is None:
+        return {}
+    data = entry["data"]
+    found = {}
+    for source in sources:
+        value = data.get(source)
+        if source in data.get("missing", ()) or _is_missing(source, value):
+            continue
+        if source == "forecast":
+            today = datetime.utcnow().date().isoformat()
+            value = [dict(day) for day in value if day.get("date", "") > today] or None
+        elif source == "alerts":
+            now = time.time()
+            value = [alert for alert in value if alert.get("end", now) >= now]
+        if value is not None:
+            found[source] = value
+    return found
+
+
+def finish_cities_data(cities, unit, values, stale, sources=SOURCES):
+    # ``values`` and ``stale`` are {source: per-city list} for each of
+    # ``sources`` (in SOURCES order); the others are left empty and never
+    # reported missing. Presented results out.
+    results = []
+    for i, city in enumerate(cities):
+        found = {source: values[source][i] if source in sources else None for source in SOURCES}
+        stale_sources = {source for source in sources if stale[source][i]}
+        missing = [source for source in sources if _is_missing(source, found[source])]
+        if missing:
+            fallback = last_good(city, missing)
+            found.update(fallback)
+            stale_sources.update(fallback)
+        results.append(build_city_result(
+            city, found["weather"], found["forecast"] or [], found["air_quality"], found["alerts"] or [],
+            recommend=False, stale=[s for s in sources if s in stale_sources],
+            missing=[s for s in sources if _is_missing(s, found[s])]))
+    add_recommendations(results)
+    return [present_result(result, unit) for result in results]
+
+
+def get_city_data(city, unit="celsius"):
+    return get_cities_data([city], unit)[0]
+
+
+BATCH_GETTERS = {"weather": get_current_weather_many, "forecast": get_daily_forecast_many,
+                 "air_quality": get_air_quality_many}
+
+
+def iter_cities_data(cities, unit="celsius", sources=SOURCES, deadline=PAGE_DEADLINE, chunks_in_flight=2):
+    # Like get_cities_data, but yields (index, result) for each city as soon
+    # as its data is in, fetching only ``sources``. Chunks of BATCH_SIZE
+    # cities are submitted ``chunks_in_flight`` at a time, so a long list
+    # neither floods FETCH_POOL nor holds up its first cities behind the
+    # last ones. Each chunk gets ``deadline`` seconds from submission; what
+    # is still out by then is given up on and filled as get_cities_data does.
+    unit = unit or USER_DEFAULTS["units"]
+    coords = [(city["lat"], city["lon"]) for city in cities]
+    values = {source: [None] * len(cities) for source in sources}
+    stale = {source: [False] * len(cities) for source in sources}
+    waiting = [len(sources)] * len(cities) # outstanding calls per city
+    calls = {} # future -> (source, first city index, end index, chunk start)
+    due = {} # chunk start -> monotonic deadline
+    left = {} # chunk start -> cities not yet yielded
+    starts = iter(range(0, len(cities), BATCH_SIZE))
+
+    def submit(start):
+        end = min(start + BATCH_SIZE, len(cities))
+        for source in sources:
+            if source == "alerts":
+                for i in range(start, end):
+                    calls[FETCH_POOL.submit(load_weather_alerts, *coords[i])] = (source, i, i + 1, start)
+            else:
+                calls[FETCH_POOL.submit(BATCH_GETTERS[source], coords[start:end])] = (source, start, end, start)
+        due[start] = time.monotonic() + deadline
+        left[start] = end - start
+
+    def settle(future, ready):
+        source, first, end, start = calls.pop(future)
+        if future.done() and not future.cancelled():
+            try:
+                found, found_stale = future.result()
+            except Exception as e:
+                # The response is already streaming, so the source is left
+                # missing for these cities, as for a call past its deadline
+                app.logger.error(f"Loading {source} for cities {first}-{end - 1} failed: {e}")
+            else:
+                if source == "alerts":
+                    found, found_stale = [found], [found_stale]
+                values[source][first:end] = found
+                stale[source][first:end] = found_stale
+        else:
+            future.cancel()
+        for i in range(first, end):
+            waiting[i] -= 1
+            if not waiting[i]:
+                ready.append(i)
+                left[start] -= 1
+                if not left[start]:
+                    del due[start], left[start]
+
+    while True:
+        while len(due) < chunks_in_flight:
+            start = next(starts, None)
+            if start is None:
+                break
+            submit(start)
+        if not calls:
+            return
+        done, _ = wait(calls, timeout=max(0, min(due.values()) - time.monotonic()), return_when=FIRST_COMPLETED)
+        ready = []
+        for future in done:
+            settle(future, ready)
+        now = time.monotonic()
+        late = [f for f, call in calls.items() if due[call[3]] <= now]
+        if late:
+            app.logger.warning(f"{len(late)} upstream calls missed the {deadline}s deadline of their chunk")
+        for future in late:
+            settle(future, ready)
+        if ready:
+            results = finish_cities_data([cities[i] for i in ready], unit,
+                                         {source: [values[source][i] for i in ready] for source in sources},
+                                         {source: [stale[source][i] for i in ready] for source in sources}, sources)
+            yield from zip(ready, results)
+
+
+def tracked_cities():
+    # Union of every user's cities plus the defaults, keyed by city id; units
+    # don't matter since results are stored in Celsius
+    tracked = {c["id"]: c for c in USER_DEFAULTS["selected_cities"]}
+    for _, user_data in USER_STORE.iter_users():
+        for c in user_data["selected_cities"]:
+            tracked[c["id"]] = c
+    return tracked
+
+
+SNAPSHOT = Snapshot(os.getenv("SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "weather-snapshot.json")))
+def refresh_cities_data(cities):
+    # The refresher stamps what it gets as new, so it waits for expired
+    # cache entries to be reloaded instead of taking them as they are
+    return get_cities_data(cities, revalidate=False)
+
+
+REFRESHER = Refresher(
+    SNAPSHOT,
+    tracked_cities,
+    refresh_cities_data,
+    interval=float(os.getenv("REFRESH_INTERVAL", "300")),
+    jitter=float(os.getenv("REFRESH_JITTER", "0.1")),
+    concurrency=int(os.getenv("REFRESH_CONCURRENCY", "2")),
+    chunk_size=BATCH_SIZE,
+    lock_path=os.getenv("REFRESH_LOCK_PATH", os.path.join(tempfile.gettempdir(), "weather-refresher.lock")),
+    logger=app.logger,
+)
+if REFRESHER.interval > 0:
+    REFRESHER.start()
+
+# Push updates for open dashboards. Under gunicorn each stream holds a
+# server thread for its lifetime, so the number per process is capped;
+# clients over the cap (or when the refresher is off) fall back to polling
+# /api/data. The ASGI entry point serves streams as coroutines, with the
+# much higher ASGI_STREAM_MAX_CLIENTS cap.
+HUB = UpdateHub(SNAPSHOT, present_result, poll_interval=float(os.getenv("STREAM_POLL_INTERVAL", "2")), logger=app.logger)
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "4"))
+STREAM_MAX_AGE = float(os.getenv("STREAM_MAX_AGE", "600"))
+STREAM_KEEPALIVE = 15
+
+
+def snapshot_entry(city_id):
+    # The city's snapshot entry, unless it is older than anything the cache
+    # would still serve (a snapshot file left over from an earlier run, or
+    # a refresher that stopped)
+    entry = SNAPSHOT.get(city_id)
+    if entry is None or time.time() - entry["updated_at"] > CACHE.stale_ttl:
+        return None
+    return entry
+
+
+def snapshot_entries(cities):
+    # (entries, indexes of the cities still to fetch live); entries are
+    # (Celsius result, version) pairs, None where the snapshot has nothing
+    # recent enough
+    entries = [None] * len(cities)
+    live = []
+    for i, city in enumerate(cities):
+        entry = snapshot_entry(city["id"])
+        if entry is None:
+            live.append(i)
+            continue
+        entries[i] = (dict(entry["data"], updated_at=entry["updated_at"]), entry["updated_at"])
+    return entries, live
+
+
+def add_live_entries(entries, live, results):
+    # Live results have no version, so their payloads aren't cached
+    now = time.time()
+    for i, result in zip(live, results):
+        entries[i] = (dict(result, updated_at=now), None)
+    return entries
+
+
+def get_dashboard_entries(cities):
+    # Serve from the refresher's snapshot; only cities it doesn't have yet
+    # (untracked or not refreshed since start-up) or only has old data for
+    # are fetched live.
+    entries, live = snapshot_entries(cities)
+    if live:
+        add_live_entries(entries, live, get_cities_data([cities[i] for i in live]))
+    return entries
+
+
+def get_dashboard_data(cities, unit="celsius"):
+    return dashboard_data(cities, unit, get_dashboard_entries(cities))
+
+
+def dashboard_data(cities, unit, entries):
+    unit = unit or USER_DEFAULTS["units"]
+    now = time.time()
+    data = []
+    for city, (result, _) in zip(cities, entries):
+        # Local time is recomputed; data_age says how old the weather is
+        data.append(dict(present_result(result, unit), datetime=get_local_time(city.get('tz', 'UTC')),
+                         data_age=int(now - result["updated_at"])))
+    return data
+
+
+# Finished per-city payloads keyed by (city id, unit, data version): the
+# JSON object without its per-request fields, and the rendered dashboard
+# card. The version is the snapshot's updated_at, so entries never need
+# invalidating; a refresh simply produces new keys and old ones age out.
+PAYLOADS = LocalBackend(int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", str(8 * 1024 * 1024))))
+PAYLOAD_TTL = 2 * 3600
+PER_REQUEST_FIELDS = ("datetime", "data_age")
+
+
+def city_json(city, unit, result, version):
+    # (JSON text missing its closing brace, content hash)
+    key = f"json:{city['id']}:{unit}:{version}"
+    piece = PAYLOADS.get(key) if version is not None else MISSING
+    if piece is MISSING:
+        result = {k: v for k, v in present_result(result, unit).items() if k not in PER_REQUEST_FIELDS}
+        body = json.dumps(result, separators=(",", ":"))
+        # The hash leaves out updated_at, which a live result gets anew on
+        # every request, so unchanged data still revalidates to a 304
+        data = json.dumps({k: v for k, v in result.items() if k != "updated_at"}, separators=(",", ":"))
+        piece = (body[:-1], hashlib.md5(data.encode()).hexdigest())
+        if version is not None:
+            PAYLOADS.set(key, piece, PAYLOAD_TTL)
+    return piece
+
+
+def city_card(city, unit, result, version):
+    key = f"html:{city['id']}:{unit}:{version}"
+    html = PAYLOADS.get(key) if version is not None else MISSING
+    if html is MISSING:
+        html = render_template("city_card.html", city=present_result(result, unit), units=unit)
+        if version is not None:
+            PAYLOADS.set(key, html, PAYLOAD_TTL)
+    return html
+
 def login_required(fn):
     from functools import wraps
     @wraps(fn)
     def wrapped(*args, **kwargs):
-        app.logger.info(f"Checking login for route: {request.path}")
         if not session.get("user"):
-            app.logger.info("User not logged in, redirecting to login.")
+            app.logger.debug(f"User not logged in, redirecting {request.path} to login.")
             return redirect(url_for("login", next=request.path))
-        app.logger.info("User is logged in.")
         return fn(*args, **kwargs)
     return wrapped
 
@@ -319,32 +860,12 @@ def login():
         password = request.form.get("password")
         app.logger.info(f"Attempting to log in user: {username}")
         
-        user_data = USERS.get(username)
+        # Old string-hash users.json entries are upgraded by the store migration
+        user_data = USER_STORE.get(username)
         if user_data:
-            # Handle both old (string) and new (dict) user formats
-            is_valid = False
-            if isinstance(user_data, dict):
-                is_valid = check_password_hash(user_data.get("password_hash"), password)
-            elif isinstance(user_data, str):
-                is_valid = check_password_hash(user_data, password)
-
-            if is_valid:
+            if check_password_hash(user_data["password_hash"], password):
                 app.logger.info(f"User {username} logged in successfully.")
-                session["user"] = username
-                if isinstance(user_data, dict):
-                    session["selected_cities"] = user_data.get("selected_cities", USER_DEFAULTS["selected_cities"])
-                    session["units"] = user_data.get("units", USER_DEFAULTS["units"])
-                else:
-                    # Upgrade old user to new format
-                    app.logger.info(f"Upgrading user {username} to new data format.")
-                    USERS[username] = {
-                        "password_hash": user_data,
-                        "selected_cities": USER_DEFAULTS["selected_cities"],
-                        "units": USER_DEFAULTS["units"]
-                    }
-                    save_users(USERS)
-                    session["selected_cities"] = USER_DEFAULTS["selected_cities"]
-                    session["units"] = USER_DEFAULTS["units"]
+                start_session(username, user_data)
 
                 nxt = request.args.get("next") or url_for("index")
                 app.logger.info(f"Redirecting to: {nxt}")
@@ -361,46 +882,101 @@ def register():
         username = request.form.get("username")
         password = request.form.get("password")
         app.logger.info(f"Attempting to register user: {username}")
-        if username in USERS:
-            app.logger.warning(f"Registration failed for user {username}: username already exists.")
-            return render_template("register.html", error="Username already exists")
-        
-        USERS[username] = {
+        user_data = {
             "password_hash": generate_password_hash(password),
             "selected_cities": USER_DEFAULTS["selected_cities"],
             "units": USER_DEFAULTS["units"]
         }
-        save_users(USERS)
+        if not USER_STORE.create(username, user_data):
+            app.logger.warning(f"Registration failed for user {username}: username already exists.")
+            return render_template("register.html", error="Username already exists")
         app.logger.info(f"User {username} registered successfully.")
         
-        session["user"] = username
-        session["selected_cities"] = USERS[username]["selected_cities"]
-        session["units"] = USERS[username]["units"]
+        start_session(username, user_data)
         return redirect(url_for("index"))
     return render_template("register.html")
 
 @app.route("/logout")
 def logout():
     app.logger.info("Logging out user.")
-    session.pop("user", None)
-    session.pop("selected_cities", None)
-    session.pop("units", None) # Clear units from session
+    session.clear()
     return redirect(url_for("login"))
 
 @app.route("/")
 @login_required
 def index():
-    app.logger.info("Accessed / route.")
-    # fetch data for server-render
-    data = [get_city_data(c, session.get("units")) for c in session.get("selected_cities", [])]
-    return render_template("index.html", cities=data, units=session.get("units", USER_DEFAULTS["units"]))
+    app.logger.debug("Accessed / route.")
+    # Cards are server-rendered from cached fragments; the page script then
+    # keeps them up to date
+    cities = session_cities()
+    unit = session.get("units") or USER_DEFAULTS["units"]
+    entries = get_dashboard_entries(cities)
+    cards = Markup("".join(city_card(city, unit, result, version) for city, (result, version) in zip(cities, entries)))
+    return render_template("index.html", cards=cards, units=unit)
 
 @app.route("/api/data")
 @login_required
 def api_data():
-    app.logger.info("Accessed /api/data route.")
-    data = [get_city_data(c, session.get("units")) for c in session.get("selected_cities", [])]
-    return jsonify(data)
+    app.logger.debug("Accessed /api/data route.")
+    cities = session_cities()
+    unit = session.get("units") or USER_DEFAULTS["units"]
+    return dashboard_response(cities, unit, get_dashboard_entries(cities))
+
+
+def dashboard_response(cities, unit, entries):
+    pieces = [city_json(city, unit, result, version) for city, (result, version) in zip(cities, entries)]
+
+    # The ETag covers the data only, so a poll between refreshes gets a 304
+    etag = hashlib.md5(f"{unit}:{':'.join(digest for _, digest in pieces)}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        now = time.time()
+        body = ",".join(
+            f'{prefix},"datetime":{json.dumps(get_local_time(city.get("tz", "UTC")))},'
+            f'"data_age":{int(now - result["updated_at"])}}}'
+            for city, (result, _), (prefix, _) in zip(cities, entries, pieces))
+        response = Response(f"[{body}]", mimetype="application/json")
+    response.set_etag(etag)
+    # Revalidate on every poll rather than reuse without asking
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/stream")
+@login_required
+def api_stream():
+    # 204 tells EventSource not to reconnect; the page then polls instead
+    if REFRESHER.interval <= 0:
+        return "", 204
+    cities = session_cities()
+    unit = session.get("units") or USER_DEFAULTS["units"]
+    # Subscribe before reading the initial state so no change is missed
+    sub = HUB.subscribe((Snapshot.key(c["id"]) for c in cities), unit, limit=STREAM_MAX_CLIENTS)
+    if sub is None:
+        return "", 204
+    try:
+        initial = get_dashboard_data(cities, unit)
+    except Exception:
+        HUB.unsubscribe(sub)
+        raise
+
+    def events():
+        try:
+            yield "retry: 5000\n"
+            yield format_event("snapshot", initial)
+            # Streams are closed after STREAM_MAX_AGE so long-lived tabs
+            # don't pin a thread forever; EventSource reconnects on its own
+            closes_at = time.monotonic() + STREAM_MAX_AGE
+            while not sub.closed and time.monotonic() < closes_at:
+                try:
+                    yield sub.queue.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            HUB.unsubscribe(sub)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/user/units", methods=["GET", "POST"])
 @login_required
@@ -414,96 +990,541 @@ def api_user_units():
         app.logger.info(f"Updating units to: {new_units}")
         if new_units in ["celsius", "fahrenheit"]:
             session["units"] = new_units
-            USERS[session["user"]]["units"] = new_units
-            save_users(USERS)
+            USER_STORE.set_units(session["user"], new_units)
             return jsonify({"units": new_units})
         app.logger.warning(f"Invalid unit provided: {new_units}")
         return jsonify({"error": "Invalid unit"}), 400
 
+# Arbitrary coordinates (the browser's geolocation) are snapped to a grid of
+# LOCATION_GRID-degree squares before anything is fetched or cached
+LOCATION_GRID = float(os.getenv("LOCATION_GRID", "0.1"))
+
+
+def _coord_args():
+    # (lat, lon) from the query string, or None when missing or out of range
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def place_params(lat, lon):
+    return {"latitude": lat, "longitude": lon, "localityLanguage": "en"}
+
+
+def read_place_name(resp):
+    if resp.status_code >= 400:
+        raise UpstreamError(f"Reverse geocoding request failed with status code: {resp.status_code}")
+    data = resp.json()
+    return data.get("city") or data.get("locality") or data.get("principalSubdivision") or ""
+
+
+def fetch_place_name(lat, lon):
+    return read_place_name(UPSTREAM.get("geocode", REVERSE_GEOCODE_URL, params=place_params(lat, lon), timeout=5))
+
+
+def get_place_name(lat, lon):
+    try:
+        return CACHE.get_or_load("place", coord_key(lat, lon), lambda: fetch_place_name(lat, lon))
+    except Exception as e:
+        app.logger.error(f"An error occurred in get_place_name: {e}", exc_info=True)
+        return ""
+
+
+INVALID_COORDINATES = {"error": "Missing or invalid coordinates"}
+
+
 @app.route("/api/weather_alerts")
 @login_required
 def api_weather_alerts():
-    lat = request.args.get("lat")
-    lon = request.args.get("lon")
-    if not lat or not lon:
-        return jsonify({"error": "Missing coordinates"}), 400
-    alerts = get_weather_alerts(lat, lon)
+    coords = _coord_args()
+    if coords is None:
+        return jsonify(INVALID_COORDINATES), 400
+    alerts = get_weather_alerts(*snap_to_grid(*coords, LOCATION_GRID))
     return jsonify({"alerts": alerts})
 
 
+def location_unit():
+    unit = request.args.get("units")
+    if unit not in ("celsius", "fahrenheit"):
+        unit = session.get("units") or USER_DEFAULTS["units"]
+    return unit
+
+
+def location_place(lat, lon):
+    # Stands in for a catalogue city in get_cities_data
+    return {"id": None, "name": "", "lat": lat, "lon": lon}
+
+
+@app.route("/api/location_weather")
+@login_required
+def api_location_weather():
+    # Everything the "your location" panel shows, for the grid square the
+    # coordinates fall in: one request instead of several third-party ones
+    # from the browser
+    coords = _coord_args()
+    if coords is None:
+        return jsonify(INVALID_COORDINATES), 400
+    lat, lon = snap_to_grid(*coords, LOCATION_GRID)
+    unit = location_unit()
+    name = FETCH_POOL.submit(get_place_name, lat, lon)
+    result = get_city_data(location_place(lat, lon), unit)
+    return jsonify(dict(result, name=name.result(), lat=lat, lon=lon, units=unit))
+
+
+# Bulk lookups for internal dashboards: many cities at once, streamed as
+# NDJSON without touching the user's own dashboard
+BULK_MAX_CITIES = int(os.getenv("BULK_MAX_CITIES", "1000"))
+BULK_CHUNKS_IN_FLIGHT = int(os.getenv("BULK_CHUNKS_IN_FLIGHT", "2"))
+RECOMMENDATION_FIELDS = ("outfit_recommendation", "activity_recommendation", "weather_tip")
+
+
+def bulk_place(item):
+    # A dashboard city for an id, a grid square (as in /api/location_weather)
+    # for {"lat": .., "lon": ..}, or None
+    if isinstance(item, int) and not isinstance(item, bool):
+        return CITIES_BY_ID.get(item)
+    if isinstance(item, dict):
+        try:
+            lat, lon = float(item["lat"]), float(item["lon"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return location_place(*snap_to_grid(lat, lon, LOCATION_GRID))
+    return None
+
+
+def bulk_args(body):
+    # (places, sources, unit, None) or (None, None, None, error message)
+    if not isinstance(body, dict) or not isinstance(body.get("cities"), list) or not body["cities"]:
+        return None, None, None, "Expected a JSON object with a non-empty \"cities\" list"
+    if len(body["cities"]) > BULK_MAX_CITIES:
+        return None, None, None, f"At most {BULK_MAX_CITIES} cities per request"
+    places = [bulk_place(item) for item in body["cities"]]
+    if None in places:
+        return None, None, None, f"Unknown city or invalid coordinates at index {places.index(None)}"
+    fields = body.get("fields", list(SOURCES))
+    if not isinstance(fields, list) or not fields or not set(fields) <= set(SOURCES):
+        return None, None, None, f"\"fields\" must be a non-empty list of {', '.join(SOURCES)}"
+    unit = body.get("units") or session.get("units") or USER_DEFAULTS["units"]
+    if unit not in ("celsius", "fahrenheit"):
+        return None, None, None, "Invalid unit"
+    return places, tuple(s for s in SOURCES if s in fields), unit, None
+
+
+def bulk_line(index, place, result, sources):
+    # The result without the sources that weren't asked for (or the
+    # recommendations, without current weather), plus where it came from
+    skipped = set(SOURCES) - set(sources)
+    if "weather" in skipped:
+        skipped.update(RECOMMENDATION_FIELDS)
+    line = {k: v for k, v in result.items() if k not in skipped}
+    line.update(index=index, lat=place["lat"], lon=place["lon"])
+    return json.dumps(line) + "\n"
+
+
+@app.route("/api/bulk", methods=["POST"])
+@login_required
+def api_bulk():
+    # {"cities": [city id or {"lat": .., "lon": ..}, ...], "fields": [...],
+    # "units": ...}. One JSON line per city in the order they complete;
+    # "index" is the city's position in the request.
+    places, sources, unit, error = bulk_args(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    app.logger.info(f"Bulk request for {len(places)} cities ({', '.join(sources)})")
+
+    def lines():
+        for index, result in iter_cities_data(places, unit, sources, chunks_in_flight=BULK_CHUNKS_IN_FLIGHT):
+            yield bulk_line(index, places[index], result, sources)
+
+    return Response(lines(), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/stats")
+@login_required
+def api_stats():
+    return jsonify({
+        "cache": CACHE.stats(),
+        "upstream": UPSTREAM.stats(),
+        "refresher": {
+            "leader": REFRESHER.is_leader,
+            "last_refresh": REFRESHER.last_refresh,
+            "snapshot_entries": len(SNAPSHOT.entries),
+        },
+        "stream": HUB.stats(),
+    })
+
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def collect_app_stats():
+    cache = CACHE.stats()
+    lookups = []
+    ratios = []
+    for kind, c in cache["types"].items():
+        for result in ("hits", "misses", "coalesced", "stale"):
+            lookups.append(({"kind": kind, "result": result}, c[result]))
+        ratios.append(({"kind": kind}, c["hit_ratio"]))
+    yield "weather_cache_lookups_total", "counter", "Cache lookups by data kind and result", lookups
+    yield "weather_cache_hit_ratio", "gauge", "Share of lookups served without an upstream call", ratios
+    store = cache["store"]
+    if "bytes" in store:
+        yield "weather_cache_bytes", "gauge", "Approximate size of the in-process cache", [({}, store["bytes"])]
+        yield "weather_cache_evictions_total", "counter", "Entries evicted by the memory cap", [({}, store["evictions"])]
+
+    upstream = UPSTREAM.stats()
+    yield "upstream_requests_total", "counter", "Upstream API calls", [
+        ({"upstream": name}, c["requests"]) for name, c in upstream.items()]
+    yield "upstream_errors_total", "counter", "Upstream API calls that failed", [
+        ({"upstream": name}, c["errors"]) for name, c in upstream.items()]
+    yield "upstream_short_circuited_total", "counter", "Calls refused by an open circuit breaker", [
+        ({"upstream": name}, c["short_circuited"]) for name, c in upstream.items()]
+    yield "upstream_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half open, 2 open)", [
+        ({"upstream": name}, BREAKER_STATES[c["state"]]) for name, c in upstream.items()]
+
+    yield "refresher_leader", "gauge", "1 if this process runs the background refresher", [
+        ({}, int(REFRESHER.is_leader))]
+    yield "refresher_last_refresh_timestamp_seconds", "gauge", "When the last refresh finished", [
+        ({}, REFRESHER.last_refresh)]
+    yield "snapshot_entries", "gauge", "City results in the refresh snapshot", [({}, len(SNAPSHOT.entries))]
+    stream = HUB.stats()
+    yield "stream_subscribers", "gauge", "Open dashboard update streams", [({}, stream["subscribers"])]
+    yield "stream_events_published_total", "counter", "City updates pushed to streams", [
+        ({}, stream["events_published"])]
+
+
+METRICS.add_collector(collect_app_stats)
+
+
+# /metrics is only served to scrapers presenting this bearer token; without
+# one configured the route is off, since the service is public
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@app.route("/metrics")
+def metrics():
+    if not METRICS_TOKEN:
+        return Response("Not found", status=404, mimetype="text/plain")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+        return Response("Unauthorized", status=401, mimetype="text/plain", headers={"WWW-Authenticate": "Bearer"})
+    # Per process; see the README for scraping several gunicorn workers
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/cities")
 @login_required
 def api_cities():
-    app.logger.info("Accessed /api/cities route.")
+    app.logger.debug("Accessed /api/cities route.")
     if not ALL_CITIES:
         app.logger.error("City data not loaded.")
         return jsonify({"error": "City data not loaded. Please check if 'worldcities.csv' is in the 'static' directory."}), 500
     return jsonify(ALL_CITIES)
 
+# Dashboard cities are indexed eagerly; the name-only catalogue in
+# static/cities.json is loaded from CITY_CATALOGUE_INDEX if it was
+# precompiled (python city_index.py) from the current sources, and built on
+# the first catalogue search otherwise. Like the pack, it is kept out of
+# static/.
+CITY_INDEX = CityIndex(ALL_CITIES)
+CITY_CATALOGUE_JSON = os.path.join(app.static_folder, "cities.json")
+CITY_CATALOGUE_INDEX = os.getenv("CITY_CATALOGUE_INDEX", os.path.join(app.root_path, "cities.index"))
+_catalogue_index = None
+_catalogue_index_lock = threading.Lock()
+
+
+def get_catalogue_index():
+    global _catalogue_index
+    with _catalogue_index_lock:
+        if _catalogue_index is None:
+            started = time.perf_counter()
+            index = None
+            if os.path.exists(CITY_CATALOGUE_INDEX):
+                try:
+                    index = CityIndex.load(CITY_CATALOGUE_INDEX)
+                except Exception as e:
+                    app.logger.warning(f"Could not load {CITY_CATALOGUE_INDEX}: {e}")
+                if getattr(index, "source", None) != catalogue_source_hash(ALL_CITIES, CITY_CATALOGUE_JSON):
+                    app.logger.info(f"{CITY_CATALOGUE_INDEX} is missing or was built from other sources; rebuilding it")
+                    index = None
+            if index is None:
+                index = CityIndex.from_catalogue(ALL_CITIES, CITY_CATALOGUE_JSON)
+            _catalogue_index = index
+            app.logger.info(f"City catalogue index ready with {len(_catalogue_index.records)} cities "
+                            f"in {time.perf_counter() - started:.2f}s")
+        return _catalogue_index
+
+
+# Per-country shards of the catalogue for the browser, compiled by
+# python catalogue.py (built on the first request for a shard when missing
+# or compiled from other sources) and served from a mmap. The pack lives outside static/ so only
+# its shards, through /catalogue/, are public.
+CITY_CATALOGUE_PACK = os.getenv("CITY_CATALOGUE_PACK", os.path.join(app.root_path, "cities.pack"))
+_catalogue_pack = None
+_catalogue_pack_lock = threading.Lock()
+
+
+def get_catalogue_pack():
+    global _catalogue_pack
+    with _catalogue_pack_lock:
+        if _catalogue_pack is None:
+            pack = None
+            try:
+                pack = CataloguePack(CITY_CATALOGUE_PACK)
+            except (OSError, ValueError):
+                pass
+            if pack is None or pack.source != catalogue_source_hash(ALL_CITIES, CITY_CATALOGUE_JSON):
+                if pack is not None:
+                    pack.close()
+                started = time.perf_counter()
+                build_catalogue_pack(CITY_CATALOGUE_PACK, ALL_CITIES, CITY_CATALOGUE_JSON)
+                app.logger.info(f"Built city catalogue pack in {time.perf_counter() - started:.2f}s")
+                pack = CataloguePack(CITY_CATALOGUE_PACK)
+            _catalogue_pack = pack
+        return _catalogue_pack
+
+
+@app.route("/catalogue/<name>")
+def catalogue_file(name):
+    # Shard names carry a content hash and never change; the manifest that
+    # lists them is revalidated instead
+    found = get_catalogue_pack().get(name, [e for e in ("br", "gzip") if request.accept_encodings[e]])
+    if found is None:
+        return jsonify({"error": "Not found"}), 404
+    body, encoding, etag = found
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "no-cache" if name == MANIFEST else "public, max-age=31536000, immutable"
+    return response
+
+
+def _int_arg(name, default, minimum=1, maximum=None):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    value = max(minimum, value)
+    return min(value, maximum) if maximum else value
+
+
+@app.route("/api/cities/search")
+@login_required
+def api_cities_search():
+    # ?catalogue=1 searches the full name-only catalogue; those entries have
+    # no id or coordinates and can't be added to the dashboard
+    query = request.args.get("q", "")
+    page = _int_arg("page", 1)
+    per_page = _int_arg("per_page", 20, maximum=100)
+    index = get_catalogue_index() if request.args.get("catalogue") == "1" else CITY_INDEX
+    total, results = index.search(query, offset=(page - 1) * per_page, limit=per_page)
+    return jsonify({"query": query, "page": page, "per_page": per_page, "total": total, "results": results})
+
+
+@app.route("/api/cities/nearest")
+@login_required
+def api_cities_nearest():
+    coords = _coord_args()
+    if coords is None:
+        return jsonify(INVALID_COORDINATES), 400
+    return jsonify({"results": CITY_INDEX.nearest(*coords, _int_arg("limit", 5, maximum=50))})
+
+
 @app.route("/api/user/cities", methods=["GET", "POST", "DELETE"])
 @login_required
 def api_user_cities():
     app.logger.info(f"Accessed /api/user/cities route with method: {request.method}")
     if request.method == "GET":
-        return jsonify(session.get("selected_cities", []))
+        return jsonify(session_cities())
     
+    # Only catalogue cities can be tracked, so the client's copy is just
+    # used for its id
+    posted = request.json
+    city_id = posted.get("id") if isinstance(posted, dict) else None
     if request.method == "POST":
-        city = request.json
+        city = CITIES_BY_ID.get(city_id)
         app.logger.info(f"Adding city: {city}")
+        if posted and city is None:
+            app.logger.warning(f"Unknown city: {posted}")
+            return jsonify({"error": "Unknown city"}), 400
         if city:
-            selected_cities = session.get("selected_cities", [])
-            if city not in selected_cities:
-                selected_cities.append(city)
-                USERS[session["user"]]["selected_cities"] = selected_cities
-                save_users(USERS)
+            cities = USER_STORE.add_city(session["user"], city)
+            session["city_ids"] = [c["id"] for c in cities]
             return jsonify(city)
 
     if request.method == "DELETE":
-        city = request.json
-        app.logger.info(f"Removing city: {city}")
-        if city:
-            selected_cities = session.get("selected_cities", [])
-            if city in selected_cities:
-                selected_cities.remove(city)
-                USERS[session["user"]]["selected_cities"] = selected_cities
-                save_users(USERS)
-            return jsonify(city)
+        app.logger.info(f"Removing city: {posted}")
+        # Matched by id, since the stored record may predate the catalogue entry
+        for city in [c for c in USER_STORE.get(session["user"])["selected_cities"] if c.get("id") == city_id]:
+            session["city_ids"] = [c["id"] for c in USER_STORE.remove_city(session["user"], city)]
+        if posted:
+            return jsonify(posted)
 
     return jsonify({"status": "ok"})
 
 
-@app.route("/api/historical_weather")
-@login_required
-def api_historical_weather():
-    app.logger.info("Accessed /api/historical_weather route.")
+ARCHIVE = ArchiveStore(os.getenv("ARCHIVE_DB_PATH", "archive.db"))
+ARCHIVE_CHUNK_DAYS = int(os.getenv("ARCHIVE_CHUNK_DAYS", "366"))
+# Longest range one request may ask for, and archive chunks it fetches at
+# once, so a single request can't take over FETCH_POOL
+HISTORICAL_MAX_DAYS = int(os.getenv("HISTORICAL_MAX_DAYS", "3660"))
+ARCHIVE_FETCH_CONCURRENCY = int(os.getenv("ARCHIVE_FETCH_CONCURRENCY", "2"))
+
+
+def archive_params(lat, lon, start, end):
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "daily": ",".join(ARCHIVE_VARIABLES),
+    }
+
+
+def read_archive_days(resp):
+    if resp.status_code >= 400:
+        raise UpstreamError(f"Failed to fetch historical data with status code: {resp.status_code}", resp.status_code)
+    daily = resp.json().get("daily", {})
+    return {day: tuple(daily[v][i] for v in ARCHIVE_VARIABLES) for i, day in enumerate(daily.get("time", []))}
+
+
+def fetch_archive_days(lat, lon, start, end):
+    app.logger.debug(f"Requesting historical weather for {lat},{lon} {start} to {end}")
+    resp = UPSTREAM.get("archive", OPEN_METEO_ARCHIVE_URL, params=archive_params(lat, lon, start, end), timeout=10)
+    return read_archive_days(resp)
+
+
+def archive_gaps(lat, lon, start, end):
+    # (rounded lat, lon, stored days, date ranges still to fetch)
+    lat, lon = round(lat, COORD_PRECISION), round(lon, COORD_PRECISION)
+    days = ARCHIVE.read(coord_key(lat, lon), start, end)
+    gaps = [chunk for gap in missing_ranges(start, end, days) for chunk in split_range(*gap, ARCHIVE_CHUNK_DAYS)]
+    if gaps:
+        app.logger.debug(f"Historical weather for {coord_key(lat, lon)}: {len(days)} days stored, "
+                         f"fetching {len(gaps)} range(s)")
+    return lat, lon, days, gaps
+
+
+def store_archive_days(lat, lon, days, fetched):
+    # Only settled, complete days are kept; recent ones are fetched again next time
+    settled = settled_before().isoformat()
+    ARCHIVE.write(coord_key(lat, lon), {day: values for day, values in fetched.items()
+                                        if day < settled and all(v is not None for v in values)})
+    days.update(fetched)
+
+
+def get_historical_weather(lat, lon, start, end, unit="celsius"):
+    # Stored days are read locally; only the gaps go upstream, split into
+    # ARCHIVE_CHUNK_DAYS pieces fetched ARCHIVE_FETCH_CONCURRENCY at a time.
+    # If a chunk fails, no more are started and the ones that arrived are
+    # still stored before the error is raised.
+    lat, lon, days, gaps = archive_gaps(lat, lon, start, end)
+    if gaps:
+        pending = iter(gaps)
+        running = set()
+        fetched = {}
+        error = None
+        while True:
+            while error is None and len(running) < ARCHIVE_FETCH_CONCURRENCY:
+                gap = next(pending, None)
+                if gap is None:
+                    break
+                running.add(FETCH_POOL.submit(fetch_archive_days, lat, lon, *gap))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    fetched.update(future.result())
+                except Exception as e:
+                    error = error or e
+        store_archive_days(lat, lon, days, fetched)
+        if error is not None:
+            raise error
+    return historical_result(lat, lon, start, end, days, unit)
+
+
+def historical_result(lat, lon, start, end, days, unit):
+    time_axis = sorted(day for day in days if start.isoformat() <= day <= end.isoformat())
+    daily = {"time": time_axis}
+    for i, variable in enumerate(ARCHIVE_VARIABLES):
+        daily[variable] = [days[day][i] for day in time_axis]
+    temperature_unit = "°C"
+    if unit == "fahrenheit":
+        # The archive is stored in Celsius, like everything else
+        for variable in ("temperature_2m_max", "temperature_2m_min"):
+            daily[variable] = celsius_to_fahrenheit(daily[variable])
+        temperature_unit = "°F"
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "daily_units": {"time": "iso8601", "temperature_2m_max": temperature_unit,
+                        "temperature_2m_min": temperature_unit, "precipitation_sum": "mm"},
+        "daily": daily,
+    }
+
+
+def historical_args():
+    # ((lat, lon, start, end, unit), None), or (None, error response)
     lat = request.args.get("lat")
     lon = request.args.get("lon")
     start_date = request.args.get("start_date")
     end_date = request.args.get("end_date")
+    unit = request.args.get("temperature_unit") or session.get("units") or USER_DEFAULTS["units"]
 
     if not all([lat, lon, start_date, end_date]):
         app.logger.warning("Missing required parameters for historical weather.")
-        return jsonify({"error": "Missing required parameters"}), 400
+        return None, (jsonify({"error": "Missing required parameters"}), 400)
+    coords = _coord_args()
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        coords = None
+    if coords is None:
+        return None, (jsonify({"error": "Invalid coordinates or dates"}), 400)
+    if end < start:
+        return None, (jsonify({"error": "end_date is before start_date"}), 400)
+    if (end - start).days + 1 > HISTORICAL_MAX_DAYS:
+        return None, (jsonify({"error": f"At most {HISTORICAL_MAX_DAYS} days per request"}), 400)
+    if unit not in ("celsius", "fahrenheit"):
+        return None, (jsonify({"error": "Invalid unit"}), 400)
+    return (*coords, start, end, unit), None
+
+
+def historical_error(e):
+    if isinstance(e, CircuitOpenError):
+        app.logger.warning("Historical weather API circuit is open, failing fast.")
+        return jsonify({"error": "Historical data is temporarily unavailable"}), 503
+    if isinstance(e, UpstreamError):
+        app.logger.error(f"An error occurred in api_historical_weather: {e}")
+        return jsonify({"error": "Failed to fetch historical data"}), e.status_code or 502
+    app.logger.error(f"An error occurred in api_historical_weather: {e}", exc_info=e)
+    return jsonify({"error": "Failed to fetch historical data"}), 500
 
+
+@app.route("/api/historical_weather")
+@login_required
+def api_historical_weather():
+    app.logger.debug("Accessed /api/historical_weather route.")
+    args, error = historical_args()
+    if error:
+        return error
     try:
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": start_date,
-            "end_date": end_date,
-            "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum",
-        }
-        app.logger.info(f"Requesting historical weather with params: {params}")
-        resp = requests.get("https://archive-api.open-meteo.com/v1/era5", params=params, timeout=10)
-        app.logger.info(f"Historical weather API response status: {resp.status_code}")
-        if resp.ok:
-            return jsonify(resp.json())
-        else:
-            app.logger.error(f"Failed to fetch historical data with status code: {resp.status_code}")
-            return jsonify({"error": "Failed to fetch historical data"}), resp.status_code
+        return jsonify(get_historical_weather(*args))
     except Exception as e:
-        app.logger.error(f"An error occurred in api_historical_weather: {e}", exc_info=True)
-        return jsonify({"error": "Failed to fetch historical data"}), 500
+        return historical_error(e)
 
 if __name__ == "__main__":
     app.run(debug=True)
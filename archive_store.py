@@ -0,0 +1,82 @@
+"""Local store for historical (ERA5) daily weather.
+
+Past days never change once the reanalysis has settled, so every day fetched
+from the archive API is kept in SQLite keyed by rounded coordinate and date.
+A requested range is answered from stored days, and only the gaps are
+fetched.
+"""
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+ARCHIVE_VARIABLES = ("temperature_2m_max", "temperature_2m_min", "precipitation_sum")
+
+
+def missing_ranges(start, end, have):
+    # Contiguous (first, last) date ranges between start and end that are not in ``have``
+    ranges = []
+    first = None
+    day = start
+    while day <= end:
+        if day.isoformat() in have:
+            if first is not None:
+                ranges.append((first, day - timedelta(days=1)))
+                first = None
+        elif first is None:
+            first = day
+        day += timedelta(days=1)
+    if first is not None:
+        ranges.append((first, end))
+    return ranges
+
+
+def split_range(start, end, chunk_days):
+    # Splits a long range so multi-year requests can be fetched in parallel
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + timedelta(days=chunk_days - 1))
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+class ArchiveStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS archive_days (
+                coord TEXT NOT NULL,
+                day TEXT NOT NULL,
+                {", ".join(f"{v} REAL" for v in ARCHIVE_VARIABLES)},
+                PRIMARY KEY (coord, day)
+            ) WITHOUT ROWID
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def read(self, coord, start, end):
+        # {iso date: (temperature_2m_max, temperature_2m_min, precipitation_sum)}
+        rows = self._conn().execute(
+            f"SELECT day, {', '.join(ARCHIVE_VARIABLES)} FROM archive_days WHERE coord = ? AND day BETWEEN ? AND ?",
+            (coord, start.isoformat(), end.isoformat()))
+        return {row[0]: row[1:] for row in rows}
+
+    def write(self, coord, days):
+        # days: {iso date: values tuple}
+        self._conn().executemany(
+            f"INSERT OR REPLACE INTO archive_days (coord, day, {', '.join(ARCHIVE_VARIABLES)}) VALUES (?, ?, ?, ?, ?)",
+            [(coord, day, *values) for day, values in days.items()])
+
+
+def settled_before():
+    # ERA5 lags real time by about five days; later days may still be revised
+    return date.today() - timedelta(days=7)
@@ -0,0 +1,458 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+The routes that spend their time waiting on upstream APIs (/api/data,
+/api/location_weather, /api/weather_alerts and /api/historical_weather)
+are served by coroutines, so one process holds as many of them in flight
+as the upstreams allow rather than one per thread. So is /api/stream,
+whose connections mostly sit idle between refreshes; up to
+ASGI_STREAM_MAX_CLIENTS of them are kept open per process. Their upstream calls go
+through UPSTREAM.aget (httpx) and the cache's async single-flight; request
+parsing, payloads and responses are the same functions app.py uses, run
+inside a Flask request context so sessions, hooks and metrics behave as
+under WSGI. Every other route runs the WSGI app on a thread pool.
+
+``app:app`` under gunicorn is unchanged and stays the default; this mode
+needs the packages in requirements-async.txt.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Response, jsonify, redirect, request, session, url_for
+
+from app import (
+    app, CACHE, UPSTREAM, BATCH_SIZE, PAGE_DEADLINE, USER_DEFAULTS, OPENWEATHERMAP_API_KEY,
+    OPEN_METEO_URL, OPEN_METEO_AIR_QUALITY_URL, OPEN_METEO_ARCHIVE_URL, OPENWEATHERMAP_URL, REVERSE_GEOCODE_URL,
+    CURRENT_PARAMS, DAILY_PARAMS, AIR_QUALITY_PARAMS, LOCATION_GRID, INVALID_COORDINATES,
+    coord_key, snap_to_grid, open_meteo_params, read_open_meteo_batch, parse_current_weather, parse_daily_forecast,
+    parse_air_quality, daily_forecast_keys, air_quality_keys, alerts_params, read_weather_alerts, place_params,
+    read_place_name, archive_params, read_archive_days, archive_gaps, store_archive_days, historical_result,
+    ARCHIVE_FETCH_CONCURRENCY,
+    historical_args, historical_error, SOURCES, finish_cities_data, snapshot_entries, add_live_entries, dashboard_response,
+    location_unit, location_place, session_cities, _coord_args, HUB, REFRESHER, STREAM_MAX_AGE, STREAM_KEEPALIVE,
+    dashboard_data,
+)
+from refresher import Snapshot
+from stream import format_event
+
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+STREAM_MAX_CLIENTS = int(os.getenv("ASGI_STREAM_MAX_CLIENTS", "5000"))
+
+# Upstream calls that miss the page deadline keep running so their results
+# still reach the cache, as they do on the threaded path
+_background = set()
+
+
+def _keep_running(task):
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def afetch_open_meteo_batch(upstream, url, coords, params, api_name="Open-Meteo API"):
+    app.logger.debug(f"Requesting {api_name} for {len(coords)} location(s)")
+    resp = await UPSTREAM.aget(upstream, url, params=open_meteo_params(coords, params), timeout=5)
+    return read_open_meteo_batch(resp, coords, api_name)
+
+
+async def afetch_current_weather_batch(coords):
+    return [parse_current_weather(wj) for wj in
+            await afetch_open_meteo_batch("forecast", OPEN_METEO_URL, coords, CURRENT_PARAMS)]
+
+
+async def afetch_daily_forecast_batch(coords):
+    return [parse_daily_forecast(wj) for wj in
+            await afetch_open_meteo_batch("forecast", OPEN_METEO_URL, coords, DAILY_PARAMS)]
+
+
+async def afetch_air_quality_batch(coords):
+    return [parse_air_quality(aq_json) for aq_json in await afetch_open_meteo_batch(
+        "air_quality", OPEN_METEO_AIR_QUALITY_URL, coords, AIR_QUALITY_PARAMS, "Open-Meteo Air Quality API")]
+
+
+def abatch_loader(fetch_batch, coords_by_key):
+    # Adapts an afetch_*_batch function to WeatherCache.aload_many
+    async def load(keys):
+        try:
+            return dict(zip(keys, await fetch_batch([coords_by_key[k] for k in keys])))
+        except Exception as e:
+            app.logger.error(f"An error occurred in {fetch_batch.__name__}: {e}", exc_info=True)
+            return {}
+    return load
+
+
+async def aget_current_weather_many(coords):
+    keys = [coord_key(lat, lon) for lat, lon in coords]
+    found, stale = await CACHE.aload_many("current", keys, abatch_loader(afetch_current_weather_batch, dict(zip(keys, coords))))
+    return [found.get(key) for key in keys], [key in stale for key in keys]
+
+
+async def aget_daily_forecast_many(coords):
+    keys, start, end = daily_forecast_keys(coords)
+    found, stale = await CACHE.aload_many("daily", keys, abatch_loader(afetch_daily_forecast_batch, dict(zip(keys, coords))))
+    return [found[key].between(start, end) if key in found else [] for key in keys], [key in stale for key in keys]
+
+
+async def aget_air_quality_many(coords):
+    now = datetime.utcnow()
+    keys = air_quality_keys(coords, now)
+    hourly, stale = await CACHE.aload_many("aqi", keys, abatch_loader(afetch_air_quality_batch, dict(zip(keys, coords))))
+    return [hourly[key].at(now) if key in hourly else None for key in keys], [key in stale for key in keys]
+
+
+async def aload_weather_alerts(lat, lon):
+    # Coroutine version of app.load_weather_alerts
+    if not OPENWEATHERMAP_API_KEY:
+        app.logger.warning("OPENWEATHERMAP_API_KEY is not set. Skipping weather alerts.")
+        return [], False
+
+    async def load():
+        return read_weather_alerts(await UPSTREAM.aget("alerts", OPENWEATHERMAP_URL, params=alerts_params(lat, lon), timeout=5))
+    try:
+        return await CACHE.aload("alerts", coord_key(lat, lon), load)
+    except Exception as e:
+        app.logger.error(f"An error occurred in aget_weather_alerts: {e}", exc_info=True)
+        return None, False
+
+
+async def aget_weather_alerts(lat, lon):
+    return (await aload_weather_alerts(lat, lon))[0] or []
+
+
+async def aget_place_name(lat, lon):
+    async def load():
+        return read_place_name(await UPSTREAM.aget("geocode", REVERSE_GEOCODE_URL, params=place_params(lat, lon), timeout=5))
+    try:
+        return await CACHE.aget_or_load("place", coord_key(lat, lon), load)
+    except Exception as e:
+        app.logger.error(f"An error occurred in aget_place_name: {e}", exc_info=True)
+        return ""
+
+
+async def aget_cities_data(cities, unit="celsius", deadline=PAGE_DEADLINE):
+    # Coroutine version of app.get_cities_data
+    unit = unit or USER_DEFAULTS["units"]
+    coords = [(city["lat"], city["lon"]) for city in cities]
+    chunks = []
+    for start in range(0, len(coords), BATCH_SIZE):
+        chunk = coords[start:start + BATCH_SIZE]
+        chunks.append((start,) + tuple(asyncio.ensure_future(get_many(chunk)) for get_many in
+                                       (aget_current_weather_many, aget_daily_forecast_many, aget_air_quality_many)))
+    alerts_tasks = [asyncio.ensure_future(aload_weather_alerts(lat, lon)) for lat, lon in coords]
+
+    tasks = [t for chunk in chunks for t in chunk[1:]] + alerts_tasks
+    done, not_done = await asyncio.wait(tasks, timeout=deadline)
+    if not_done:
+        app.logger.warning(f"{len(not_done)} of {len(tasks)} upstream calls missed the {deadline}s page deadline")
+        for task in not_done:
+            _keep_running(task)
+
+    values = {source: [None] * len(cities) for source in SOURCES}
+    stale = {source: [False] * len(cities) for source in SOURCES}
+    for start, *source_tasks in chunks:
+        for source, task in zip(SOURCES, source_tasks):
+            if task in done:
+                chunk_values, chunk_stale = task.result()
+                values[source][start:start + len(chunk_values)] = chunk_values
+                stale[source][start:start + len(chunk_stale)] = chunk_stale
+    for i, task in enumerate(alerts_tasks):
+        if task in done:
+            values["alerts"][i], stale["alerts"][i] = task.result()
+    return finish_cities_data(cities, unit, values, stale)
+
+
+async def afetch_archive_days(lat, lon, start, end):
+    app.logger.debug(f"Requesting historical weather for {lat},{lon} {start} to {end}")
+    resp = await UPSTREAM.aget("archive", OPEN_METEO_ARCHIVE_URL, params=archive_params(lat, lon, start, end), timeout=10)
+    return read_archive_days(resp)
+
+
+async def aget_historical_weather(lat, lon, start, end, unit="celsius"):
+    # The local archive is SQLite, so it is read and written off the event loop
+    # (as in app.get_historical_weather: bounded chunk concurrency, and what
+    # arrived is stored even if a chunk fails)
+    lat, lon, days, gaps = await asyncio.to_thread(archive_gaps, lat, lon, start, end)
+    if gaps:
+        slots = asyncio.Semaphore(ARCHIVE_FETCH_CONCURRENCY)
+        errors = []
+
+        async def fetch(first, last):
+            async with slots:
+                if errors:
+                    return {}
+                try:
+                    return await afetch_archive_days(lat, lon, first, last)
+                except Exception as e:
+                    errors.append(e)
+                    return {}
+        fetched = {}
+        for part in await asyncio.gather(*(fetch(first, last) for first, last in gaps)):
+            fetched.update(part)
+        await asyncio.to_thread(store_archive_days, lat, lon, days, fetched)
+        if errors:
+            raise errors[0]
+    return historical_result(lat, lon, start, end, days, unit)
+
+
+def login_required(view):
+    async def wrapped():
+        if not session.get("user"):
+            app.logger.debug(f"User not logged in, redirecting {request.path} to login.")
+            return redirect(url_for("login", next=request.path))
+        return await view()
+    return wrapped
+
+
+@login_required
+async def api_data():
+    app.logger.debug("Accessed /api/data route.")
+    cities = session_cities()
+    unit = session.get("units") or USER_DEFAULTS["units"]
+    entries, live = snapshot_entries(cities)
+    if live:
+        add_live_entries(entries, live, await aget_cities_data([cities[i] for i in live]))
+    return dashboard_response(cities, unit, entries)
+
+
+@login_required
+async def api_stream():
+    # Coroutine version of app.api_stream; the response body is an async
+    # generator that Application.serve_async sends as it yields
+    if REFRESHER.interval <= 0:
+        return "", 204
+    cities = session_cities()
+    unit = session.get("units") or USER_DEFAULTS["units"]
+    loop = asyncio.get_running_loop()
+    sub = HUB.subscribe((Snapshot.key(c["id"]) for c in cities), unit, limit=STREAM_MAX_CLIENTS, loop=loop)
+    if sub is None:
+        return "", 204
+    try:
+        entries, live = snapshot_entries(cities)
+        if live:
+            add_live_entries(entries, live, await aget_cities_data([cities[i] for i in live]))
+    except BaseException:
+        HUB.unsubscribe(sub)
+        raise
+    initial = dashboard_data(cities, unit, entries)
+
+    async def events():
+        yield "retry: 5000\n"
+        yield format_event("snapshot", initial)
+        closes_at = loop.time() + STREAM_MAX_AGE
+        while not sub.closed and loop.time() < closes_at:
+            try:
+                yield await asyncio.wait_for(sub.queue.get(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+    # An (empty) iterator as the WSGI body, so no Content-Length is set
+    response = Response(iter(()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.async_body = events()
+    response.call_on_close(lambda: HUB.unsubscribe(sub))
+    return response
+
+
+@login_required
+async def api_location_weather():
+    coords = _coord_args()
+    if coords is None:
+        return jsonify(INVALID_COORDINATES), 400
+    lat, lon = snap_to_grid(*coords, LOCATION_GRID)
+    unit = location_unit()
+    name, results = await asyncio.gather(aget_place_name(lat, lon), aget_cities_data([location_place(lat, lon)], unit))
+    return jsonify(dict(results[0], name=name, lat=lat, lon=lon, units=unit))
+
+
+@login_required
+async def api_weather_alerts():
+    coords = _coord_args()
+    if coords is None:
+        return jsonify(INVALID_COORDINATES), 400
+    return jsonify({"alerts": await aget_weather_alerts(*snap_to_grid(*coords, LOCATION_GRID))})
+
+
+@login_required
+async def api_historical_weather():
+    app.logger.debug("Accessed /api/historical_weather route.")
+    args, error = historical_args()
+    if error:
+        return error
+    try:
+        return jsonify(await aget_historical_weather(*args))
+    except Exception as e:
+        return historical_error(e)
+
+
+ASYNC_ROUTES = {
+    "/api/data": api_data,
+    "/api/stream": api_stream,
+    "/api/location_weather": api_location_weather,
+    "/api/weather_alerts": api_weather_alerts,
+    "/api/historical_weather": api_historical_weather,
+}
+
+
+def build_environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf8").decode("latin1"),
+        "PATH_INFO": path.encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _response_start(status, headers):
+    return {"type": "http.response.start", "status": status,
+            "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]}
+
+
+class Application:
+    """ASGI app that serves ``routes`` (path -> coroutine view) natively
+    and hands every other request to ``flask_app`` on a thread pool."""
+
+    def __init__(self, flask_app, routes, wsgi_threads=16):
+        self.flask_app = flask_app
+        self.routes = routes
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        environ = build_environ(scope, bytes(body))
+        view = self.routes.get(environ["PATH_INFO"]) if scope["method"] in ("GET", "HEAD") else None
+        if view is None:
+            await self.serve_wsgi(environ, send)
+        else:
+            await self.serve_async(view, environ, send, receive)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await UPSTREAM.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def serve_async(self, view, environ, send, receive):
+        # The same request lifecycle Flask's wsgi_app runs, with the view awaited
+        flask_app = self.flask_app
+        ctx = flask_app.request_context(environ)
+        error = None
+        try:
+            ctx.push()
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            response = flask_app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = flask_app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+        body = getattr(response, "async_body", None)
+        start = _response_start(response.status_code, response.get_wsgi_headers(environ).to_wsgi_list())
+        if body is None:
+            await send(start)
+            await send({"type": "http.response.body", "body": b"".join(response.get_app_iter(environ))})
+            return
+        # Streamed: chunks go out as the generator yields them, until it
+        # ends or the client goes away
+        disconnected = asyncio.ensure_future(_disconnected(receive))
+        try:
+            await send(start)
+            while True:
+                chunk = asyncio.ensure_future(body.__anext__())
+                await asyncio.wait((chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    chunk.cancel()
+                    await asyncio.wait((chunk,))
+                    break
+                try:
+                    data = chunk.result().encode()
+                except StopAsyncIteration:
+                    await send({"type": "http.response.body"})
+                    break
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+        finally:
+            disconnected.cancel()
+            await body.aclose()
+            response.close()
+
+    async def serve_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            # Body chunks are sent as the app yields them, so streamed
+            # responses (/api/stream) work
+            start = []
+
+            def start_response(status, headers, exc_info=None):
+                start[:] = [_response_start(int(status.split(" ", 1)[0]), headers)]
+
+            result = self.flask_app.wsgi_app(environ, start_response)
+            try:
+                started = False
+                for chunk in result:
+                    if not started:
+                        send_from_thread(start[0])
+                        started = True
+                    if chunk:
+                        send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+                if not started:
+                    send_from_thread(start[0])
+                send_from_thread({"type": "http.response.body"})
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        await loop.run_in_executor(self.executor, run)
+
+
+application = Application(app, ASYNC_ROUTES, WSGI_THREADS)
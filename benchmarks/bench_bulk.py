@@ -0,0 +1,79 @@
+"""Bulk lookups: the whole list at once vs. streamed per city.
+
+For each list size, with a cold cache: get_cities_data (what /api/data
+does for a dashboard) returns every city together, while
+iter_cities_data (/api/bulk) yields each one as it completes. Reports the
+time to the first and the last city and the upstream calls made.
+
+    python benchmarks/bench_bulk.py --latency 0.2 --sizes 50,200,500
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstream import FakeUpstream
+
+
+def places(app_module, n):
+    # Distinct grid squares, so no two share a cache entry
+    return [app_module.location_place(round(-60 + (i // 360) * 0.5, 1), round(-180 + i % 360, 1)) for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every upstream response")
+    parser.add_argument("--sizes", default="50,200,500")
+    parser.add_argument("--in-flight", type=int, default=2, help="chunks fetched at once by the streamed version")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(latency=args.latency).start()
+    os.environ.update(upstream.env())
+    os.environ["REFRESH_INTERVAL"] = "0"
+    # The app's stores and catalogue files go to a scratch directory, not
+    # the checkout
+    workdir = tempfile.mkdtemp(prefix="bench-bulk-")
+    os.environ.update({
+        "USER_STORE_URL": f"sqlite:///{os.path.join(workdir, 'users.db')}",
+        "USERS_JSON_PATH": os.path.join(workdir, "users.json"),
+        "ARCHIVE_DB_PATH": os.path.join(workdir, "archive.db"),
+        "SNAPSHOT_PATH": os.path.join(workdir, "snapshot.json"),
+        "REFRESH_LOCK_PATH": os.path.join(workdir, "refresher.lock"),
+        "CITY_CATALOGUE_PACK": os.path.join(workdir, "cities.pack"),
+        "CITY_CATALOGUE_INDEX": os.path.join(workdir, "cities.index"),
+    })
+    import app as app_module
+    app_module.app.logger.setLevel(logging.ERROR)
+
+    print(f"upstream latency {args.latency * 1000:.0f} ms, pool size {app_module.FETCH_WORKERS}, "
+          f"batch size {app_module.BATCH_SIZE}")
+    print(f"{'cities':>6} {'mode':<9} {'first ms':>9} {'last ms':>9} {'calls':>6}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        page = places(app_module, n)
+        for mode in ("whole", "streamed"):
+            app_module.CACHE.clear()
+            calls = upstream.calls
+            t0 = time.perf_counter()
+            if mode == "whole":
+                app_module.get_cities_data(page, "celsius", deadline=60)
+                first = last = time.perf_counter() - t0
+            else:
+                first = None
+                for _ in app_module.iter_cities_data(page, "celsius", deadline=60, chunks_in_flight=args.in_flight):
+                    if first is None:
+                        first = time.perf_counter() - t0
+                last = time.perf_counter() - t0
+            print(f"{n:>6} {mode:<9} {first * 1000:>9.0f} {last * 1000:>9.0f} {upstream.calls - calls:>6}")
+
+    upstream.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""City catalogue: one JSON file vs. the precompiled per-country pack.
+
+Start-up: parsing static/cities.json (what the server did, and what
+building the search index still does) against mapping cities.pack, with
+the memory each keeps alive. Transfer: the bytes a browser downloads for
+the whole file against the manifest plus one country's shard, per
+content coding.
+
+    python benchmarks/bench_catalogue.py
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalogue import CataloguePack, MANIFEST, build
+from cities import ALL_CITIES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATALOGUE_JSON = os.path.join(ROOT, "static", "cities.json")
+
+
+def load_json():
+    with open(CATALOGUE_JSON, "r", encoding="utf-8-sig") as f:
+        return json.load(f)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        kept = fn()
+        times.append(time.perf_counter() - started)
+        if hasattr(kept, "close"):
+            kept.close()
+    return statistics.median(times) * 1000
+
+
+def retained(fn):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fn()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    if hasattr(kept, "close"):
+        kept.close()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pack", help="existing pack to measure (default: build a fresh one)")
+    args = parser.parse_args()
+
+    pack_path = args.pack
+    if pack_path is None:
+        pack_path = os.path.join(tempfile.mkdtemp(), "cities.pack")
+        build(pack_path, ALL_CITIES, CATALOGUE_JSON)
+
+    print(f"{'start-up':<28} {'ms':>8} {'bytes kept':>12}")
+    for name, fn in (("parse cities.json", load_json), ("map cities.pack", lambda: CataloguePack(pack_path))):
+        print(f"{name:<28} {timed(fn, args.repeat):>8.2f} {retained(fn):>12}")
+
+    pack = CataloguePack(pack_path)
+    with open(CATALOGUE_JSON, "rb") as f:
+        whole = f.read()
+    shards = sorted((len(pack.get(name)[0]), name) for name in pack.toc if name != MANIFEST)
+    median_shard = shards[len(shards) // 2][1]
+    largest_shard = shards[-1][1]
+
+    def size(name, coding):
+        # None when the pack has no such variant (no brotli package at build time)
+        body, stored, _ = pack.get(name, [coding])
+        return len(body) if stored == coding else None
+
+    print()
+    print(f"{'transfer (bytes)':<28} {'identity':>10} {'gzip':>10} {'br':>10}")
+    print(f"{'cities.json':<28} {len(whole):>10} {len(gzip.compress(whole, 6)):>10} {'-':>10}")
+    for label, shard in (("manifest + median shard", median_shard), ("manifest + largest shard", largest_shard)):
+        row = []
+        for coding in ("identity", "gzip", "br"):
+            sizes = [size(MANIFEST, coding), size(shard, coding)]
+            row.append(sum(sizes) if None not in sizes else "-")
+        print(f"{label:<28} {row[0]:>10} {row[1]:>10} {row[2]:>10}")
+    print(f"({len(shards)} shards; median {median_shard}, largest {largest_shard})")
+    pack.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Page latency of the concurrent city fetch vs. the old serial loop.
+
+Run from the repository root:
+
+    python benchmarks/bench_fanout.py --latency 0.2
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_upstream import FakeUpstream
+
+
+def serial_page(app_module, cities, unit):
+    # What index()/api_data() did before: blocking calls per city, in turn
+    results = []
+    for city in cities:
+        weather, forecast = app_module.get_forecast_data(city["lat"], city["lon"], unit)
+        air_quality = app_module.get_air_quality_data(city["lat"], city["lon"])
+        alerts = app_module.get_weather_alerts(city["lat"], city["lon"])
+        results.append(app_module.build_city_result(city, weather, forecast, air_quality, alerts))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to every upstream response")
+    parser.add_argument("--sizes", default="1,2,5,10,20,30,60,120")
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(latency=args.latency).start()
+    os.environ.update(upstream.env())
+    os.environ["REFRESH_INTERVAL"] = "0"
+    # The app's stores and catalogue files go to a scratch directory, not
+    # the checkout
+    workdir = tempfile.mkdtemp(prefix="bench-fanout-")
+    os.environ.update({
+        "USER_STORE_URL": f"sqlite:///{os.path.join(workdir, 'users.db')}",
+        "USERS_JSON_PATH": os.path.join(workdir, "users.json"),
+        "ARCHIVE_DB_PATH": os.path.join(workdir, "archive.db"),
+        "SNAPSHOT_PATH": os.path.join(workdir, "snapshot.json"),
+        "REFRESH_LOCK_PATH": os.path.join(workdir, "refresher.lock"),
+        "CITY_CATALOGUE_PACK": os.path.join(workdir, "cities.pack"),
+        "CITY_CATALOGUE_INDEX": os.path.join(workdir, "cities.index"),
+    })
+    import app as app_module
+    app_module.app.logger.setLevel(logging.WARNING)
+
+    cities = app_module.ALL_CITIES
+    print(f"upstream latency {args.latency * 1000:.0f} ms, pool size {app_module.FETCH_WORKERS}")
+    print(f"{'cities':>6} {'serial ms':>10} {'calls':>6} {'concurrent ms':>14} {'calls':>6}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        page = (cities * (n // len(cities) + 1))[:n]
+        serial_ms = float("nan")
+        serial_calls = 0
+        if not args.skip_serial:
+            app_module.CACHE.clear()
+            calls = upstream.calls
+            t0 = time.perf_counter()
+            serial_page(app_module, page, "celsius")
+            serial_ms = (time.perf_counter() - t0) * 1000
+            serial_calls = upstream.calls - calls
+        app_module.CACHE.clear()
+        calls = upstream.calls
+        t0 = time.perf_counter()
+        app_module.get_cities_data(page, "celsius")
+        concurrent_ms = (time.perf_counter() - t0) * 1000
+        concurrent_calls = upstream.calls - calls
+        print(f"{n:>6} {serial_ms:>10.0f} {serial_calls:>6} {concurrent_ms:>14.0f} {concurrent_calls:>6}")
+
+    upstream.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
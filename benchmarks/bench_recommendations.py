@@ -0,0 +1,114 @@
+"""Cost of the recommendation rule table vs. the old if/elif chains.
+
+The old chains only ran for current conditions (three calls per city); the
+rule table also covers the five forecast days, so both are shown per page
+of cities.
+
+    python benchmarks/bench_recommendations.py --cities 6,50,500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommendations import RecommendationEngine
+
+RAIN = [51, 53, 55, 61, 63, 65, 80, 81, 82]
+
+
+# The hand-written chains this replaced, kept here as the baseline
+def old_outfit(temperature_c, weather_code):
+    if temperature_c is None or weather_code is None:
+        return "N/A"
+    if weather_code in [95]:
+        return "Stay indoors or wear waterproof gear!"
+    elif weather_code in RAIN:
+        return "Don't forget your umbrella and a waterproof jacket!"
+    elif temperature_c < 0:
+        return "Bundle up! Heavy coat, hat, gloves, and warm boots."
+    elif 0 <= temperature_c < 10:
+        return "Warm jacket, sweater, and long pants."
+    elif 10 <= temperature_c < 20:
+        return "Light jacket or sweater, long-sleeved shirt."
+    elif 20 <= temperature_c < 25:
+        return "T-shirt and shorts/light pants. Maybe a light cover-up."
+    else:
+        return "Light clothing, like shorts and a t-shirt. Stay cool!"
+
+
+def old_activity(temperature_c, weather_code):
+    if temperature_c is None or weather_code is None:
+        return "N/A"
+    if weather_code in RAIN + [95]:
+        return "Great day for indoor activities: read a book, watch a movie, or visit a museum!"
+    elif temperature_c < 5:
+        return "Consider indoor sports, hot yoga, or a cozy cafe visit."
+    elif 5 <= temperature_c < 18:
+        return "Perfect weather for a walk, hiking, or cycling!"
+    elif 18 <= temperature_c < 28:
+        return "Enjoy outdoor activities like picnics, swimming, or park visits!"
+    else:
+        return "Head to the beach, go for a swim, or enjoy some ice cream!"
+
+
+def old_tip(weather_code):
+    if weather_code is None:
+        return "N/A"
+    if weather_code in [95]:
+        return "Seek shelter immediately during a thunderstorm!"
+    elif weather_code in RAIN:
+        return "Drive safely in wet conditions. Reduce speed and increase following distance."
+    elif weather_code in [45, 48]:
+        return "Visibility is low due to fog. Drive carefully and use fog lights."
+    else:
+        return "Check the forecast regularly and stay informed!"
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", default="6,50,500")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = RecommendationEngine.from_file(
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recommendations.json"))
+    rng = random.Random(1)
+    codes = [0, 1, 2, 3, 45, 48, 51, 61, 63, 80, 95]
+
+    print(f"{'cities':>6} {'old current us':>15} {'table current us':>17} {'table current+5d us':>20}")
+    for n in [int(x) for x in args.cities.split(",")]:
+        # One current reading plus five forecast days per city
+        rows = [(rng.choice(codes), rng.uniform(-15, 38)) for _ in range(n * 6)]
+        current = rows[::6]
+        current_codes = [c for c, _ in current]
+        current_temps = [t for _, t in current]
+        all_codes = [c for c, _ in rows]
+        all_temps = [t for _, t in rows]
+
+        def old_page():
+            for code, temperature in current:
+                old_outfit(temperature, code)
+                old_activity(temperature, code)
+                old_tip(code)
+
+        def table_page(codes, temps):
+            return lambda: engine.evaluate_all(codes, temps)
+
+        old_us = timed(old_page, args.repeat)
+        current_us = timed(table_page(current_codes, current_temps), args.repeat)
+        full_us = timed(table_page(all_codes, all_temps), args.repeat)
+        print(f"{n:>6} {old_us:>15.1f} {current_us:>17.1f} {full_us:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Memory per cached city: parsed JSON lists/dicts vs. columnar Series.
+
+Builds the "aqi" (one UTC day of hourly air quality) and "daily" (six days
+of forecast) cache values for many cities both ways, from JSON decoded the
+way the app decodes upstream responses, and reports the bytes each city
+keeps alive (tracemalloc) and the pickled size the in-process cache counts
+against CACHE_MAX_BYTES.
+
+    python benchmarks/bench_series_memory.py --cities 1000
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from series import Series
+
+AIR_QUALITY_FIELDS = {name: name for name in ("european_aqi", "pm10", "pm2_5", "pollen_grass", "pollen_tree", "pollen_weed")}
+DAILY_FIELDS = {"weathercode": "weathercode", "temp_max": "temperature_2m_max",
+                "temp_min": "temperature_2m_min", "uv_index": "uv_index_max"}
+
+
+def responses(rng):
+    # Raw response bodies with distinct values, like real cities
+    today = date.today()
+    hourly = {"time": [f"{today.isoformat()}T{h:02d}:00" for h in range(24)],
+              "european_aqi": [rng.randint(5, 120) for _ in range(24)]}
+    for name in ("pm10", "pm2_5", "pollen_grass", "pollen_tree", "pollen_weed"):
+        hourly[name] = [round(rng.uniform(0, 80), 1) for _ in range(24)]
+    daily = {"time": [(today + timedelta(days=i)).isoformat() for i in range(6)],
+             "weathercode": [rng.choice([0, 1, 2, 3, 45, 61, 80, 95]) for _ in range(6)],
+             "temperature_2m_max": [round(rng.uniform(5, 35), 1) for _ in range(6)],
+             "temperature_2m_min": [round(rng.uniform(-5, 20), 1) for _ in range(6)],
+             "uv_index_max": [round(rng.uniform(0, 10), 2) for _ in range(6)]}
+    return json.dumps({"hourly": hourly}), json.dumps({"daily": daily})
+
+
+def old_values(aq_body, daily_body):
+    # What the cache held before: the hourly object as decoded, and the
+    # forecast copied out into five small dicts
+    daily = json.loads(daily_body)["daily"]
+    forecast = [{"date": daily["time"][i], "weathercode": daily["weathercode"][i],
+                 "temp_max": daily["temperature_2m_max"][i], "temp_min": daily["temperature_2m_min"][i],
+                 "uv_index": daily["uv_index_max"][i]} for i in range(1, 6)]
+    return json.loads(aq_body)["hourly"], forecast
+
+
+def new_values(aq_body, daily_body):
+    return (Series.from_open_meteo(json.loads(aq_body)["hourly"], AIR_QUALITY_FIELDS),
+            Series.from_open_meteo(json.loads(daily_body)["daily"], DAILY_FIELDS, time_key="date", time_format="%Y-%m-%d"))
+
+
+def measure(build, bodies):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(*b) for b in bodies]
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    pickled = sum(len(pickle.dumps(v, pickle.HIGHEST_PROTOCOL)) for pair in kept for v in pair)
+    return retained / len(bodies), pickled / len(bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    bodies = [responses(rng) for _ in range(args.cities)]
+    print(f"{'layout':>8} {'bytes/city in memory':>21} {'bytes/city pickled':>19}")
+    for name, build in (("dicts", old_values), ("series", new_values)):
+        retained, pickled = measure(build, bodies)
+        print(f"{name:>8} {retained:>21.0f} {pickled:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Write throughput of the user store backends under concurrent updates.
+
+Each writer toggles units and adds/removes a city for its own user, the
+same writes the app makes on /api/user/units and /api/user/cities.
+
+    python benchmarks/bench_user_store.py --users 200 --threads 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cities import ALL_CITIES
+from user_store import make_user_store
+
+DEFAULTS = {"selected_cities": ALL_CITIES[:6], "units": "celsius"}
+
+
+def seed(url, users):
+    store = make_user_store(url, DEFAULTS, legacy_json_path="")
+    for i in range(users):
+        store.create(f"user{i}", dict(DEFAULTS, password_hash="x"))
+
+
+def write_loop(store, usernames, ops):
+    city = ALL_CITIES[-1]
+    for i in range(ops):
+        username = usernames[i % len(usernames)]
+        if i % 3 == 0:
+            store.set_units(username, "fahrenheit" if i % 2 else "celsius")
+        elif i % 3 == 1:
+            store.add_city(username, city)
+        else:
+            store.remove_city(username, city)
+
+
+def process_write_loop(url, usernames, ops):
+    write_loop(make_user_store(url, DEFAULTS, legacy_json_path=""), usernames, ops)
+
+
+def run_threads(url, users, threads, ops):
+    # Threads share one store, as gunicorn's threads share the app's
+    store = make_user_store(url, DEFAULTS, legacy_json_path="")
+    workers = [threading.Thread(target=write_loop, args=(store, [f"user{j}" for j in range(t, users, threads)], ops))
+               for t in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+def run_processes(url, users, processes, ops):
+    workers = [multiprocessing.Process(target=process_write_loop, args=(url, [f"user{j}" for j in range(p, users, processes)], ops))
+               for p in range(processes)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return processes * ops / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=300, help="writes per thread/process")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        print(f"{args.users} users, {args.ops} writes per writer")
+        print(f"{'backend':>8} {'mode':>16} {'writes/s':>10}")
+        for backend in ("json", "sqlite"):
+            path = os.path.join(workdir, f"users.{backend}")
+            url = f"{backend}:///{path}"
+            seed(url, args.users)
+            rate = run_threads(url, args.users, args.threads, args.ops)
+            print(f"{backend:>8} {f'{args.threads} threads':>16} {rate:>10.0f}")
+            if backend == "sqlite":
+                # The JSON store keeps state in memory and is not multi-process safe
+                rate = run_processes(url, args.users, args.processes, args.ops)
+                print(f"{backend:>8} {f'{args.processes} processes':>16} {rate:>10.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
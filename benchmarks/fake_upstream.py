@@ -0,0 +1,182 @@
+"""Local stand-in for the Open-Meteo, OpenWeatherMap and reverse geocoding APIs.
+
+Serves canned responses shaped like the real ones so the app can be
+benchmarked without touching the network. Every response is delayed by
+``latency`` seconds and a fraction ``error_rate`` of them are 503s.
+Call counts per route are served at ``/__stats``.
+
+Run standalone (used by loadtest.py):
+
+    python benchmarks/fake_upstream.py --port 8900 --latency 0.1 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def forecast_payload(query):
+    today = date.today()
+    days = [(today + timedelta(days=i)).isoformat() for i in range(6)]
+    return {
+        "current": {
+            "temperature_2m": 18.4,
+            "weather_code": 2,
+            "windspeed_10m": 11.2,
+            "winddirection_10m": 240,
+            "dewpoint_2m": 9.1,
+            "visibility": 24140.0,
+        },
+        "daily": {
+            "time": days,
+            "weathercode": [2, 3, 61, 0, 1, 80],
+            "temperature_2m_max": [21.0, 19.5, 16.2, 22.8, 24.1, 18.0],
+            "temperature_2m_min": [12.3, 11.0, 9.8, 13.4, 14.9, 10.2],
+            "uv_index_max": [5.1, 3.2, 1.8, 6.0, 6.4, 2.9],
+        },
+    }
+
+
+def air_quality_payload(query):
+    hours = [f"{date.today().isoformat()}T{h:02d}:00" for h in range(24)]
+    return {
+        "hourly": {
+            "time": hours,
+            "european_aqi": [32] * 24,
+            "pm10": [14.2] * 24,
+            "pm2_5": [8.7] * 24,
+            "pollen_grass": [1.0] * 24,
+            "pollen_tree": [0.4] * 24,
+            "pollen_weed": [0.1] * 24,
+        }
+    }
+
+
+def alerts_payload(query):
+    return {"alerts": []}
+
+
+def reverse_geocode_payload(query):
+    return {"city": f"Place {query['latitude'][0]},{query['longitude'][0]}", "countryName": "Testland"}
+
+
+def era5_payload(query):
+    start = date.fromisoformat(query["start_date"][0])
+    end = date.fromisoformat(query["end_date"][0])
+    days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    return {
+        "daily": {
+            "time": days,
+            "temperature_2m_max": [15.0 + (i % 10) for i in range(len(days))],
+            "temperature_2m_min": [5.0 + (i % 7) for i in range(len(days))],
+            "precipitation_sum": [float(i % 4) for i in range(len(days))],
+        }
+    }
+
+
+ROUTES = {
+    "/v1/forecast": forecast_payload,
+    "/v1/air-quality": air_quality_payload,
+    "/data/3.0/onecall": alerts_payload,
+    "/v1/era5": era5_payload,
+    "/data/reverse-geocode-client": reverse_geocode_payload,
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+
+class FakeUpstream:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.calls_by_route = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/__stats":
+                    self.send_json(200, upstream.stats())
+                    return
+                fail = random.random() < upstream.error_rate
+                with upstream._lock:
+                    upstream.calls += 1
+                    upstream.calls_by_route[url.path] = upstream.calls_by_route.get(url.path, 0) + 1
+                    upstream.errors += fail
+                route = ROUTES.get(url.path)
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                if route is None:
+                    self.send_json(404, {"error": "not found"})
+                    return
+                if fail:
+                    self.send_json(503, {"error": "injected failure"})
+                    return
+                # Multi-location requests get one result per coordinate
+                query = parse_qs(url.query)
+                locations = len(query.get("latitude", [""])[0].split(","))
+                self.send_json(200, [route(query) for _ in range(locations)] if locations > 1 else route(query))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        # Environment overrides that point app.py at this server
+        return {
+            "OPEN_METEO_URL": f"{self.base_url}/v1/forecast",
+            "OPEN_METEO_AIR_QUALITY_URL": f"{self.base_url}/v1/air-quality",
+            "OPEN_METEO_ARCHIVE_URL": f"{self.base_url}/v1/era5",
+            "OPENWEATHERMAP_URL": f"{self.base_url}/data/3.0/onecall",
+            "OPENWEATHERMAP_API_KEY": "fake",
+            "REVERSE_GEOCODE_URL": f"{self.base_url}/data/reverse-geocode-client",
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "by_route": dict(self.calls_by_route)}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    upstream = FakeUpstream(args.host, args.port, args.latency, args.error_rate)
+    print(f"Fake upstream on {upstream.base_url}", flush=True)
+    upstream.server.serve_forever()
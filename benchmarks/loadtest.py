@@ -0,0 +1,313 @@
+"""Throughput and latency of the app under gunicorn against a fake upstream.
+
+Starts fake_upstream.py in its own process, then for each server
+configuration (``workers x threads``, or ``asgi`` for ``uvicorn
+asgi:application``) runs the app in a fresh working directory, which also
+holds its user store, archive, snapshot and catalogue pack/index, so nothing
+is written into the checkout. It logs in ``--sessions`` users and drives `/`,
+`/api/data`, `/api/cities` and `/api/historical_weather` from that many
+concurrent clients for ``--duration`` seconds after a warm-up. Latency
+percentiles, requests/s and upstream calls per request are written as JSON
+so runs can be compared:
+
+    python benchmarks/loadtest.py --configs 1x8,2x8,1x32 --latency 0.1 --output after.json
+    python benchmarks/loadtest.py --compare before.json after.json
+    python benchmarks/loadtest.py --configs 1x8,asgi --sessions 500 --latency 1 --routes /api/location_weather:1
+
+The default configuration is the Dockerfile's (``--workers 1 --threads 8``).
+Extra app settings can be passed with ``--env KEY=VALUE``.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (route, weight); dashboards poll /api/data far more than anything else
+ROUTES = [
+    ("/", 1),
+    ("/api/data", 6),
+    ("/api/cities", 1),
+    ("/api/historical_weather", 2),
+]
+
+
+def parse_routes(spec):
+    # "/api/data:6,/api/cities:1" -> [("/api/data", 6), ("/api/cities", 1)]
+    return [(route, int(weight)) for route, weight in (item.rsplit(":", 1) for item in spec.split(","))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def historical_path(rng, cities):
+    # A handful of recurring windows, so the archive sees both repeats and
+    # overlapping new ranges
+    city = rng.choice(cities)
+    end = date.today() - timedelta(days=10 + 30 * rng.randrange(12))
+    start = end - timedelta(days=rng.choice((7, 30, 365)))
+    return (f"/api/historical_weather?lat={city['lat']}&lon={city['lon']}"
+            f"&start_date={start.isoformat()}&end_date={end.isoformat()}")
+
+
+def location_path(rng):
+    # Geolocated users anywhere in the world, so most lookups miss the cache
+    # and wait on the (slow) upstream
+    return f"/api/location_weather?lat={rng.uniform(-60, 70):.4f}&lon={rng.uniform(-180, 180):.4f}"
+
+
+PATHS = {
+    "/api/historical_weather": lambda rng, cities: historical_path(rng, cities),
+    "/api/location_weather": lambda rng, cities: location_path(rng),
+}
+
+
+class Client(threading.Thread):
+    def __init__(self, base_url, username, routes, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.username = username
+        self.stop_at = None
+        self.measure_from = None
+        self.rng = random.Random(seed)
+        self.routes = routes
+        self.latencies = {route: [] for route, _ in routes}
+        self.errors = {route: 0 for route, _ in routes}
+        self.cities = []
+
+    def login(self):
+        r = self.session.post(f"{self.base_url}/register", data={"username": self.username, "password": "loadtest"})
+        r.raise_for_status()
+        self.cities = self.session.get(f"{self.base_url}/api/user/cities").json()
+
+    def run(self):
+        routes = [route for route, _ in self.routes]
+        weights = [weight for _, weight in self.routes]
+        while True:
+            now = time.monotonic()
+            if now >= self.stop_at:
+                return
+            route = self.rng.choices(routes, weights)[0]
+            path = PATHS[route](self.rng, self.cities) if route in PATHS else route
+            started = time.perf_counter()
+            try:
+                ok = self.session.get(self.base_url + path, timeout=60).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if now >= self.measure_from:
+                self.latencies[route].append(elapsed)
+                self.errors[route] += not ok
+
+
+def upstream_stats(upstream_url):
+    return requests.get(f"{upstream_url}/__stats", timeout=5).json()
+
+
+def server_command(config, port):
+    if config == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi:application", "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning", "--no-access-log"]
+    workers, threads = (int(x) for x in config.split("x"))
+    return [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+            "--threads", str(threads), "--timeout", "0", "--graceful-timeout", "5", "--log-level", "warning", "app:app"]
+
+
+def run_config(config, args, upstream_url):
+    workers, threads = (1, None) if config == "asgi" else (int(x) for x in config.split("x"))
+    driven = parse_routes(args.routes)
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "OPEN_METEO_URL": f"{upstream_url}/v1/forecast",
+        "OPEN_METEO_AIR_QUALITY_URL": f"{upstream_url}/v1/air-quality",
+        "OPEN_METEO_ARCHIVE_URL": f"{upstream_url}/v1/era5",
+        "OPENWEATHERMAP_URL": f"{upstream_url}/data/3.0/onecall",
+        "REVERSE_GEOCODE_URL": f"{upstream_url}/data/reverse-geocode-client",
+        "OPENWEATHERMAP_API_KEY": "fake",
+        "USER_STORE_URL": f"sqlite:///{os.path.join(workdir, 'users.db')}",
+        "USERS_JSON_PATH": os.path.join(workdir, "users.json"),
+        "ARCHIVE_DB_PATH": os.path.join(workdir, "archive.db"),
+        "SNAPSHOT_PATH": os.path.join(workdir, "snapshot.json"),
+        "REFRESH_LOCK_PATH": os.path.join(workdir, "refresher.lock"),
+        "CITY_CATALOGUE_PACK": os.path.join(workdir, "cities.pack"),
+        "CITY_CATALOGUE_INDEX": os.path.join(workdir, "cities.index"),
+        # The app is imported from the checkout but runs in the working directory
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+    })
+    env.update(kv.split("=", 1) for kv in args.env)
+    server = subprocess.Popen(
+        server_command(config, port), cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}"
+        clients = [Client(base_url, f"load{i}", driven, seed=i) for i in range(args.sessions)]
+        for client in clients:
+            client.login()
+
+        # The clock starts once everyone is logged in, however long that took
+        measure_from = time.monotonic() + args.warmup
+        stop_at = measure_from + args.duration
+        for client in clients:
+            client.stop_at, client.measure_from = stop_at, measure_from
+
+        # Clients run through the warm-up too (unmeasured); upstream calls
+        # are counted over the measured window only
+        for client in clients:
+            client.start()
+        time.sleep(max(0.0, measure_from - time.monotonic()))
+        before = upstream_stats(upstream_url)
+        for client in clients:
+            client.join()
+            client.session.close()
+        after = upstream_stats(upstream_url)
+        elapsed = args.duration
+
+        routes = {}
+        all_latencies, all_errors = [], 0
+        for route, _ in driven:
+            latencies = [x for c in clients for x in c.latencies[route]]
+            errors = sum(c.errors[route] for c in clients)
+            routes[route] = summarize(latencies, errors, elapsed)
+            all_latencies += latencies
+            all_errors += errors
+        total = summarize(all_latencies, all_errors, elapsed)
+        upstream_calls = after["calls"] - before["calls"]
+        total["upstream_calls"] = upstream_calls
+        total["upstream_calls_per_request"] = round(upstream_calls / total["requests"], 3) if total["requests"] else None
+        return {"config": config, "workers": workers, "threads": threads, "total": total, "routes": routes}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results):
+    print(f"{'config':>8} {'route':<24} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for result in results:
+        rows = [("total", result["total"])] + list(result["routes"].items())
+        for route, r in rows:
+            print(f"{result['config']:>8} {route:<24} {r['rps']:>8} {r['p50_ms']!s:>8} {r['p95_ms']!s:>8} "
+                  f"{r['p99_ms']!s:>8} {r['errors']:>7}")
+        print(f"{'':>8} upstream calls/request: {result['total']['upstream_calls_per_request']}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = {r["config"]: r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = {r["config"]: r for r in json.load(f)["results"]}
+    print(f"{'config':>8} {'metric':<28} {'before':>10} {'after':>10} {'change':>8}")
+    for config in before.keys() & after.keys():
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "upstream_calls_per_request"):
+            old, new = before[config]["total"][metric], after[config]["total"][metric]
+            change = f"{(new - old) / old * 100:+.0f}%" if old and new is not None else "–"
+            print(f"{config:>8} {metric:<28} {old!s:>10} {new!s:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--configs", default="1x8", help="comma-separated gunicorn workers x threads, or asgi")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent logged-in clients")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per config")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring starts")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to every upstream response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream responses that fail")
+    parser.add_argument("--routes", default=",".join(f"{r}:{w}" for r, w in ROUTES),
+                        help="comma-separated route:weight to drive")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to the app")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    parser.add_argument("--verbose", action="store_true", help="show the server's stderr")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_upstream.py"), "--port", str(upstream_port),
+         "--latency", str(args.latency), "--error-rate", str(args.error_rate)],
+        stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(upstream_port)
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+        results = [run_config(config, args, upstream_url) for config in args.configs.split(",")]
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=10)
+
+    print_results(results)
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.time(),
+                "sessions": args.sessions,
+                "duration": args.duration,
+                "latency": args.latency,
+                "error_rate": args.error_rate,
+                "routes": args.routes,
+                "env": args.env,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Precompiled city catalogue shards for the browser.
+
+``python catalogue.py`` compiles static/cities.json (country -> city names)
+into a single pack file. The pack holds one compact JSON shard per country
+with the dashboard cities in that country and the rest of its catalogue
+names, plus a manifest listing the shards. Each file is stored as is and
+pre-compressed with gzip and, when the brotli package is installed,
+brotli. Shard names include a hash of their content, so browsers may cache
+them for good; only the small manifest is revalidated.
+
+The server memory-maps the pack. Only the table of contents is decoded at
+start-up, and shard bodies are sliced out of the mapping when requested.
+The table of contents records a hash of the sources (``source_hash``), so
+a pack compiled from an older cities.json or cities.py is rebuilt rather
+than served.
+"""
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+MAGIC = b"WXCAT002"
+HEADER = struct.Struct("<8sI") # magic, table of contents length
+MANIFEST = "manifest.json"
+# Smallest first; identity is always stored
+ENCODINGS = ("br", "gzip", "identity")
+
+
+def _slug(country):
+    return re.sub(r"[^a-z0-9]+", "-", country.lower()).strip("-") or "country"
+
+
+def _json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compile_shards(cities, catalogue):
+    # {file name: body}. Countries with dashboard cities but no catalogue
+    # entry still get a shard.
+    dashboard = {}
+    for city in cities:
+        dashboard.setdefault(city["country"], []).append(city)
+    files = {}
+    countries = []
+    for country in sorted(set(catalogue) | set(dashboard)):
+        tracked = sorted(dashboard.get(country, []), key=lambda c: c["name"])
+        known = {c["name"] for c in tracked}
+        names = [name for name in catalogue.get(country, []) if name not in known]
+        body = _json({"country": country, "cities": tracked, "names": names})
+        name = f"{_slug(country)}.{hashlib.sha256(body).hexdigest()[:12]}.json"
+        files[name] = body
+        countries.append({"name": country, "count": len(tracked) + len(names), "file": name})
+    files[MANIFEST] = _json({"countries": countries})
+    return files
+
+
+def source_hash(cities, catalogue_path):
+    # Changes whenever the dashboard cities or the catalogue file do
+    digest = hashlib.sha256(_json(cities))
+    with open(catalogue_path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _variants(body):
+    variants = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    # A compressed copy that isn't smaller isn't worth sending
+    return {encoding: data for encoding, data in variants.items() if encoding == "identity" or len(data) < len(body)}
+
+
+def write_pack(path, files, source=None):
+    toc = {}
+    blobs = []
+    offset = 0
+    for name, body in files.items():
+        entry = {"etag": hashlib.sha256(body).hexdigest()[:16]}
+        for encoding, data in _variants(body).items():
+            entry[encoding] = (offset, len(data))
+            blobs.append(data)
+            offset += len(data)
+        toc[name] = entry
+    toc_bytes = _json({"source": source, "files": toc})
+    # Written next to the target and renamed, so running workers never map
+    # a half-written pack
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(toc_bytes)))
+            f.write(toc_bytes)
+            for data in blobs:
+                f.write(data)
+        # mkstemp creates the file 0600; the server may run as another user
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def build(path, cities, catalogue_path):
+    with open(catalogue_path, "r", encoding="utf-8-sig") as f:
+        catalogue = json.load(f)
+    files = compile_shards(cities, catalogue)
+    write_pack(path, files, source_hash(cities, catalogue_path))
+    return files
+
+
+class CataloguePack:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, toc_size = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a catalogue pack (or an older format)")
+        self._base = HEADER.size + toc_size
+        toc = json.loads(self._map[HEADER.size:self._base])
+        self.source = toc["source"]
+        self.toc = toc["files"]
+
+    def get(self, name, accepted=()):
+        # (body, encoding, etag) of the smallest stored variant among
+        # ``accepted`` content codings, or None for an unknown file. Each
+        # variant has its own strong ETag, since their bytes differ.
+        entry = self.toc.get(name)
+        if entry is None:
+            return None
+        for encoding in ENCODINGS:
+            if encoding in entry and (encoding == "identity" or encoding in accepted):
+                offset, size = entry[encoding]
+                start = self._base + offset
+                etag = entry["etag"] if encoding == "identity" else f"{entry['etag']}-{encoding}"
+                return self._map[start:start + size], encoding, etag
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == "__main__":
+    # Compile the pack: python catalogue.py [output path]
+    import sys
+    from cities import ALL_CITIES
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "cities.pack")
+    files = build(output, ALL_CITIES, os.path.join(here, "static", "cities.json"))
+    print(f"Wrote {len(files) - 1} country shards ({os.path.getsize(output)} bytes"
+          f"{', no brotli package' if brotli is None else ''}) to {output}")
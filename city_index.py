@@ -0,0 +1,210 @@
+"""Search and nearest-city lookups over the city catalogue.
+
+Two indexes are built: one over the dashboard cities from cities.py
+(which have ids, coordinates and timezones) and one that adds the much
+larger name-only catalogue in static/cities.json. Names are searchable by
+word prefix and, for queries of three or more characters, by substring
+through a trigram index; countries are matched the same way. Nearest-city
+lookups use a k-d tree over the cities with coordinates.
+
+A catalogue index remembers the hash of the sources it was built from
+(catalogue.source_hash), so a precompiled one that no longer matches them
+can be told apart and rebuilt.
+"""
+import bisect
+import heapq
+import json
+import math
+import pickle
+import unicodedata
+from array import array
+from itertools import chain, islice
+
+from catalogue import source_hash
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def normalize(text):
+    # Case- and accent-insensitive form used for every comparison
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold().strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _KDTree:
+    """3-d tree over points on the unit sphere; chord length orders points
+    the same way as great-circle distance."""
+
+    def __init__(self, points):
+        # points: list of ((x, y, z), record index)
+        self.root = self._build(points, 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        return (points[mid], axis, self._build(points[:mid], depth + 1), self._build(points[mid + 1:], depth + 1))
+
+    def nearest(self, xyz, k):
+        heap = [] # max-heap of (-squared distance, record index)
+
+        def visit(node):
+            if node is None:
+                return
+            (point, idx), axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(point, xyz))
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, idx))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, idx))
+            diff = xyz[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [idx for _, idx in sorted(heap, reverse=True)]
+
+
+class CityIndex:
+    """Name/country search plus nearest-city lookup over ``records``.
+
+    Records are dicts with at least ``name`` and ``country``; the ones with
+    ``lat``/``lon`` are also geo-indexed. Record ids are assigned in name
+    order, so a page of results never needs a full sort.
+    """
+
+    def __init__(self, records, source=None):
+        self.source = source
+        records = sorted(records, key=lambda r: (normalize(r["name"]), normalize(r.get("country"))))
+        self.records = records
+        self.names = [normalize(r["name"]) for r in records]
+
+        # Sorted (word, record) lists for prefix lookups on any word of the
+        # name, e.g. "york" finds "New York"
+        tokens = sorted((word, idx) for idx, name in enumerate(self.names) for word in set(name.split()))
+        self.token_words = [w for w, _ in tokens]
+        self.token_ids = array("I", (i for _, i in tokens))
+
+        postings = {}
+        for idx, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(idx)
+        self.trigram_postings = {gram: array("I", ids) for gram, ids in postings.items()}
+
+        # A few hundred countries at most, each with its members in id order
+        members = {}
+        for idx, r in enumerate(records):
+            members.setdefault(normalize(r.get("country")), []).append(idx)
+        self.country_members = {country: array("I", ids) for country, ids in members.items()}
+        self.country_of = [normalize(r.get("country")) for r in records]
+
+        self.geo = _KDTree([(to_xyz(r["lat"], r["lon"]), idx) for idx, r in enumerate(records) if r.get("lat") is not None])
+
+    @classmethod
+    def from_catalogue(cls, cities, catalogue_path):
+        # Dashboard cities plus every name in the country -> names catalogue
+        # that isn't already one of them
+        records = [dict(c) for c in cities]
+        seen = {(normalize(c["name"]), normalize(c.get("country"))) for c in cities}
+        with open(catalogue_path, "r", encoding="utf-8-sig") as f:
+            catalogue = json.load(f)
+        for country, names in catalogue.items():
+            for name in names:
+                key = (normalize(name), normalize(country))
+                if key not in seen:
+                    seen.add(key)
+                    records.append({"name": name, "country": country})
+        return cls(records, source_hash(cities, catalogue_path))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _name_matches(self, q):
+        if len(q) < 3:
+            start = bisect.bisect_left(self.token_words, q)
+            end = bisect.bisect_left(self.token_words, q + "\uffff", start)
+            return set(self.token_ids[start:end])
+        lists = sorted((self.trigram_postings.get(g) for g in trigrams(q)), key=lambda p: len(p) if p else 0)
+        if not lists[0]:
+            return set()
+        candidates = set(lists[0])
+        for postings in lists[1:]:
+            candidates.intersection_update(postings)
+        # Trigrams can match out of order; confirm the substring
+        return {i for i in candidates if q in self.names[i]}
+
+    def _matching_countries(self, q):
+        if len(q) < 3:
+            return [c for c in self.country_members if any(w.startswith(q) for w in c.split())]
+        return [c for c in self.country_members if q in c]
+
+    def search(self, query, offset=0, limit=20):
+        # Ranked: exact name, name prefix, name substring, then country-only
+        # matches; alphabetical within each rank. Returns (total, page).
+        q = normalize(query)
+        if not q:
+            return len(self.records), self.records[offset:offset + limit]
+
+        name_matches = self._name_matches(q)
+        countries = self._matching_countries(q)
+        country_set = set(countries)
+        total = len(name_matches) + sum(len(self.country_members[c]) for c in countries)
+        total -= sum(1 for i in name_matches if self.country_of[i] in country_set)
+
+        # Ids are in name order, so every name starting with q (exact match
+        # first) is one contiguous id range
+        start = bisect.bisect_left(self.names, q)
+        end = bisect.bisect_left(self.names, q + "\uffff", start)
+        substring = sorted(i for i in name_matches if not start <= i < end)
+        country_only = (i for i in heapq.merge(*(self.country_members[c] for c in countries))
+                        if i not in name_matches)
+        page = list(islice(chain(range(start, end), substring, country_only), offset, offset + limit))
+        return total, [self.records[i] for i in page]
+
+    def nearest(self, lat, lon, limit=5):
+        results = []
+        for idx in self.geo.nearest(to_xyz(lat, lon), limit):
+            record = self.records[idx]
+            results.append(dict(record, distance_km=round(haversine_km(lat, lon, record["lat"], record["lon"]), 1)))
+        return results
+
+
+if __name__ == "__main__":
+    # Precompile the catalogue index: python city_index.py [output path]
+    import os
+    import sys
+    from cities import ALL_CITIES
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "cities.index")
+    # Pickled under its module name, not __main__, so the app can load it
+    from city_index import CityIndex as ImportedCityIndex
+    index = ImportedCityIndex.from_catalogue(ALL_CITIES, os.path.join(here, "static", "cities.json"))
+    index.save(output)
+    print(f"Wrote {len(index.records)} cities to {output}")
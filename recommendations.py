@@ -0,0 +1,96 @@
+"""Outfit, activity and tip recommendations from a declarative rule table.
+
+Rules live in a JSON file (recommendations.json by default) as an ordered
+list per kind. Each rule has a ``text`` and may restrict itself to a set
+of WMO weather ``codes`` and to a Celsius band ``from`` <= t < ``below``.
+The first matching rule wins, as in an if/elif chain.
+
+On load the rules are compiled into one lookup table per weather code of
+temperature breakpoints and texts for all kinds. Evaluating a reading is
+then a dict lookup and a bisect, and whole batches (every city and every
+forecast day) are evaluated in one pass.
+"""
+import json
+from bisect import bisect_right
+
+KINDS = ("outfit", "activity", "tip")
+WMO_CODES = 100 # WMO weather interpretation codes are 0-99
+NOT_AVAILABLE = "N/A"
+NOT_AVAILABLE_ALL = (NOT_AVAILABLE,) * len(KINDS)
+
+
+def _matches(rule, code, temperature):
+    if "codes" in rule and code not in rule["codes"]:
+        return False
+    return rule.get("from", float("-inf")) <= temperature < rule.get("below", float("inf"))
+
+
+def _compile_code(rules, code):
+    # (breakpoints, texts) where texts[bisect_right(breakpoints, t)] is the
+    # first rule matching (code, t)
+    applicable = [r for r in rules if "codes" not in r or code in r["codes"]]
+    breakpoints = sorted({r[edge] for r in applicable for edge in ("from", "below") if edge in r})
+    texts = []
+    for i in range(len(breakpoints) + 1):
+        # Any temperature in the interval decides it; take its lower edge
+        temperature = breakpoints[i - 1] if i else float("-inf")
+        texts.append(next((r["text"] for r in applicable if _matches(r, code, temperature)), NOT_AVAILABLE))
+    return tuple(breakpoints), tuple(texts)
+
+
+class RecommendationEngine:
+    def __init__(self, rules):
+        kinds = []
+        for kind in KINDS:
+            kinds.append([dict(r, codes=frozenset(r["codes"])) if "codes" in r else r for r in rules[kind]])
+        needs_temperature = [any("from" in r or "below" in r for r in kind_rules) for kind_rules in kinds]
+
+        # One table per code covering all kinds at once: the union of every
+        # kind's breakpoints, with an (outfit, activity, tip) tuple per
+        # interval, so a single bisect answers all three. Codes outside
+        # 0-99 use the ``other`` entry.
+        self.tables = {}
+        self.without_temperature = {}
+        compiled = {}
+        for code in range(WMO_CODES + 1):
+            per_kind = [_compile_code(kind_rules, code) for kind_rules in kinds]
+            breakpoints = sorted({b for kind_breakpoints, _ in per_kind for b in kind_breakpoints})
+            texts = []
+            for i in range(len(breakpoints) + 1):
+                temperature = breakpoints[i - 1] if i else float("-inf")
+                texts.append(tuple(kind_texts[bisect_right(kind_breakpoints, temperature)]
+                                   for kind_breakpoints, kind_texts in per_kind))
+            entry = (tuple(breakpoints), tuple(texts))
+            self.tables[code] = compiled.setdefault(entry, entry)
+            # Kinds that don't look at temperature still answer without one
+            self.without_temperature[code] = tuple(
+                NOT_AVAILABLE if needed else kind_texts[0]
+                for needed, (_, kind_texts) in zip(needs_temperature, per_kind))
+        self.other = self.tables.pop(WMO_CODES)
+        self.other_without_temperature = self.without_temperature.pop(WMO_CODES)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def evaluate_all(self, codes, temperatures):
+        # Parallel sequences of weather codes and Celsius temperatures in,
+        # one (outfit, activity, tip) tuple per position out
+        tables = self.tables
+        other = self.other
+        results = []
+        append = results.append
+        for code, temperature in zip(codes, temperatures):
+            if code is None:
+                append(NOT_AVAILABLE_ALL)
+            elif temperature is None:
+                append(self.without_temperature.get(code, self.other_without_temperature))
+            else:
+                breakpoints, texts = tables.get(code, other)
+                append(texts[bisect_right(breakpoints, temperature)])
+        return results
+
+    def evaluate(self, kind, codes, temperatures):
+        index = KINDS.index(kind)
+        return [texts[index] for texts in self.evaluate_all(codes, temperatures)]
@@ -0,0 +1,169 @@
+"""Background refresh of weather for every tracked city.
+
+One process per host (elected with an flock on ``lock_path``) refreshes the
+union of all users' cities on a fixed cadence and writes the results to a
+snapshot file. Every worker serves page loads from that snapshot, reloading
+it when the file changes, so requests no longer wait on upstream APIs.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Snapshot:
+    """Rolling ``city id -> result`` map shared through a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(city_id):
+        # JSON object keys are strings
+        return str(city_id)
+
+    def get(self, city_id):
+        self._reload()
+        return self.entries.get(self.key(city_id))
+
+    def current(self):
+        # The entries dict is replaced, never mutated, so callers can detect
+        # a change by identity
+        self._reload()
+        return self.entries
+
+    def update(self, results, updated_at):
+        with self._lock:
+            entries = dict(self.entries)
+            for result in results:
+                key = self.key(result["id"])
+                # A partial refresh, or one that could only get old data
+                # (the upstream failed and the cache served an expired
+                # entry), never replaces a complete, current entry
+                if self._degraded(result) and key in entries and not self._degraded(entries[key]["data"]):
+                    continue
+                entries[key] = {"data": result, "updated_at": updated_at}
+            self.entries = entries
+
+    @staticmethod
+    def _degraded(result):
+        return result.get("partial") or result.get("stale")
+
+    def retain(self, keys):
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if k in keys}
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+                self._mtime = mtime
+            except (OSError, ValueError):
+                # Caught mid-replace or truncated; keep the current entries
+                pass
+
+
+class Refresher:
+    """Periodically refreshes ``tracked()`` cities into ``snapshot``.
+
+    ``tracked`` returns a ``{city id: city}`` dict and ``fetch`` is called
+    as ``fetch(cities)`` for each chunk of at most ``chunk_size`` cities,
+    with at most ``concurrency`` chunks in flight.
+    """
+
+    def __init__(self, snapshot, tracked, fetch, interval=300, jitter=0.1,
+                 concurrency=2, chunk_size=50, lock_path=None, logger=None):
+        self.snapshot = snapshot
+        self.tracked = tracked
+        self.fetch = fetch
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.lock_path = lock_path
+        self.logger = logger
+        self.is_leader = False
+        self.last_refresh = None
+        self._lock_file = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="weather-refresher", daemon=True)
+            self._thread.start()
+
+    def _acquire_leadership(self):
+        if self.is_leader:
+            return True
+        if fcntl is None or not self.lock_path:
+            # No cross-process locking available: every process refreshes
+            self.is_leader = True
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held (and the lock kept) for the life of the process
+        self._lock_file = lock_file
+        self.is_leader = True
+        if self.logger:
+            self.logger.info(f"Process {os.getpid()} is the weather refresher for this host.")
+        return True
+
+    def _run(self):
+        # Stagger start-up so restarted workers don't all hit upstream at once
+        time.sleep(random.uniform(0, min(5.0, self.interval * self.jitter)))
+        while True:
+            if self._acquire_leadership():
+                try:
+                    self.refresh_once()
+                except Exception:
+                    if self.logger:
+                        self.logger.exception("Weather refresh failed")
+            time.sleep(self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def refresh_once(self):
+        started = time.time()
+        tracked = self.tracked()
+        cities = list(tracked.values())
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="refresh") as pool:
+            jobs = [pool.submit(self.fetch, cities[start:start + self.chunk_size])
+                    for start in range(0, len(cities), self.chunk_size)]
+            for future in jobs:
+                self.snapshot.update(future.result(), time.time())
+
+        self.snapshot.retain({Snapshot.key(city_id) for city_id in tracked})
+        self.snapshot.save()
+        self.last_refresh = time.time()
+        if self.logger:
+            self.logger.info(f"Refreshed {len(tracked)} tracked cities in {self.last_refresh - started:.2f}s")
@@ -0,0 +1,119 @@
+"""Compact column storage for Open-Meteo hourly and daily series.
+
+Open-Meteo answers with one list per variable. Kept as parsed JSON, every
+value is a separate Python object (a float is 24 bytes plus an 8 byte list
+slot, a timestamp string over 60). A ``Series`` keeps each variable in an
+``array`` instead: 8 bytes per float, 2 per small integer (weather codes,
+AQI) and timestamps as 8 byte UTC epoch seconds. This is what the response
+cache stores; rows are turned back into the app's dicts only when a result
+is built, for one instant (``at``) or a time window (``between``).
+"""
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+INT_NONE = -32768 # Stands for a missing value in "h" columns; floats use NaN
+
+
+def _seconds(when):
+    return int((when - EPOCH).total_seconds())
+
+
+def _pack(values):
+    # Small integers in 2 bytes each, anything else as doubles
+    try:
+        return array("h", [INT_NONE if v is None else v for v in values])
+    except (TypeError, OverflowError):
+        return array("d", [math.nan if v is None else v for v in values])
+
+
+def _restore(times, names, typecodes, data, time_key, time_format):
+    if isinstance(times, tuple):
+        start, step, count = times
+        times = array("q", range(start, start + step * count, step)) if step else array("q", [start] * count)
+    else:
+        times = array("q", times)
+    columns = {}
+    offset = 0
+    for name, typecode in zip(names, typecodes):
+        column = array(typecode)
+        size = column.itemsize * len(times)
+        column.frombytes(data[offset:offset + size])
+        columns[name] = column
+        offset += size
+    return Series(times, columns, time_key, time_format)
+
+
+def _unpack(column, i):
+    value = column[i]
+    if column.typecode == "h":
+        return None if value == INT_NONE else value
+    return None if value != value else value
+
+
+class Series:
+    __slots__ = ("times", "columns", "time_key", "time_format")
+
+    def __init__(self, times, columns, time_key=None, time_format="%Y-%m-%dT%H:%M"):
+        self.times = times # array("q") of UTC epoch seconds, ascending
+        self.columns = columns # output name -> array, in row order
+        self.time_key = time_key # row key for the timestamp, or None to leave it out
+        self.time_format = time_format
+
+    @classmethod
+    def from_open_meteo(cls, block, fields, time_key=None, time_format="%Y-%m-%dT%H:%M"):
+        # ``block`` is an Open-Meteo "hourly"/"daily" object requested with
+        # timezone=UTC; ``fields`` maps output names to its variable names.
+        # Variables missing from the response read as None.
+        stamps = block.get("time") or []
+        times = array("q", [_seconds(datetime.fromisoformat(t)) for t in stamps])
+        columns = {}
+        for name, source in fields.items():
+            values = list(block.get(source) or [])[:len(times)]
+            columns[name] = _pack(values + [None] * (len(times) - len(values)))
+        return cls(times, columns, time_key, time_format)
+
+    def __reduce__(self):
+        # Pickled (for the cache's size accounting and for Redis) as raw
+        # column bytes rather than one array object per column, and a
+        # regular time axis as just its start, step and length
+        times = self.times
+        step = times[1] - times[0] if len(times) > 1 else 0
+        if all(times[i + 1] - times[i] == step for i in range(len(times) - 1)):
+            times = (times[0] if len(times) else 0, step, len(times))
+        else:
+            times = times.tobytes()
+        return (_restore, (times, tuple(self.columns), "".join(c.typecode for c in self.columns.values()),
+                           b"".join(c.tobytes() for c in self.columns.values()), self.time_key, self.time_format))
+
+    def __len__(self):
+        return len(self.times)
+
+    def row(self, i):
+        row = {}
+        if self.time_key:
+            row[self.time_key] = (EPOCH + timedelta(seconds=self.times[i])).strftime(self.time_format)
+        for name, column in self.columns.items():
+            row[name] = _unpack(column, i)
+        return row
+
+    def rows(self, start=0, stop=None):
+        return [self.row(i) for i in range(*slice(start, stop).indices(len(self)))]
+
+    def at(self, when):
+        # The row whose interval (up to the next timestamp) contains ``when``
+        # (a naive UTC datetime), or None when it falls outside the series
+        if len(self.times) < 2:
+            return self.row(0) if len(self.times) == 1 and _seconds(when) == self.times[0] else None
+        seconds = _seconds(when)
+        i = bisect_right(self.times, seconds) - 1
+        step = self.times[-1] - self.times[-2]
+        if i < 0 or (i == len(self.times) - 1 and seconds >= self.times[i] + step):
+            return None
+        return self.row(i)
+
+    def between(self, start, end):
+        # Rows with start <= timestamp < end
+        return self.rows(bisect_left(self.times, _seconds(start)), bisect_left(self.times, _seconds(end)))
@@ -0,0 +1,87 @@
+"""Server-side sessions.
+
+The session cookie only carries a random session id. The session itself
+(user name, units and the ids of the dashboard's cities) lives in one of
+the weather_cache backends: the in-process LRU by default, or Redis so
+that every gunicorn worker and replica sees the same logins.
+"""
+import secrets
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from weather_cache import MISSING
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, written_at=0.0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.written_at = written_at
+        self.replaced_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        # Moves the data to a new id (on login), so an id handed out before
+        # the user authenticated is worthless afterwards
+        if self.sid:
+            self.replaced_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface over a weather_cache backend.
+
+    Sessions expire ``lifetime`` seconds after they were last written. An
+    unchanged session is rewritten once half of that has passed, so active
+    users stay logged in without a store write on every request.
+    """
+
+    def __init__(self, backend, lifetime=7 * 86400):
+        self.backend = backend
+        self.lifetime = lifetime
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.backend.get(sid)
+            if entry is not MISSING:
+                data, written_at = entry
+                return ServerSession(data, sid, written_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.replaced_sid:
+            self.backend.delete(session.replaced_sid)
+
+        if not session:
+            # Emptied (logout): forget it on both ends
+            if session.sid and session.modified:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+
+        now = time.time()
+        if not session.modified and now - session.written_at < self.lifetime / 2:
+            return
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(24)
+        self.backend.set(session.sid, (dict(session), now), self.lifetime)
+        if new or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
@@ -20,76 +20,161 @@ function getWeatherIcon(weatherCode) {
     return WEATHER_ICONS[weatherCode] || "fa-question-circle";
 }
 
+function formatDataAge(seconds) {
+    if (seconds == null) return '—';
+    if (seconds < 60) return 'just now';
+    return `${Math.round(seconds / 60)} min ago`;
+}
+
+// Latest known data per city; stream updates are merged into it
+let cityData = {};
+let cityUpdatedAt = {};
+
+function updateCard(c){
+    const card = document.getElementById('card-'+c.id);
+    if(!card) return;
+    
+    const tempValue = card.querySelector('.temp-value');
+    const windValue = card.querySelector('.wind-value');
+    const uvValue = card.querySelector('.uv-value');
+    const dewpointValue = card.querySelector('.dewpoint-value');
+    const visibilityValue = card.querySelector('.visibility-value');
+    const aqiValue = card.querySelector('.aqi-value');
+    const pm25Value = card.querySelector('.pm25-value');
+    const pm10Value = card.querySelector('.pm10-value');
+    const pollenGrassValue = card.querySelector('.pollen-grass-value');
+    const pollenTreeValue = card.querySelector('.pollen-tree-value');
+    const pollenWeedValue = card.querySelector('.pollen-weed-value');
+
+    tempValue.textContent = c.weather && c.weather.temperature!=null ? c.weather.temperature.toFixed(1) : '—';
+    windValue.textContent = c.weather && c.weather.windspeed!=null ? c.weather.windspeed.toFixed(1) : '—';
+    dewpointValue.textContent = c.weather && c.weather.dewpoint!=null ? c.weather.dewpoint.toFixed(1) : '—';
+    visibilityValue.textContent = c.weather && c.weather.visibility!=null ? (c.weather.visibility / 1000).toFixed(1) : '—'; // Convert meters to km
+    uvValue.textContent = c.forecast && c.forecast.length > 0 && c.forecast[0].uv_index != null ? c.forecast[0].uv_index.toFixed(1) : '—';
+    aqiValue.textContent = c.air_quality && c.air_quality.european_aqi != null ? c.air_quality.european_aqi : '—';
+    pm25Value.textContent = c.air_quality && c.air_quality.pm2_5 != null ? c.air_quality.pm2_5.toFixed(1) : '—';
+    pm10Value.textContent = c.air_quality && c.air_quality.pm10 != null ? c.air_quality.pm10.toFixed(1) : '—';
+    pollenGrassValue.textContent = c.air_quality && c.air_quality.pollen_grass != null ? c.air_quality.pollen_grass : '—';
+    pollenTreeValue.textContent = c.air_quality && c.air_quality.pollen_tree != null ? c.air_quality.pollen_tree : '—';
+    pollenWeedValue.textContent = c.air_quality && c.air_quality.pollen_weed != null ? c.air_quality.pollen_weed : '—';
+    
+    const cityAlertsContainer = card.querySelector('.city-alerts');
+    if (cityAlertsContainer) {
+        cityAlertsContainer.innerHTML = ''; // Clear previous alerts
+        if (c.alerts && c.alerts.length > 0) {
+            c.alerts.forEach(alert => {
+                const alertDiv = document.createElement('div');
+                alertDiv.classList.add('alert-item');
+                alertDiv.innerHTML = `<i class="fas fa-exclamation-triangle"></i> <strong>${alert.event}</strong>: ${alert.description}`;
+                cityAlertsContainer.appendChild(alertDiv);
+            });
+        }
+    }
+
+    const outfitRecommendationValue = card.querySelector('.outfit-recommendation-value');
+    outfitRecommendationValue.textContent = c.outfit_recommendation || '—';
+
+    const activityRecommendationValue = card.querySelector('.activity-recommendation-value');
+    activityRecommendationValue.textContent = c.activity_recommendation || '—';
+
+    const weatherTipValue = card.querySelector('.weather-tip-value');
+    weatherTipValue.textContent = c.weather_tip || '—';
+
+    // updated_at is the refresh time; it stays right when a cached /api/data
+    // body is reused after a 304
+    cityUpdatedAt[c.id] = c.updated_at != null ? c.updated_at * 1000 : null;
+    updateDataAge(card, c.id);
+    card.querySelector('.stale-value').textContent = stalenessNote(c);
+
+    if(c.datetime && c.timezone){
+      cityTimes[c.id] = new Date(c.datetime);
+      cityTimezones[c.id] = c.timezone;
+    } else {
+      cityTimes[c.id] = null;
+      cityTimezones[c.id] = null;
+    }
+    
+    updateForecast(card, c.forecast);
+}
+
+// Sources shown from older data, or not at all, while an upstream is down;
+// same wording as the staleness_note template filter
+const SOURCE_LABELS = { weather: 'current weather', forecast: 'forecast', air_quality: 'air quality', alerts: 'alerts' };
+
+function stalenessNote(c) {
+    const label = sources => sources.map(s => SOURCE_LABELS[s] || s).join(', ');
+    const notes = [];
+    if (c.stale && c.stale.length) notes.push(`older data: ${label(c.stale)}`);
+    if (c.missing && c.missing.length) notes.push(`unavailable: ${label(c.missing)}`);
+    return notes.length ? ` · ${notes.join('; ')}` : '';
+}
+
+function updateDataAge(card, id) {
+    const updatedValue = card.querySelector('.updated-value');
+    const updatedAt = cityUpdatedAt[id];
+    updatedValue.textContent = formatDataAge(updatedAt != null ? (Date.now() - updatedAt) / 1000 : null);
+}
+
+function applyCityData(data) {
+    data.forEach(c => {
+        cityData[c.id] = c;
+        updateCard(c);
+    });
+}
+
 async function fetchData(){
   try{
     const r = await fetch('/api/data'); // Backend now handles unit conversion
     if(!r.ok) return;
-    const data = await r.json();
-    data.forEach(c=>{
-      const card = document.getElementById('card-'+c.id);
-      if(!card) return;
-      
-      const tempValue = card.querySelector('.temp-value');
-      const windValue = card.querySelector('.wind-value');
-      const uvValue = card.querySelector('.uv-value');
-      const dewpointValue = card.querySelector('.dewpoint-value');
-      const visibilityValue = card.querySelector('.visibility-value');
-      const aqiValue = card.querySelector('.aqi-value');
-      const pm25Value = card.querySelector('.pm25-value');
-      const pm10Value = card.querySelector('.pm10-value');
-      const pollenGrassValue = card.querySelector('.pollen-grass-value');
-      const pollenTreeValue = card.querySelector('.pollen-tree-value');
-      const pollenWeedValue = card.querySelector('.pollen-weed-value');
-
-      tempValue.textContent = c.weather && c.weather.temperature!=null ? c.weather.temperature.toFixed(1) : '—';
-      windValue.textContent = c.weather && c.weather.windspeed!=null ? c.weather.windspeed.toFixed(1) : '—';
-      dewpointValue.textContent = c.weather && c.weather.dewpoint!=null ? c.weather.dewpoint.toFixed(1) : '—';
-      visibilityValue.textContent = c.weather && c.weather.visibility!=null ? (c.weather.visibility / 1000).toFixed(1) : '—'; // Convert meters to km
-      uvValue.textContent = c.forecast && c.forecast.length > 0 && c.forecast[0].uv_index != null ? c.forecast[0].uv_index.toFixed(1) : '—';
-      aqiValue.textContent = c.air_quality && c.air_quality.european_aqi != null ? c.air_quality.european_aqi : '—';
-      pm25Value.textContent = c.air_quality && c.air_quality.pm25 != null ? c.air_quality.pm25.toFixed(1) : '—';
-      pm10Value.textContent = c.air_quality && c.air_quality.pm10 != null ? c.air_quality.pm10.toFixed(1) : '—';
-      pollenGrassValue.textContent = c.air_quality && c.air_quality.pollen_grass != null ? c.air_quality.pollen_grass : '—';
-      pollenTreeValue.textContent = c.air_quality && c.air_quality.pollen_tree != null ? c.air_quality.pollen_tree : '—';
-      pollenWeedValue.textContent = c.air_quality && c.air_quality.pollen_weed != null ? c.air_quality.pollen_weed : '—';
-      
-      const cityAlertsContainer = card.querySelector('.city-alerts');
-      if (cityAlertsContainer) {
-          cityAlertsContainer.innerHTML = ''; // Clear previous alerts
-          if (c.alerts && c.alerts.length > 0) {
-              c.alerts.forEach(alert => {
-                  const alertDiv = document.createElement('div');
-                  alertDiv.classList.add('alert-item');
-                  alertDiv.innerHTML = `<i class="fas fa-exclamation-triangle"></i> <strong>${alert.event}</strong>: ${alert.description}`;
-                  cityAlertsContainer.appendChild(alertDiv);
-              });
-          }
-      }
-
-      const outfitRecommendationValue = card.querySelector('.outfit-recommendation-value');
-      outfitRecommendationValue.textContent = c.outfit_recommendation || '—';
-
-      const activityRecommendationValue = card.querySelector('.activity-recommendation-value');
-      activityRecommendationValue.textContent = c.activity_recommendation || '—';
-
-      const weatherTipValue = card.querySelector('.weather-tip-value');
-      weatherTipValue.textContent = c.weather_tip || '—';
-
-      if(c.datetime && c.timezone){
-        cityTimes[c.id] = new Date(c.datetime);
-        cityTimezones[c.id] = c.timezone;
-      } else {
-        cityTimes[c.id] = null;
-        cityTimezones[c.id] = null;
-      }
-      
-      updateForecast(card, c.forecast);
-    });
+    applyCityData(await r.json());
   } catch(e) {
     console.error('update failed', e);
   }
 }
 
+// Live updates: the server pushes only the fields that changed, once per
+// refresh. If streaming isn't available the page polls every 60s instead.
+let updateStream = null;
+let pollTimer = null;
+
+function startPolling() {
+    if (!pollTimer) pollTimer = setInterval(fetchData, 60000);
+}
+
+function startUpdates() {
+    if (updateStream) updateStream.close();
+    if (!window.EventSource) {
+        fetchData();
+        startPolling();
+        return;
+    }
+    updateStream = new EventSource('/api/stream');
+    updateStream.addEventListener('snapshot', e => {
+        clearInterval(pollTimer);
+        pollTimer = null;
+        applyCityData(JSON.parse(e.data));
+    });
+    updateStream.addEventListener('update', e => {
+        const update = JSON.parse(e.data);
+        const c = Object.assign({}, cityData[update.id], update.changes, { updated_at: update.updated_at });
+        applyCityData([c]);
+    });
+    updateStream.addEventListener('refreshed', e => {
+        const refreshed = JSON.parse(e.data).updated_at;
+        Object.keys(refreshed).forEach(id => {
+            cityUpdatedAt[id] = refreshed[id] * 1000;
+        });
+    });
+    updateStream.onerror = () => {
+        // CLOSED means the server declined (204) or went away for good;
+        // otherwise EventSource is already reconnecting
+        if (updateStream.readyState === EventSource.CLOSED) {
+            fetchData();
+            startPolling();
+        }
+    };
+}
+
 function updateForecast(card, forecast) {
     const forecastContainer = card.querySelector('.forecast-container');
     if (!forecastContainer || !forecast || forecast.length === 0) {
@@ -101,7 +186,7 @@ function updateForecast(card, forecast) {
     const unitSymbol = currentUnits === 'celsius' ? 'C' : 'F';
     forecast.forEach(day => {
         forecastHTML += `
-            <div class="forecast-day">
+            <div class="forecast-day" title="${day.outfit_recommendation || ''}">
                 <div class="forecast-date">${getDayOfWeek(day.date)}</div>
                 <div class="forecast-icon"><i class="fas ${getWeatherIcon(day.weathercode)}"></i></div>
                 <div class="forecast-temp">
@@ -121,6 +206,7 @@ function updateTimes(){
     if(!initialTime || !tz) return;
     const card = document.getElementById('card-'+id);
     if(!card) return;
+    updateDataAge(card, id);
     const timeValue = card.querySelector('.time-value');
     
     // Use Intl.DateTimeFormat for reliable time formatting
@@ -140,11 +226,7 @@ function updateTimes(){
   });
 }
 
-// initial fetch and every 60s
-fetchData();
-setInterval(fetchData, 60000);
-
-// update times every second
+// update times and data ages every second
 setInterval(updateTimes, 1000);
 
 const weatherMap = document.getElementById("weather-map");
@@ -194,11 +276,13 @@ const modal = document.getElementById("city-modal");
 const editCitiesBtn = document.getElementById("edit-cities-btn");
 const closeBtn = document.querySelector(".close-btn");
 const citySearch = document.getElementById("city-search");
+const countrySelect = document.getElementById("country-select");
 const cityList = document.getElementById("city-list");
 const citiesGrid = document.querySelector(".cities-grid");
 
-let allCities = [];
+let cityResults = [];
 let selectedCities = [];
+let citySearchTimer = null;
 
 const toggleTempUnitBtn = document.getElementById("toggle-temp-unit");
 const currentUnitDisplay = document.getElementById("current-unit-display");
@@ -245,18 +329,37 @@ function renderDashboard() {
             <div class="activity-recommendation"><i class="fas fa-running"></i> Activity: <span class="activity-recommendation-value">—</span></div>
             <div class="weather-tip"><i class="fas fa-lightbulb"></i> Tip: <span class="weather-tip-value">—</span></div>
             <div class="forecast-container"></div>
+            <div class="updated"><i class="fas fa-history"></i> Updated: <span class="updated-value">—</span><span class="stale-value"></span></div>
         `;
-        cityCard.addEventListener('click', () => {
-            updateMap(city.lat, city.lon, currentMapLayer);
-            fetchHistoricalData(city.lat, city.lon);
-        });
+        attachCardHandlers(cityCard, city);
         citiesGrid.appendChild(cityCard);
     });
-    fetchData();
+    // Reconnect so the stream follows the current cities and units
+    startUpdates();
+}
+
+function attachCardHandlers(cityCard, city) {
+    cityCard.addEventListener('click', () => {
+        updateMap(city.lat, city.lon, currentMapLayer);
+        fetchHistoricalData(city.lat, city.lon);
+    });
+}
+
+// The first page load comes with server-rendered cards; reuse them when they
+// match the user's cities instead of rebuilding the grid
+function hydrateDashboard() {
+    const cards = citiesGrid.querySelectorAll('.city-card');
+    if (cards.length !== selectedCities.length ||
+        selectedCities.some((city, i) => cards[i].id !== `card-${city.id}`)) {
+        return false;
+    }
+    selectedCities.forEach((city, i) => attachCardHandlers(cards[i], city));
+    startUpdates();
+    return true;
 }
 
 async function openModal() {
-    await Promise.all([fetchAllCities(), fetchSelectedCities()]);
+    await Promise.all([searchCities(), fetchSelectedCities(), fetchCountries()]);
     renderCityList();
     modal.style.display = "block";
 }
@@ -265,14 +368,53 @@ function closeModal() {
     modal.style.display = "none";
 }
 
-async function fetchAllCities() {
+async function searchCities() {
     try {
-        const r = await fetch('/api/cities');
+        const q = encodeURIComponent(citySearch.value.trim());
+        const r = await fetch(`/api/cities/search?q=${q}&per_page=50`);
         if (r.ok) {
-            allCities = await r.json();
+            cityResults = (await r.json()).results;
         }
     } catch (e) {
-        console.error('Failed to fetch all cities', e);
+        console.error('Failed to search cities', e);
+    }
+}
+
+// The catalogue comes as one shard per country, listed in a manifest; a
+// shard is only downloaded when its country is picked, and is cached by
+// the browser for good since its name changes with its content
+let catalogueCountries = null;
+
+async function fetchCountries() {
+    if (catalogueCountries) {
+        return;
+    }
+    try {
+        const r = await fetch('/catalogue/manifest.json');
+        if (r.ok) {
+            catalogueCountries = (await r.json()).countries;
+            catalogueCountries.forEach(country => {
+                const option = document.createElement("option");
+                option.value = country.file;
+                option.textContent = `${country.name} (${country.count})`;
+                countrySelect.appendChild(option);
+            });
+        }
+    } catch (e) {
+        console.error('Failed to fetch the city catalogue', e);
+    }
+}
+
+async function browseCountry(file) {
+    try {
+        const r = await fetch(`/catalogue/${file}`);
+        if (r.ok) {
+            const shard = await r.json();
+            // Dashboard cities first; the rest are names only and can't be added
+            cityResults = shard.cities.concat(shard.names.map(name => ({ name, country: shard.country })));
+        }
+    } catch (e) {
+        console.error('Failed to fetch catalogue shard', e);
     }
 }
 
@@ -288,18 +430,17 @@ async function fetchSelectedCities() {
 }
 
 function renderCityList() {
-    const searchTerm = citySearch.value.toLowerCase();
     cityList.innerHTML = '';
-    
-    const filteredCities = allCities.filter(city =>
-        city.name.toLowerCase().includes(searchTerm) ||
-        (city.country && city.country.toLowerCase().includes(searchTerm))
-    );
 
-    filteredCities.forEach(city => {
+    cityResults.forEach(city => {
         const li = document.createElement("li");
         const isSelected = selectedCities.some(sc => sc.id === city.id);
         
+        if (city.id === undefined) {
+            li.innerHTML = `<span>${city.name}, ${city.country}</span>`;
+            cityList.appendChild(li);
+            return;
+        }
         li.innerHTML = `
             <span>${city.name}, ${city.country}</span>
             <button class="${isSelected ? 'remove-btn' : 'add-btn'}" data-city-id="${city.id}">
@@ -358,7 +499,19 @@ async function removeCity(city) {
 
 editCitiesBtn.addEventListener("click", openModal);
 closeBtn.addEventListener("click", closeModal);
-citySearch.addEventListener("input", renderCityList);
+citySearch.addEventListener("input", () => {
+    // Search server-side, debounced to one request per pause in typing
+    clearTimeout(citySearchTimer);
+    countrySelect.value = "";
+    citySearchTimer = setTimeout(() => searchCities().then(renderCityList), 150);
+});
+countrySelect.addEventListener("change", () => {
+    if (countrySelect.value) {
+        browseCountry(countrySelect.value).then(renderCityList);
+    } else {
+        searchCities().then(renderCityList);
+    }
+});
 window.addEventListener("click", (event) => {
     if (event.target == modal) {
         closeModal();
@@ -395,7 +548,7 @@ toggleTempUnitBtn.addEventListener("click", async () => {
 
 // Initial load
 fetchSelectedCities().then(() => {
-    renderDashboard();
+    if (!hydrateDashboard()) renderDashboard();
     populateHistoricalCitySelect();
     if (selectedCities.length > 0) {
         updateMap(selectedCities[0].lat, selectedCities[0].lon, currentMapLayer); // Initial map view
@@ -452,53 +605,36 @@ function getCurrentLocationWeather() {
 
 async function fetchCurrentLocationWeather(lat, lon) {
     try {
-        const [weatherResp, locationResp, airQualityResp, alertsResp] = await Promise.all([
-            fetch(`https://api.open-meteo.com/v1/forecast?latitude=${lat}&longitude=${lon}&current=temperature_2m,dewpoint_2m,visibility&hourly=uv_index&temperature_unit=${currentUnits}&forecast_days=1`),
-            fetch(`https://api.bigdatacloud.net/data/reverse-geocode-client?latitude=${lat}&longitude=${lon}&localityLanguage=en`),
-            fetch(`https://air-quality-api.open-meteo.com/v1/air-quality?latitude=${lat}&longitude=${lon}&hourly=european_aqi,pm10,pm2_5,pollen_grass,pollen_tree,pollen_weed&forecast_days=1&timezone=UTC`),
-            fetch(`/api/weather_alerts?lat=${lat}&lon=${lon}`) // New API endpoint for alerts
-        ]);
-
-        if (weatherResp.ok && locationResp.ok && airQualityResp.ok && alertsResp.ok) {
-            const weatherData = await weatherResp.json();
-            const locationData = await locationResp.json();
-            const airQualityData = await airQualityResp.json();
-            const alertsData = await alertsResp.json();
-
-            const cityName = locationData.city;
+        // One server call; the server snaps the position to its location grid
+        const resp = await fetch(`/api/location_weather?lat=${lat}&lon=${lon}&units=${currentUnits}`);
+        if (resp.ok) {
+            const data = await resp.json();
+            const weather = data.weather || {};
+            const airQuality = data.air_quality || {};
+            const uvIndex = data.forecast && data.forecast.length > 0 ? data.forecast[0].uv_index : null;
+            const unitSymbol = data.units === 'fahrenheit' ? 'F' : 'C';
             const date = new Date().toLocaleDateString('en-US', { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric' });
-            
-            const currentHour = new Date().getHours();
-            const uvIndex = weatherData.hourly.uv_index[currentHour];
-            const aqi = airQualityData.hourly.european_aqi[currentHour];
-            const pm25 = airQualityData.hourly.pm2_5[currentHour];
-            const pm10 = airQualityData.hourly.pm10[currentHour];
-            const pollenGrass = airQualityData.hourly.pollen_grass[currentHour];
-            const pollenTree = airQualityData.hourly.pollen_tree[currentHour];
-            const pollenWeed = airQualityData.hourly.pollen_weed[currentHour];
-            const currentTemp = weatherData.current.temperature_2m;
-            const currentWeatherCode = weatherData.current.weather_code;
-            
-            document.getElementById('current-location-name').textContent = cityName;
-            document.getElementById('current-location-temp').textContent = `${weatherData.current.temperature_2m.toFixed(1)}°${currentUnits === 'celsius' ? 'C' : 'F'}`;
-            document.getElementById('current-location-dewpoint').textContent = `${weatherData.current.dewpoint_2m.toFixed(1)}°${currentUnits === 'celsius' ? 'C' : 'F'}`;
-            document.getElementById('current-location-visibility').textContent = `${(weatherData.current.visibility / 1000).toFixed(1)} km`;
-            document.getElementById('current-location-uv-index').textContent = uvIndex.toFixed(1);
-            document.getElementById('current-location-aqi').textContent = aqi != null ? aqi : '—';
-            document.getElementById('current-location-pm25').textContent = pm25 != null ? pm25.toFixed(1) : '—';
-            document.getElementById('current-location-pm10').textContent = pm10 != null ? pm10.toFixed(1) : '—';
-            document.getElementById('current-location-pollen-grass').textContent = pollenGrass != null ? pollenGrass : '—';
-            document.getElementById('current-location-pollen-tree').textContent = pollenTree != null ? pollenTree : '—';
-            document.getElementById('current-location-pollen-weed').textContent = pollenWeed != null ? pollenWeed : '—';
-            document.getElementById('current-location-outfit').textContent = weatherData.outfit_recommendation || '—'; // Assuming backend provides this
-            document.getElementById('current-location-activity').textContent = weatherData.activity_recommendation || '—'; // Assuming backend provides this
-            document.getElementById('current-location-weather-tip').textContent = weatherData.weather_tip || '—'; // Assuming backend provides this
+
+            document.getElementById('current-location-name').textContent = data.name || `${data.lat.toFixed(2)}, ${data.lon.toFixed(2)}`;
+            document.getElementById('current-location-temp').textContent = weather.temperature != null ? `${weather.temperature.toFixed(1)}°${unitSymbol}` : '—';
+            document.getElementById('current-location-dewpoint').textContent = weather.dewpoint != null ? `${weather.dewpoint.toFixed(1)}°${unitSymbol}` : '—';
+            document.getElementById('current-location-visibility').textContent = weather.visibility != null ? `${(weather.visibility / 1000).toFixed(1)} km` : '—';
+            document.getElementById('current-location-uv-index').textContent = uvIndex != null ? uvIndex.toFixed(1) : '—';
+            document.getElementById('current-location-aqi').textContent = airQuality.european_aqi != null ? airQuality.european_aqi : '—';
+            document.getElementById('current-location-pm25').textContent = airQuality.pm2_5 != null ? airQuality.pm2_5.toFixed(1) : '—';
+            document.getElementById('current-location-pm10').textContent = airQuality.pm10 != null ? airQuality.pm10.toFixed(1) : '—';
+            document.getElementById('current-location-pollen-grass').textContent = airQuality.pollen_grass != null ? airQuality.pollen_grass : '—';
+            document.getElementById('current-location-pollen-tree').textContent = airQuality.pollen_tree != null ? airQuality.pollen_tree : '—';
+            document.getElementById('current-location-pollen-weed').textContent = airQuality.pollen_weed != null ? airQuality.pollen_weed : '—';
+            document.getElementById('current-location-outfit').textContent = data.outfit_recommendation || '—';
+            document.getElementById('current-location-activity').textContent = data.activity_recommendation || '—';
+            document.getElementById('current-location-weather-tip').textContent = data.weather_tip || '—';
             document.getElementById('current-location-date').textContent = date;
 
             const globalAlertsContainer = document.getElementById('global-alerts-container');
             globalAlertsContainer.innerHTML = ''; // Clear previous alerts
-            if (alertsData.alerts && alertsData.alerts.length > 0) {
-                alertsData.alerts.forEach(alert => {
+            if (data.alerts && data.alerts.length > 0) {
+                data.alerts.forEach(alert => {
                     const alertDiv = document.createElement('div');
                     alertDiv.classList.add('alert-item');
                     alertDiv.innerHTML = `<i class="fas fa-exclamation-triangle"></i> <strong>${alert.event}</strong>: ${alert.description}`;
@@ -0,0 +1,146 @@
+"""Server-sent event fan-out of snapshot changes.
+
+One watcher thread per process notices when the refresher's snapshot
+changes (a refresh in this process or a reload of another worker's file),
+diffs each city's entry against the previous one and pushes the changed
+fields to every subscribed stream. The diff is computed once per changed
+city and its serialised event once per unit, however many clients are
+watching.
+
+Subscriptions made with an event ``loop`` (the ASGI entry point's
+streams) get an asyncio queue filled through that loop, so a stream costs
+a coroutine rather than a thread.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+
+# Recomputed by the client from the timezone; never worth an event
+IGNORED_FIELDS = ("datetime",)
+
+
+def diff_fields(old, new):
+    return {k: v for k, v in new.items() if k not in IGNORED_FIELDS and old.get(k) != v}
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    def __init__(self, keys, unit, max_queue=256, loop=None):
+        self.keys = set(keys)
+        self.unit = unit
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue) if loop is not None else queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def push(self, message):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put, message)
+        else:
+            self._put(message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except (queue.Full, asyncio.QueueFull):
+            # Too far behind; the client reconnects and gets a fresh snapshot
+            self.closed = True
+
+
+class UpdateHub:
+    """Watches ``snapshot`` every ``poll_interval`` seconds and publishes
+    ``update`` events (changed fields of one city) and ``refreshed`` events
+    (cities re-fetched without any change) to subscriptions.
+
+    Snapshot data is stored in one unit; ``present(data, unit)`` converts it
+    for each subscriber's unit.
+    """
+
+    def __init__(self, snapshot, present=None, poll_interval=2.0, logger=None):
+        self.snapshot = snapshot
+        self.present = present
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.subscriptions = set()
+        self.events_published = 0
+        self._entries = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                # Clients get their initial state on connect, so only changes
+                # after this point are published
+                self._entries = self.snapshot.current()
+                self._thread = threading.Thread(target=self._run, name="weather-stream", daemon=True)
+                self._thread.start()
+
+    def subscribe(self, keys, unit=None, limit=None, loop=None):
+        # None when ``limit`` subscriptions are already open
+        self.start()
+        sub = Subscription(keys, unit, loop=loop)
+        with self._lock:
+            if limit is not None and len(self.subscriptions) >= limit:
+                return None
+            self.subscriptions.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscriptions.discard(sub)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.publish_changes()
+            except Exception:
+                if self.logger:
+                    self.logger.exception("Publishing snapshot changes failed")
+
+    def publish_changes(self):
+        entries = self.snapshot.current()
+        if entries is self._entries:
+            return
+        previous, self._entries = self._entries, entries
+
+        updates = {}
+        refreshed = {}
+        for key, entry in entries.items():
+            old = previous.get(key)
+            if old is not None and old["updated_at"] == entry["updated_at"]:
+                continue
+            changes = diff_fields(old["data"], entry["data"]) if old is not None else entry["data"]
+            if changes:
+                updates[key] = (entry, list(changes))
+            else:
+                refreshed[key] = (entry["data"]["id"], entry["updated_at"])
+        if not updates and not refreshed:
+            return
+
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        events = {} # (key, unit) -> serialised event
+        for sub in subscriptions:
+            for key in sub.keys.intersection(updates):
+                event = events.get((key, sub.unit))
+                if event is None:
+                    entry, fields = updates[key]
+                    data = self.present(entry["data"], sub.unit) if self.present else entry["data"]
+                    payload = {"id": data["id"], "changes": {f: data[f] for f in fields},
+                               "updated_at": entry["updated_at"]}
+                    event = events[(key, sub.unit)] = format_event("update", payload)
+                sub.push(event)
+            fresh = {refreshed[key][0]: refreshed[key][1] for key in sub.keys.intersection(refreshed)}
+            if fresh:
+                sub.push(format_event("refreshed", {"updated_at": fresh}))
+        self.events_published += len(updates)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self.subscriptions), "events_published": self.events_published}
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# app.py reads its configuration at import; keep the tests away from the
+# checkout's databases and catalogue files, and from the background
+# refresher
+_state = tempfile.mkdtemp(prefix="weather-tests-")
+os.environ.setdefault("REFRESH_INTERVAL", "0")
+os.environ.setdefault("USER_STORE_URL", f"sqlite:///{os.path.join(_state, 'users.db')}")
+os.environ.setdefault("USERS_JSON_PATH", os.path.join(_state, "users.json"))
+os.environ.setdefault("ARCHIVE_DB_PATH", os.path.join(_state, "archive.db"))
+os.environ.setdefault("SNAPSHOT_PATH", os.path.join(_state, "snapshot.json"))
+os.environ.setdefault("REFRESH_LOCK_PATH", os.path.join(_state, "refresh.lock"))
+os.environ.setdefault("CITY_CATALOGUE_PACK", os.path.join(_state, "cities.pack"))
+os.environ.setdefault("CITY_CATALOGUE_INDEX", os.path.join(_state, "cities.index"))
+sys.path.insert(0, ROOT)
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeResponse:
+    # The parts of requests.Response that read_open_meteo_batch uses
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def app_module():
+    import app
+    app.CACHE.clear()
+    yield app
+    app.CACHE.clear()
@@ -0,0 +1,19 @@
+"""Streamed bulk results survive a source whose getter raises."""
+
+
+def test_failing_source_is_reported_missing(app_module, monkeypatch):
+    def fail(coords, revalidate=True):
+        raise RuntimeError("upstream down")
+
+    def current(coords, revalidate=True):
+        return [{"temperature": 20.0 + i} for i in range(len(coords))], [False] * len(coords)
+    monkeypatch.setitem(app_module.BATCH_GETTERS, "weather", current)
+    monkeypatch.setitem(app_module.BATCH_GETTERS, "forecast", fail)
+    monkeypatch.setattr(app_module, "BATCH_SIZE", 2)
+    cities = [dict(app_module.location_place(10.0 + i, 20.0), id=-1 - i) for i in range(3)]
+
+    results = dict(app_module.iter_cities_data(cities, sources=("weather", "forecast")))
+    assert sorted(results) == [0, 1, 2]
+    for result in results.values():
+        assert result["missing"] == ["forecast"]
+        assert result["weather"] is not None
@@ -0,0 +1,98 @@
+"""The catalogue pack and search index are rebuilt when their sources change."""
+import json
+import os
+import subprocess
+import sys
+
+import catalogue
+from conftest import ROOT
+
+
+def write_catalogue(path, names):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"Testland": names}, f)
+
+
+def test_pack_rebuilt_when_catalogue_changes(app_module, monkeypatch, tmp_path):
+    source = os.path.join(tmp_path, "cities.json")
+    pack_path = os.path.join(tmp_path, "cities.pack")
+    write_catalogue(source, ["Alpha"])
+    catalogue.build(pack_path, [], source)
+    monkeypatch.setattr(app_module, "CITY_CATALOGUE_JSON", source)
+    monkeypatch.setattr(app_module, "CITY_CATALOGUE_PACK", pack_path)
+    monkeypatch.setattr(app_module, "ALL_CITIES", [])
+
+    def shard_names():
+        monkeypatch.setattr(app_module, "_catalogue_pack", None)
+        pack = app_module.get_catalogue_pack()
+        manifest = json.loads(pack.get(catalogue.MANIFEST)[0])
+        shard = manifest["countries"][0]["file"]
+        names = json.loads(pack.get(shard)[0])["names"]
+        pack.close()
+        return names
+
+    assert shard_names() == ["Alpha"]
+    write_catalogue(source, ["Alpha", "Beta"])
+    assert shard_names() == ["Alpha", "Beta"]
+
+
+def test_pack_stores_brotli_variants(tmp_path):
+    source = os.path.join(tmp_path, "cities.json")
+    write_catalogue(source, [f"Town {i}" for i in range(200)])
+    pack_path = os.path.join(tmp_path, "cities.pack")
+    catalogue.build(pack_path, [], source)
+    pack = catalogue.CataloguePack(pack_path)
+    assert pack.get(catalogue.MANIFEST, ["br", "gzip"])[1] == "br"
+    pack.close()
+
+
+def test_catalogue_etag_differs_per_encoding(app_module):
+    client = app_module.app.test_client()
+    etags = {}
+    for encoding in ("br", "gzip", "identity"):
+        response = client.get(f"/catalogue/{catalogue.MANIFEST}", headers={"Accept-Encoding": encoding})
+        assert response.headers.get("Content-Encoding", "identity") == encoding
+        assert "Accept-Encoding" in response.headers["Vary"]
+        etags[encoding] = response.headers["ETag"]
+        revalidated = client.get(f"/catalogue/{catalogue.MANIFEST}",
+                                 headers={"Accept-Encoding": encoding, "If-None-Match": etags[encoding]})
+        assert revalidated.status_code == 304
+    assert len(set(etags.values())) == 3
+
+
+def test_pack_readable_by_other_users(tmp_path):
+    source = os.path.join(tmp_path, "cities.json")
+    write_catalogue(source, ["Alpha"])
+    pack_path = os.path.join(tmp_path, "cities.pack")
+    catalogue.build(pack_path, [], source)
+    assert os.stat(pack_path).st_mode & 0o777 == 0o644
+
+
+def test_import_builds_nothing(tmp_path):
+    # The pack and index are built on first use, not when the app is imported
+    pack_path = os.path.join(tmp_path, "cities.pack")
+    env = dict(os.environ, CITY_CATALOGUE_PACK=pack_path, CITY_CATALOGUE_INDEX=os.path.join(tmp_path, "cities.index"))
+    script = "import app, threading, time; time.sleep(0.5); print(sorted(t.name for t in threading.enumerate()))"
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert "city-catalogue" not in output.stdout
+    assert os.listdir(tmp_path) == []
+
+
+def test_index_rebuilt_when_catalogue_changes(app_module, monkeypatch, tmp_path):
+    from city_index import CityIndex
+
+    source = os.path.join(tmp_path, "cities.json")
+    index_path = os.path.join(tmp_path, "cities.index")
+    write_catalogue(source, ["Alpha"])
+    CityIndex.from_catalogue([], source).save(index_path)
+    monkeypatch.setattr(app_module, "CITY_CATALOGUE_JSON", source)
+    monkeypatch.setattr(app_module, "CITY_CATALOGUE_INDEX", index_path)
+    monkeypatch.setattr(app_module, "ALL_CITIES", [])
+
+    def names():
+        monkeypatch.setattr(app_module, "_catalogue_index", None)
+        return sorted(r["name"] for r in app_module.get_catalogue_index().records)
+
+    assert names() == ["Alpha"]
+    write_catalogue(source, ["Alpha", "Beta"])
+    assert names() == ["Alpha", "Beta"]
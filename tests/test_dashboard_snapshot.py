@@ -0,0 +1,42 @@
+"""Dashboard entries come from the refresher's snapshot while it is recent."""
+import time
+
+
+def test_old_snapshot_entries_fetched_live(app_module, monkeypatch):
+    fresh, old = app_module.ALL_CITIES[:2]
+    now = time.time()
+    app_module.SNAPSHOT.update([{"id": fresh["id"], "source": "snapshot"}], now - 60)
+    app_module.SNAPSHOT.update([{"id": old["id"], "source": "snapshot"}], now - app_module.CACHE.stale_ttl - 60)
+    fetched = []
+
+    def get_cities_data(cities):
+        fetched.extend(c["id"] for c in cities)
+        return [{"id": c["id"], "source": "live"} for c in cities]
+    monkeypatch.setattr(app_module, "get_cities_data", get_cities_data)
+
+    entries = app_module.get_dashboard_entries([fresh, old])
+    assert [result["source"] for result, _ in entries] == ["snapshot", "live"]
+    assert fetched == [old["id"]]
+    # Live results carry no payload version
+    assert entries[0][1] == now - 60 and entries[1][1] is None
+
+
+def test_live_dashboard_revalidates(app_module, monkeypatch):
+    # Cities outside the snapshot (here: the refresher is off) are fetched
+    # live on every poll; unchanged data must still get a 304
+    monkeypatch.setattr(app_module, "get_cities_data",
+                        lambda cities: [{"id": c["id"], "weather": {"temperature": 12.5}} for c in cities])
+    monkeypatch.setattr(app_module, "session_cities", lambda: app_module.ALL_CITIES[:2])
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "tester"
+
+    first = client.get("/api/data")
+    assert first.status_code == 200
+    again = client.get("/api/data", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+    monkeypatch.setattr(app_module, "get_cities_data",
+                        lambda cities: [{"id": c["id"], "weather": {"temperature": 13.0}} for c in cities])
+    changed = client.get("/api/data", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
@@ -0,0 +1,55 @@
+"""Historical weather: request limits and chunked archive fetches."""
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from weather_cache import coord_key
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "tester"
+    return client
+
+
+@pytest.mark.parametrize("query", [
+    "lat=100&lon=0&start_date=2020-01-01&end_date=2020-01-31",
+    "lat=10&lon=200&start_date=2020-01-01&end_date=2020-01-31",
+    "lat=10&lon=20&start_date=2020-01-31&end_date=2020-01-01",
+    "lat=10&lon=20&start_date=1900-01-01&end_date=2100-12-31",
+    "lat=10&lon=20&start_date=2020-01-01&end_date=2020-01-31&temperature_unit=kelvin",
+])
+def test_invalid_requests_rejected(client, query):
+    assert client.get(f"/api/historical_weather?{query}").status_code == 400
+
+
+def test_failed_chunk_keeps_the_others(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "ARCHIVE_CHUNK_DAYS", 10)
+    monkeypatch.setattr(app_module, "ARCHIVE_FETCH_CONCURRENCY", 2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def fetch(lat, lon, first, last):
+        with lock:
+            running.append(first)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(first)
+        if first == date(2020, 1, 11):
+            raise app_module.UpstreamError("archive failed", 502)
+        return {(first + timedelta(days=i)).isoformat(): (10.0, 2.0, 0.5) for i in range((last - first).days + 1)}
+    monkeypatch.setattr(app_module, "fetch_archive_days", fetch)
+
+    lat, lon = 41.25, -7.75
+    with pytest.raises(app_module.UpstreamError):
+        app_module.get_historical_weather(lat, lon, date(2020, 1, 1), date(2020, 1, 30))
+    assert max(peak) <= 2
+    stored = app_module.ARCHIVE.read(coord_key(lat, lon), date(2020, 1, 1), date(2020, 1, 30))
+    # The first chunk arrived before the failure and is kept
+    assert "2020-01-01" in stored and "2020-01-11" not in stored
@@ -0,0 +1,21 @@
+"""/metrics is only served to scrapers holding METRICS_TOKEN."""
+
+
+def test_metrics_disabled_without_token(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", None)
+    response = app_module.app.test_client().get("/metrics")
+    assert response.status_code == 404
+
+
+def test_metrics_require_bearer_token(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "s3cret")
+    client = app_module.app.test_client()
+    for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": "Basic s3cret"}):
+        response = client.get("/metrics", headers=headers)
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+        assert b"http_request_duration_seconds" not in response.data
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"# TYPE http_request_duration_seconds histogram" in response.data
@@ -0,0 +1,118 @@
+"""Multi-location Open-Meteo requests are split back onto the right cities.
+
+The fixtures are three-location responses (London, Tokyo, Sydney) in the
+shape Open-Meteo returns for comma-separated coordinate lists, with
+different values for every location, so a result landing on the wrong
+city shows up as a wrong value.
+"""
+from datetime import datetime
+
+import pytest
+
+from conftest import FakeResponse, load_fixture
+
+LONDON = (51.5085, -0.1257)
+TOKYO = (35.6895, 139.6917)
+SYDNEY = (-33.8679, 151.2073)
+
+
+class RecordedOpenMeteo:
+    # Stands in for UPSTREAM: answers each request with the fixture entries
+    # for the requested latitudes, in the requested order
+    def __init__(self, app_module):
+        self.app = app_module
+        self.fixtures = {
+            kind: {entry["latitude"]: entry for entry in load_fixture(f"open_meteo_{kind}_3_locations.json")}
+            for kind in ("current", "daily", "air_quality")
+        }
+        self.requests = []
+
+    def kind(self, url, params):
+        if url == self.app.OPEN_METEO_AIR_QUALITY_URL:
+            return "air_quality"
+        return "current" if "current" in params else "daily"
+
+    def get(self, name, url, params=None, timeout=5):
+        kind = self.kind(url, params)
+        latitudes = [float(lat) for lat in params["latitude"].split(",")]
+        self.requests.append((kind, latitudes))
+        entries = [self.fixtures[kind][lat] for lat in latitudes]
+        # A single location comes back as a bare object, not a list
+        return FakeResponse(entries[0] if len(entries) == 1 else entries)
+
+
+@pytest.fixture
+def upstream(app_module, monkeypatch):
+    recorded = RecordedOpenMeteo(app_module)
+    monkeypatch.setattr(app_module, "UPSTREAM", recorded)
+    monkeypatch.setattr(app_module, "OPENWEATHERMAP_API_KEY", None)
+    return recorded
+
+
+def test_batch_results_keep_request_order(app_module):
+    response = FakeResponse(load_fixture("open_meteo_current_3_locations.json"))
+    results = app_module.read_open_meteo_batch(response, [LONDON, TOKYO, SYDNEY], "test")
+    assert [(r["latitude"], r["longitude"]) for r in results] == [LONDON, TOKYO, SYDNEY]
+
+
+def test_current_weather_mapped_to_requested_keys(app_module, upstream):
+    # Requested in an order different from the fixture's
+    coords = [SYDNEY, LONDON, TOKYO]
+    weather, stale = app_module.get_current_weather_many(coords)
+    assert [w["temperature"] for w in weather] == [17.4, 11.3, 22.7]
+    assert [w["weather_code"] for w in weather] == [61, 3, 1]
+    assert stale == [False, False, False]
+    assert upstream.requests == [("current", [SYDNEY[0], LONDON[0], TOKYO[0]])]
+
+    # Served from the cache under the same keys, whatever the order
+    weather, _ = app_module.get_current_weather_many([TOKYO, SYDNEY])
+    assert [w["temperature"] for w in weather] == [22.7, 17.4]
+    assert len(upstream.requests) == 1
+
+
+def test_daily_forecast_mapped_to_requested_keys(app_module, upstream):
+    series = app_module.fetch_daily_forecast_batch([TOKYO, LONDON])
+    assert [s.row(0)["temp_max"] for s in series] == [20.5, 12.5]
+    assert [s.row(5)["weathercode"] for s in series] == [95, 1]
+
+
+def test_air_quality_mapped_to_requested_keys(app_module, upstream):
+    series = app_module.fetch_air_quality_batch([LONDON, SYDNEY, TOKYO])
+    noon = [s.at(datetime(2026, 10, 17, 12, 30)) for s in series]
+    assert [row["european_aqi"] for row in noon] == [32, 62, 47]
+    assert noon[2]["pollen_grass"] is None
+
+
+def test_single_location_bare_object(app_module):
+    response = FakeResponse(load_fixture("open_meteo_current_1_location.json"))
+    results = app_module.read_open_meteo_batch(response, [TOKYO], "test")
+    assert len(results) == 1
+    assert app_module.parse_current_weather(results[0])["temperature"] == 22.7
+
+
+def test_length_mismatch_raises(app_module):
+    response = FakeResponse(load_fixture("open_meteo_current_3_locations.json"))
+    with pytest.raises(app_module.UpstreamError, match="returned 3 results for 2 locations"):
+        app_module.read_open_meteo_batch(response, [LONDON, TOKYO], "test")
+
+
+def test_length_mismatch_leaves_batch_unloaded(app_module, monkeypatch):
+    class ShortUpstream:
+        def get(self, name, url, params=None, timeout=5):
+            return FakeResponse(load_fixture("open_meteo_current_3_locations.json")[:2])
+
+    monkeypatch.setattr(app_module, "UPSTREAM", ShortUpstream())
+    weather, _ = app_module.get_current_weather_many([LONDON, TOKYO, SYDNEY])
+    # Nothing is assigned to a city when the response can't be lined up
+    assert weather == [None, None, None]
+
+
+def test_cities_chunked_at_batch_size(app_module, upstream, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_SIZE", 2)
+    cities = [dict(app_module.location_place(lat, lon), id=i) for i, (lat, lon) in enumerate([TOKYO, SYDNEY, LONDON])]
+    results = app_module.get_cities_data(cities)
+
+    assert [r["weather"]["temperature"] for r in results] == [22.7, 17.4, 11.3]
+    for kind in ("current", "daily", "air_quality"):
+        chunks = sorted(lats for k, lats in upstream.requests if k == kind)
+        assert chunks == sorted([[TOKYO[0], SYDNEY[0]], [LONDON[0]]])
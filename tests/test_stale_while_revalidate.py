@@ -0,0 +1,97 @@
+"""Expired entries: served at once to pages, reloaded first for the refresher."""
+import asyncio
+import os
+
+from refresher import Snapshot
+from weather_cache import LocalBackend, WeatherCache
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+
+
+def expired_cache(executor):
+    # A zero TTL makes every entry expired (but still stale-servable) at once
+    cache = WeatherCache(LocalBackend(1024 * 1024), {"current": 0}, stale_ttl=3600, background=executor)
+    cache.set("current", "a", "old a")
+    cache.set("current", "b", "old b")
+    return cache
+
+
+def test_load_many_serves_stale_and_reloads_in_background():
+    executor = RecordingExecutor()
+    cache = expired_cache(executor)
+    loaded = []
+    found, stale = cache.load_many("current", ["a", "b"], lambda keys: loaded.extend(keys) or {})
+    assert found == {"a": "old a", "b": "old b"}
+    assert stale == {"a", "b"}
+    assert loaded == [] and len(executor.submitted) == 1
+
+
+def test_load_many_without_revalidate_reloads_first():
+    executor = RecordingExecutor()
+    cache = expired_cache(executor)
+    found, stale = cache.load_many("current", ["a", "b"], lambda keys: {k: f"new {k}" for k in keys}, revalidate=False)
+    assert found == {"a": "new a", "b": "new b"}
+    assert stale == set()
+    assert executor.submitted == []
+
+
+def test_load_without_revalidate_falls_back_to_stale_on_failure():
+    cache = expired_cache(RecordingExecutor())
+
+    def fail():
+        raise RuntimeError("upstream down")
+    assert cache.load("current", "a", fail, revalidate=False) == ("old a", True)
+
+
+def test_load_many_falls_back_to_stale_when_loader_raises():
+    # No executor, so the expired keys are reloaded in the caller
+    cache = expired_cache(None)
+
+    def fail(keys):
+        raise RuntimeError("upstream down")
+    found, stale = cache.load_many("current", ["a", "b", "c"], fail)
+    assert found == {"a": "old a", "b": "old b"}
+    assert stale == {"a", "b"}
+
+
+def test_aload_many_falls_back_to_stale_when_loader_raises():
+    cache = expired_cache(None)
+
+    async def fail(keys):
+        raise RuntimeError("upstream down")
+    found, stale = asyncio.run(cache.aload_many("current", ["a", "b", "c"], fail))
+    assert found == {"a": "old a", "b": "old b"}
+    assert stale == {"a", "b"}
+
+
+def test_snapshot_keeps_current_entry_over_stale_refresh(tmp_path):
+    snapshot = Snapshot(os.path.join(tmp_path, "snapshot.json"))
+    snapshot.update([{"id": 1, "weather": "current", "partial": False, "stale": []}], 100.0)
+    snapshot.update([{"id": 1, "weather": "old", "partial": False, "stale": ["weather"]}], 200.0)
+    entry = snapshot.get(1)
+    assert entry["data"]["weather"] == "current" and entry["updated_at"] == 100.0
+
+
+def test_refresher_fetch_does_not_serve_expired_entries(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "OPENWEATHERMAP_API_KEY", None)
+    calls = []
+
+    def fetch_current(coords):
+        calls.append(coords)
+        return [{"temperature": 10.0 + len(calls)} for _ in coords]
+    monkeypatch.setattr(app_module, "fetch_current_weather_batch", fetch_current)
+    monkeypatch.setattr(app_module, "fetch_daily_forecast_batch", lambda coords: [])
+    monkeypatch.setattr(app_module, "fetch_air_quality_batch", lambda coords: [])
+    monkeypatch.setitem(app_module.CACHE.ttls, "current", 0)
+    city = dict(app_module.location_place(12.5, 45.5), id=-1)
+
+    assert app_module.get_cities_data([city])[0]["weather"]["temperature"] == 11.0
+    result = app_module.refresh_cities_data([city])[0]
+    assert result["weather"]["temperature"] == 12.0
+    assert "weather" not in result["stale"]
@@ -0,0 +1,35 @@
+"""Update hub subscriptions: the per-process cap and asyncio delivery."""
+import asyncio
+import threading
+
+from refresher import Snapshot
+from stream import UpdateHub
+
+
+def test_subscription_limit_is_atomic(tmp_path):
+    hub = UpdateHub(Snapshot(str(tmp_path / "snapshot.json")), poll_interval=60)
+    barrier = threading.Barrier(16)
+    subs = []
+
+    def subscribe():
+        barrier.wait()
+        subs.append(hub.subscribe(["1"], "celsius", limit=4))
+    threads = [threading.Thread(target=subscribe) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(sub is not None for sub in subs) == 4
+    assert hub.stats()["subscribers"] == 4
+
+
+def test_loop_subscription_gets_events_from_other_threads(tmp_path):
+    snapshot = Snapshot(str(tmp_path / "snapshot.json"))
+    hub = UpdateHub(snapshot, poll_interval=60)
+
+    async def receive():
+        sub = hub.subscribe(["1"], "celsius", loop=asyncio.get_running_loop())
+        snapshot.update([{"id": 1, "temp": 3}], 100.0)
+        await asyncio.to_thread(hub.publish_changes)
+        return await asyncio.wait_for(sub.queue.get(), 5)
+    assert asyncio.run(receive()).startswith("event: update\n")
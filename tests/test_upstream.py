@@ -0,0 +1,66 @@
+"""Retry-After from an upstream is honoured only up to the longest backoff step."""
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from upstream import UpstreamClient
+
+
+@pytest.fixture
+def throttling_server():
+    # Answers 429 with the Retry-After in ``retry_after`` and counts requests
+    state = {"retry_after": "3600", "requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["requests"] += 1
+            self.send_response(429)
+            self.send_header("Retry-After", state["retry_after"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_long_retry_after_fails_at_once(throttling_server):
+    client = UpstreamClient(retries=2, backoff=0.1, failure_threshold=1)
+    started = time.monotonic()
+    resp = client.get("test", throttling_server["url"])
+    assert time.monotonic() - started < 1
+    assert resp.status_code == 429
+    assert throttling_server["requests"] == 1
+    assert client.stats()["test"]["state"] == "open"
+
+
+def test_short_retry_after_is_retried(throttling_server):
+    throttling_server["retry_after"] = "0"
+    client = UpstreamClient(retries=2, backoff=0.01)
+    assert client.get("test", throttling_server["url"]).status_code == 429
+    assert throttling_server["requests"] == 3
+
+
+def test_async_long_retry_after_fails_at_once(throttling_server):
+    pytest.importorskip("httpx")
+    client = UpstreamClient(retries=2, backoff=0.1)
+
+    async def fetch():
+        try:
+            return await client.aget("test", throttling_server["url"])
+        finally:
+            await client.aclose()
+    started = time.monotonic()
+    resp = asyncio.run(fetch())
+    assert time.monotonic() - started < 1
+    assert resp.status_code == 429
+    assert throttling_server["requests"] == 1
@@ -0,0 +1,236 @@
+"""Shared HTTP client for the weather upstreams.
+
+One ``requests.Session`` with keep-alive connection pools per host, bounded
+retries with exponential backoff for connection errors, 429 and 5xx, and a
+circuit breaker per upstream so a struggling API fails fast instead of
+tying up every worker thread for the full timeout.
+
+``aget`` is the coroutine version for the ASGI entry point (asgi.py). It
+needs httpx, keeps one connection pool per event loop, and shares the
+retry policy, breakers and counters with ``get``.
+"""
+import asyncio
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after
+    ``reset_timeout`` seconds a single trial call is let through."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class CappedRetry(Retry):
+    """urllib3's Retry, except that a Retry-After longer than
+    ``max_retry_after`` seconds ends the retries: the response is returned
+    as is rather than a pool thread sleeping for as long as the upstream
+    asks, and the breaker counts it as a failure."""
+
+    def __init__(self, *args, max_retry_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and self.max_retry_after is not None and self.respect_retry_after_header:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > self.max_retry_after:
+                raise MaxRetryError(_pool, url, ResponseError(f"Retry-After of {retry_after:.0f}s is too long"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class UpstreamClient:
+    def __init__(self, pool_size=32, retries=2, backoff=0.3, failure_threshold=5, reset_timeout=30, observer=None,
+                 async_pool_size=256):
+        # Retry-After is honoured up to the longest backoff step
+        self.max_retry_after = backoff * (2 ** retries)
+        retry = CappedRetry(
+            total=retries,
+            connect=retries,
+            read=0, # a slow upstream is not retried; the breaker deals with it
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+            max_retry_after=self.max_retry_after,
+        )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.retries = retries
+        self.backoff = backoff
+        self.async_pool_size = async_pool_size
+        self._async_clients = {} # event loop -> (httpx.AsyncClient, Semaphore of free connections)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Called as observer(name, seconds, failed) after every request
+        self.observer = observer
+        self.breakers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def _upstream(self, name):
+        with self._lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.counters[name] = {"requests": 0, "errors": 0, "short_circuited": 0,
+                                       "latency_total": 0.0, "latency_max": 0.0}
+            return self.breakers[name], self.counters[name]
+
+    def _admit(self, name):
+        breaker, counters = self._upstream(name)
+        if not breaker.allow():
+            with self._lock:
+                counters["short_circuited"] += 1
+            raise CircuitOpenError(f"Circuit for {name} is open")
+        return breaker, counters
+
+    def _record(self, name, breaker, counters, elapsed, failed):
+        with self._lock:
+            counters["requests"] += 1
+            counters["latency_total"] += elapsed
+            counters["latency_max"] = max(counters["latency_max"], elapsed)
+            if failed:
+                counters["errors"] += 1
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if self.observer:
+            self.observer(name, elapsed, failed)
+
+    def get(self, name, url, params=None, timeout=5):
+        breaker, counters = self._admit(name)
+        started = time.perf_counter()
+        failed = True
+        try:
+            resp = self.session.get(url, params=params, timeout=timeout)
+            failed = resp.status_code == 429 or resp.status_code >= 500
+            return resp
+        except requests.RequestException as e:
+            raise UpstreamError(f"{name} request failed: {e}") from e
+        finally:
+            self._record(name, breaker, counters, time.perf_counter() - started, failed)
+
+    def _async_client(self):
+        if httpx is None:
+            raise RuntimeError("The httpx package is required for async upstream calls")
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Callers queue on the semaphore rather than inside httpx, whose
+            # pool gets slow with thousands of waiting requests
+            limits = httpx.Limits(max_connections=self.async_pool_size, max_keepalive_connections=self.async_pool_size)
+            client = self._async_clients[loop] = (httpx.AsyncClient(limits=limits), asyncio.Semaphore(self.async_pool_size))
+        return client
+
+    def _retry_delay(self, attempt, resp=None):
+        # Same schedule as urllib3's Retry: immediate, then exponential;
+        # a numeric Retry-After wins, or is None (give up) when it is longer
+        # than max_retry_after, as with CappedRetry
+        retry_after = resp.headers.get("Retry-After", "").strip() if resp is not None else ""
+        if retry_after.isdigit():
+            return float(retry_after) if float(retry_after) <= self.max_retry_after else None
+        return self.backoff * (2 ** attempt) if attempt else 0
+
+    async def aget(self, name, url, params=None, timeout=5):
+        # Returns an httpx.Response (``is_success`` rather than ``ok``)
+        client, slots = self._async_client()
+        breaker, counters = self._admit(name)
+        # Waiting for a free connection is queueing, not a slow upstream, so
+        # neither the timeout nor the recorded latency includes it
+        async with slots:
+            started = time.perf_counter()
+            failed = True
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        resp = await client.get(url, params=params, timeout=timeout)
+                    except httpx.ConnectError as e:
+                        if attempt == self.retries:
+                            raise UpstreamError(f"{name} request failed: {e}") from e
+                        await asyncio.sleep(self._retry_delay(attempt))
+                        continue
+                    except httpx.HTTPError as e:
+                        # A slow upstream is not retried; the breaker deals with it
+                        raise UpstreamError(f"{name} request failed: {e}") from e
+                    if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                        break
+                    delay = self._retry_delay(attempt, resp)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                failed = resp.status_code == 429 or resp.status_code >= 500
+                return resp
+            finally:
+                self._record(name, breaker, counters, time.perf_counter() - started, failed)
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client[0].aclose()
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for name, c in self.counters.items():
+                stats[name] = dict(c, state=self.breakers[name].state,
+                                   latency_avg=round(c["latency_total"] / c["requests"], 4) if c["requests"] else None)
+            return stats
@@ -0,0 +1,228 @@
+"""User accounts storage.
+
+The default backend is SQLite in WAL mode: one row per user, indexed by
+username, so a unit toggle or city change rewrites a single row and is safe
+across gunicorn threads and worker processes. The original users.json
+format is still available as a backend and is migrated into SQLite once.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+
+class UserStore:
+    """Interface shared by the backends.
+
+    Records are dicts with ``password_hash``, ``selected_cities`` and
+    ``units`` keys.
+    """
+
+    def get(self, username):
+        raise NotImplementedError
+
+    def create(self, username, record):
+        # Returns False if the username is taken
+        raise NotImplementedError
+
+    def set_units(self, username, units):
+        raise NotImplementedError
+
+    def add_city(self, username, city):
+        # Returns the user's updated city list
+        raise NotImplementedError
+
+    def remove_city(self, username, city):
+        raise NotImplementedError
+
+    def iter_users(self):
+        # Yields (username, record) pairs
+        raise NotImplementedError
+
+
+def _normalize(record, defaults):
+    # Oldest users.json entries are a bare password hash string
+    if isinstance(record, str):
+        return {"password_hash": record, "selected_cities": defaults["selected_cities"], "units": defaults["units"]}
+    return {
+        "password_hash": record.get("password_hash"),
+        "selected_cities": record.get("selected_cities", defaults["selected_cities"]),
+        "units": record.get("units", defaults["units"]),
+    }
+
+
+class SQLiteUserStore(UserStore):
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password_hash TEXT NOT NULL,
+                units TEXT NOT NULL,
+                selected_cities TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections must not be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def migrate_from_json(self, json_path):
+        # Runs once per database; the write lock makes concurrent workers wait
+        # for the first one instead of importing twice.
+        if not os.path.exists(json_path):
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                conn.execute("COMMIT")
+                return 0
+            with open(json_path, "r") as f:
+                users = json.load(f)
+            rows = []
+            for username, record in users.items():
+                record = _normalize(record, self.defaults)
+                rows.append((username, record["password_hash"], record["units"], json.dumps(record["selected_cities"])))
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password_hash, units, selected_cities) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)", (json_path,))
+            conn.execute("COMMIT")
+            return len(rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, username):
+        row = self._conn().execute(
+            "SELECT password_hash, units, selected_cities FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return {"password_hash": row[0], "units": row[1], "selected_cities": json.loads(row[2])}
+
+    def create(self, username, record):
+        try:
+            self._conn().execute(
+                "INSERT INTO users (username, password_hash, units, selected_cities) VALUES (?, ?, ?, ?)",
+                (username, record["password_hash"], record["units"], json.dumps(record["selected_cities"])))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def set_units(self, username, units):
+        self._conn().execute("UPDATE users SET units = ? WHERE username = ?", (units, username))
+
+    def _update_cities(self, username, change):
+        # Read-modify-write of one row under the write lock, so concurrent
+        # adds/removes from several tabs or workers don't overwrite each other
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT selected_cities FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return []
+            cities = change(json.loads(row[0]))
+            conn.execute("UPDATE users SET selected_cities = ? WHERE username = ?", (json.dumps(cities), username))
+            conn.execute("COMMIT")
+            return cities
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add_city(self, username, city):
+        return self._update_cities(username, lambda cities: cities if city in cities else cities + [city])
+
+    def remove_city(self, username, city):
+        return self._update_cities(username, lambda cities: [c for c in cities if c != city])
+
+    def iter_users(self):
+        for username, password_hash, units, selected_cities in self._conn().execute(
+                "SELECT username, password_hash, units, selected_cities FROM users"):
+            yield username, {"password_hash": password_hash, "units": units, "selected_cities": json.loads(selected_cities)}
+
+
+class JsonUserStore(UserStore):
+    """The original users.json format. Every change rewrites the whole file,
+    so this is only suitable for a single process; kept for compatibility."""
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        self._lock = threading.Lock()
+        self.users = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.users = json.load(f)
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.users, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def get(self, username):
+        record = self.users.get(username)
+        return _normalize(record, self.defaults) if record is not None else None
+
+    def create(self, username, record):
+        with self._lock:
+            if username in self.users:
+                return False
+            self.users[username] = dict(record)
+            self._save()
+            return True
+
+    def _update(self, username, **fields):
+        record = _normalize(self.users[username], self.defaults)
+        record.update(fields)
+        self.users[username] = record
+        self._save()
+        return record
+
+    def set_units(self, username, units):
+        with self._lock:
+            if username in self.users:
+                self._update(username, units=units)
+
+    def add_city(self, username, city):
+        with self._lock:
+            if username not in self.users:
+                return []
+            cities = self.get(username)["selected_cities"]
+            if city not in cities:
+                cities = cities + [city]
+            return self._update(username, selected_cities=cities)["selected_cities"]
+
+    def remove_city(self, username, city):
+        with self._lock:
+            if username not in self.users:
+                return []
+            cities = [c for c in self.get(username)["selected_cities"] if c != city]
+            return self._update(username, selected_cities=cities)["selected_cities"]
+
+    def iter_users(self):
+        for username in list(self.users):
+            yield username, self.get(username)
+
+
+def make_user_store(url, defaults, legacy_json_path="users.json"):
+    # sqlite:///path/to/users.db (default) or json:///path/to/users.json
+    if url.startswith("sqlite:///"):
+        store = SQLiteUserStore(url[len("sqlite:///"):], defaults)
+        store.migrate_from_json(legacy_json_path)
+        return store
+    if url.startswith("json:///"):
+        return JsonUserStore(url[len("json:///"):], defaults)
+    raise ValueError(f"Unsupported USER_STORE_URL: {url}")
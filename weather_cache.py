@@ -0,0 +1,489 @@
+"""Response cache for upstream weather data.
+
+Entries are keyed by data type plus a rounded coordinate (and unit where it
+matters), expire after a per-type TTL and are stored in a pluggable backend:
+an in-process LRU bounded by an approximate byte budget, or Redis so that
+several gunicorn workers / replicas share one copy.
+"""
+import asyncio
+import math
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+MISSING = object()
+
+# Coordinates are rounded to this many decimals before they become part of a
+# key (2 decimals is roughly 1 km, well inside a forecast model grid cell).
+COORD_PRECISION = 2
+
+
+def coord_key(lat, lon, unit=None):
+    key = f"{round(float(lat), COORD_PRECISION):.{COORD_PRECISION}f},{round(float(lon), COORD_PRECISION):.{COORD_PRECISION}f}"
+    if unit:
+        key += f":{unit}"
+    return key
+
+
+def snap_to_grid(lat, lon, cell):
+    # Centre of the ``cell``-degree square containing (lat, lon). Ad-hoc
+    # lookups (geolocated users) are snapped first so that everyone in the
+    # same square shares one cache entry and one in-flight upstream call.
+    lat = min(max(float(lat), -90.0), 90.0)
+    lon = (float(lon) + 180.0) % 360.0 - 180.0
+    lat = min(max((math.floor(lat / cell) + 0.5) * cell, -90.0), 90.0)
+    lon = (math.floor(lon / cell) + 0.5) * cell
+    return round(lat, 6), round(lon, 6)
+
+
+class LocalBackend:
+    """Thread-safe in-process LRU store with a memory cap."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (value, expires_at, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[1] <= now:
+                self._remove(key)
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        # Size is estimated from the pickled form; values are small JSON-like objects
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) + len(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class RedisBackend:
+    """Shared store; Redis enforces TTLs and its own maxmemory/LRU policy."""
+
+    def __init__(self, url, prefix="weather:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a redis:// CACHE_URL")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return MISSING
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def make_backend(url=None, max_bytes=32 * 1024 * 1024, prefix="weather:"):
+    if not url or url.startswith("memory://"):
+        return LocalBackend(max_bytes)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, prefix)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self._waiters = [] # (loop, future) of async callers waiting on this load
+        self._lock = threading.Lock()
+
+    def finish(self):
+        with self._lock:
+            self.event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, timeout):
+        return self.event.wait(timeout)
+
+    async def wait_async(self, timeout):
+        # Like wait(), without holding a thread; works whether the load runs
+        # in a thread or in a coroutine
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.event.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class WeatherCache:
+    """TTL cache with single-flight loading and per-type hit/miss counters.
+
+    ``loader`` is only called on a miss, and concurrent misses for the same
+    key in this process wait for the first caller's result instead of
+    issuing their own upstream request. Loaders signal failure by raising;
+    failures and ``None`` results are never cached.
+
+    Expired entries are kept for another ``stale_ttl`` seconds and returned
+    when reloading them fails, so an upstream outage degrades to old data
+    rather than no data. Given a ``background`` executor they are returned
+    straight away instead (stale-while-revalidate) and reloaded there, once
+    per key, so callers never wait on an upstream for data they already
+    have. ``load``/``load_many`` also say which values were stale, and
+    with ``revalidate=False`` reload expired entries before returning, as
+    without an executor (for the refresher, which must not store old data
+    as new).
+
+    ``aget_or_load``/``aget_or_load_many`` (and ``aload``/``aload_many``)
+    are the coroutine versions for the ASGI entry point; they take async
+    loaders, revalidate in tasks and share in-flight loads with the
+    threaded ones.
+    """
+
+    def __init__(self, backend, ttls, stale_ttl=6 * 3600, flight_timeout=30, background=None):
+        self.backend = backend
+        self.ttls = ttls
+        self.stale_ttl = stale_ttl
+        self.flight_timeout = flight_timeout
+        self.background = background
+        self.counters = {kind: self._new_counters() for kind in ttls}
+        self._inflight = {}
+        self._tasks = set() # background reloads of the coroutine versions
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_counters():
+        return {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0}
+
+    def _count(self, kind, name, n=1):
+        with self._lock:
+            self.counters.setdefault(kind, self._new_counters())[name] += n
+
+    def _lookup(self, full_key):
+        # Returns (value, is_fresh) or MISSING
+        entry = self.backend.get(full_key)
+        if entry is MISSING:
+            return MISSING
+        value, fresh_until = entry
+        return value, fresh_until > time.time()
+
+    def get(self, kind, key):
+        entry = self._lookup(f"{kind}:{key}")
+        if entry is MISSING or not entry[1]:
+            return MISSING
+        return entry[0]
+
+    def set(self, kind, key, value):
+        if value is not None:
+            ttl = self.ttls[kind]
+            self.backend.set(f"{kind}:{key}", (value, time.time() + ttl), ttl + self.stale_ttl)
+
+    def _begin(self, kind, key):
+        # (fresh value or MISSING, stale value or MISSING, flight, is_leader)
+        full_key = f"{kind}:{key}"
+        entry = self._lookup(full_key)
+        if entry is not MISSING and entry[1]:
+            self._count(kind, "hits")
+            return entry[0], MISSING, None, False
+        stale = entry[0] if entry is not MISSING else MISSING
+        with self._lock:
+            flight = self._inflight.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[full_key] = _Flight()
+        self._count(kind, "misses" if leader else "coalesced")
+        return MISSING, stale, flight, leader
+
+    def _followed(self, kind, key, flight, stale, arrived):
+        if arrived and flight.error is None:
+            return flight.value, False
+        if stale is not MISSING:
+            return self._served_stale(kind, stale)
+        if flight.error is not None:
+            raise flight.error
+        raise TimeoutError(f"Timed out waiting for in-flight load of {kind}:{key}")
+
+    def _served_stale(self, kind, stale):
+        self._count(kind, "stale")
+        return stale, True
+
+    def _loaded(self, kind, key, flight, value):
+        self.set(kind, key, value)
+        flight.value = value
+        return value
+
+    def _failed(self, kind, flight, error, stale):
+        flight.error = error
+        if stale is MISSING:
+            raise error
+        return self._served_stale(kind, stale)
+
+    def _end(self, kind, keys_and_flights):
+        with self._lock:
+            for key, _ in keys_and_flights:
+                self._inflight.pop(f"{kind}:{key}", None)
+        for _, flight in keys_and_flights:
+            flight.finish()
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _revalidate(self, kind, key, flight, loader):
+        try:
+            self._loaded(kind, key, flight, loader())
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._end(kind, [(key, flight)])
+
+    async def _arevalidate(self, kind, key, flight, loader):
+        try:
+            self._loaded(kind, key, flight, await loader())
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._end(kind, [(key, flight)])
+
+    def load(self, kind, key, loader, revalidate=True):
+        # (value, True if it came from an expired entry)
+        value, stale, flight, leader = self._begin(kind, key)
+        if value is not MISSING:
+            return value, False
+        if stale is not MISSING and self.background is not None and revalidate:
+            if leader:
+                self.background.submit(self._revalidate, kind, key, flight, loader)
+            return self._served_stale(kind, stale)
+        if not leader:
+            return self._followed(kind, key, flight, stale, flight.wait(self.flight_timeout))
+        try:
+            return self._loaded(kind, key, flight, loader()), False
+        except Exception as e:
+            return self._failed(kind, flight, e, stale)
+        finally:
+            self._end(kind, [(key, flight)])
+
+    def get_or_load(self, kind, key, loader):
+        return self.load(kind, key, loader)[0]
+
+    async def aload(self, kind, key, loader):
+        value, stale, flight, leader = self._begin(kind, key)
+        if value is not MISSING:
+            return value, False
+        if stale is not MISSING and self.background is not None:
+            if leader:
+                self._spawn(self._arevalidate(kind, key, flight, loader))
+            return self._served_stale(kind, stale)
+        if not leader:
+            return self._followed(kind, key, flight, stale, await flight.wait_async(self.flight_timeout))
+        try:
+            return self._loaded(kind, key, flight, await loader()), False
+        except Exception as e:
+            return self._failed(kind, flight, e, stale)
+        finally:
+            self._end(kind, [(key, flight)])
+
+    async def aget_or_load(self, kind, key, loader):
+        return (await self.aload(kind, key, loader))[0]
+
+    def _begin_many(self, kind, keys):
+        # (results, stale, missing, led flights, followed flights)
+        results = {}
+        stale = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            entry = self._lookup(f"{kind}:{key}")
+            if entry is not MISSING and entry[1]:
+                self._count(kind, "hits")
+                results[key] = entry[0]
+                continue
+            if entry is not MISSING:
+                stale[key] = entry[0]
+            missing.append(key)
+
+        led = {}
+        followed = {}
+        with self._lock:
+            for key in missing:
+                full_key = f"{kind}:{key}"
+                flight = self._inflight.get(full_key)
+                if flight is None:
+                    led[key] = self._inflight[full_key] = _Flight()
+                else:
+                    followed[key] = flight
+        if led:
+            self._count(kind, "misses", len(led))
+        if followed:
+            self._count(kind, "coalesced", len(followed))
+        return results, stale, missing, led, followed
+
+    def _loaded_many(self, kind, led, loaded, results):
+        for key, flight in led.items():
+            value = loaded.get(key)
+            if value is not None:
+                self.set(kind, key, value)
+                results[key] = flight.value = value
+
+    def _serve_stale_many(self, kind, results, stale, led, followed, revalidate=True):
+        # Stale-while-revalidate: every expired key is answered from its
+        # stale entry; returns the flights of those this caller has to
+        # reload (in one background batch) and the keys served stale
+        if self.background is None or not stale or not revalidate:
+            return {}, set()
+        for key, value in stale.items():
+            results[key] = value
+            followed.pop(key, None)
+        self._count(kind, "stale", len(stale))
+        return {key: led.pop(key) for key in list(led) if key in stale}, set(stale)
+
+    def _revalidate_many(self, kind, led, loader):
+        try:
+            self._loaded_many(kind, led, loader(list(led)), {})
+        except Exception as e:
+            for flight in led.values():
+                flight.error = e
+        finally:
+            self._end(kind, list(led.items()))
+
+    async def _arevalidate_many(self, kind, led, loader):
+        try:
+            self._loaded_many(kind, led, await loader(list(led)), {})
+        except Exception as e:
+            for flight in led.values():
+                flight.error = e
+        finally:
+            self._end(kind, list(led.items()))
+
+    def _end_many(self, kind, results, stale, missing, served):
+        for key in missing:
+            if key not in results and key in stale:
+                self._count(kind, "stale")
+                results[key] = stale[key]
+                served.add(key)
+        return results, served
+
+    def load_many(self, kind, keys, loader, revalidate=True):
+        # Batch variant: ``loader`` receives the list of keys this caller has
+        # to load and returns a dict of the ones it could load. Keys another
+        # thread is already loading are waited on rather than requested again.
+        # Keys that fail to load, or all of them when ``loader`` raises, fall
+        # back to a stale entry if there is one, otherwise they are left out
+        # of the returned dict. Returns the dict
+        # and the set of keys answered from expired entries.
+        results, stale, missing, led, followed = self._begin_many(kind, keys)
+        reload, served = self._serve_stale_many(kind, results, stale, led, followed, revalidate)
+        if reload:
+            self.background.submit(self._revalidate_many, kind, reload, loader)
+        if led:
+            try:
+                self._loaded_many(kind, led, loader(list(led)), results)
+            except Exception as e:
+                # Recorded for the threads waiting on these keys; this caller
+                # falls back to stale entries below like for any failed key
+                for flight in led.values():
+                    flight.error = e
+            finally:
+                self._end(kind, list(led.items()))
+
+        for key, flight in followed.items():
+            if flight.wait(self.flight_timeout) and flight.error is None and flight.value is not None:
+                results[key] = flight.value
+        return self._end_many(kind, results, stale, missing, served)
+
+    def get_or_load_many(self, kind, keys, loader):
+        return self.load_many(kind, keys, loader)[0]
+
+    async def aload_many(self, kind, keys, loader):
+        results, stale, missing, led, followed = self._begin_many(kind, keys)
+        reload, served = self._serve_stale_many(kind, results, stale, led, followed)
+        if reload:
+            self._spawn(self._arevalidate_many(kind, reload, loader))
+        if led:
+            try:
+                self._loaded_many(kind, led, await loader(list(led)), results)
+            except Exception as e:
+                # Recorded for the threads waiting on these keys; this caller
+                # falls back to stale entries below like for any failed key
+                for flight in led.values():
+                    flight.error = e
+            finally:
+                self._end(kind, list(led.items()))
+
+        for key, flight in followed.items():
+            if await flight.wait_async(self.flight_timeout) and flight.error is None and flight.value is not None:
+                results[key] = flight.value
+        return self._end_many(kind, results, stale, missing, served)
+
+    async def aget_or_load_many(self, kind, keys, loader):
+        return (await self.aload_many(kind, keys, loader))[0]
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = {kind: dict(c) for kind, c in self.counters.items()}
+        for c in counters.values():
+            lookups = c["hits"] + c["misses"] + c["coalesced"]
+            c["hit_ratio"] = round((c["hits"] + c["coalesced"]) / lookups, 4) if lookups else None
+        return {"store": self.backend.stats(), "types": counters}